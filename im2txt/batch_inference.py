@@ -21,7 +21,6 @@ from __future__ import print_function
 
 import os
 import math
-import json
 import time
 import random
 
@@ -29,6 +28,7 @@ import tensorflow as tf
 
 import inference_wrapper
 from inference_utils import caption_generator
+from inference_utils import result_writer
 from inference_utils import vocabulary
 
 FLAGS = tf.flags.FLAGS
@@ -62,7 +62,12 @@ def main(_):
   # Create the vocabulary.
   vocab = vocabulary.Vocabulary(FLAGS.vocab_file)
 
-  results = []
+  # The test reader cannot skip records, so on resume the images already
+  # written are decoded again but not written twice.
+  writer = result_writer.ResultWriter(FLAGS.output,
+                                      flush_every=FLAGS.output_flush_every,
+                                      resume=FLAGS.resume_output,
+                                      compact=FLAGS.compact_output)
 
   gpu_options = tf.GPUOptions(per_process_gpu_memory_fraction=FLAGS.gpu_memory_fraction)
   with tf.Session(graph=g, config=tf.ConfigProto(gpu_options=gpu_options)) as sess:
@@ -76,28 +81,31 @@ def main(_):
     # available beam search parameters.
     generator = caption_generator.CaptionGenerator(model, vocab)
     t_start = time.time()
+    num_images = 0
+    num_batches = 0
     try:
-      i = 0
       while True:
-        if i % 10 == 0:
-            print(i*FLAGS.batch_size)
-        i += 1
-        image_names, final_captions = generator.batched_beam_search(sess)
-        sents = ["".join([vocab.id_to_word(w) for w in captions[0]]) for captions in final_captions]
+        if num_batches % 10 == 0:
+            print(num_images)
+        image_names, predicted_ids = generator.batched_beam_search_ids(sess)
+        num_batches += 1
+        num_images += len(image_names)
+        sents = vocab.decode_batch(predicted_ids[:, 0])
         image_names = image_names.tolist()
         for name, sent in zip(image_names, sents):
           result = {}
           result['image_id'] = name
           result['caption'] = "".join(sent)
-          results.append(result)
-    except Exception as e:
-      print(e)
+          writer.write(result)
+    except tf.errors.OutOfRangeError:
+      # The test reader is exhausted after one epoch.
+      pass
+    generator.log_decode_stats()
   
   t_end = time.time()
+  tf.logging.info("Captioned %d images in %d batches.", num_images, num_batches)
   print("time: %f" %(t_end - t_start))
-  output = open(FLAGS.output, 'w')
-  json.dump(results, output, ensure_ascii=False, indent=4)
-  output.close()
+  writer.close()
 
 if __name__ == "__main__":
   tf.app.run()
@@ -0,0 +1,242 @@
+# Copyright 2016 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+r"""Benchmark the inference speed of the caption models with random weights.
+
+For every model of --benchmark_models (by default all model classes exported
+by im2txt_models), every beam search path of --benchmark_paths and every beam
+width of --benchmark_beam_widths, this script is started again as a worker
+with --model, --support_ingraph and --beam_width set. The worker builds the
+inference graph, initializes the weights randomly and captions synthetic JPEG
+images in batches of each size of --benchmark_batch_sizes:
+
+  * ingraph: the in-graph beam search decoder with a batched image_feed,
+  * outgraph: CaptionGenerator.vectorized_beam_search.
+
+Workers run one after the other, so they do not compete for the machine. Other
+flags are passed to the workers, e.g. --vocab_file, --vocab_size or the flags
+of a model. The results are written to --output as a JSON list with one entry
+per configuration: the images per second, the p50/p95/p99 batch latency in
+milliseconds and the StageTimer stages of the batches. A configuration the
+model does not support, or whose graph fails to build, has a "status" other
+than "ok".
+
+Example:
+
+  python benchmark_inference.py --vocab_file=data/word_counts.txt \
+    --benchmark_models=ShowAndTellModel,ShowAndTellInGraphModel \
+    --output=benchmark.json
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import inspect
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import tensorflow as tf
+
+import im2txt_models
+import inference_wrapper
+from inference_utils import caption_generator
+from inference_utils import stage_timer
+from inference_utils import vocabulary
+
+FLAGS = tf.flags.FLAGS
+
+tf.flags.DEFINE_string("output", "", "The JSON file of the results.")
+tf.flags.DEFINE_string("benchmark_models", "",
+                       "Comma-separated model classes to benchmark. Empty "
+                       "means all models of im2txt_models.")
+tf.flags.DEFINE_string("benchmark_paths", "outgraph,ingraph",
+                       "Comma-separated beam search paths: outgraph and/or "
+                       "ingraph.")
+tf.flags.DEFINE_string("benchmark_batch_sizes", "1,8,32",
+                       "Comma-separated numbers of images per batch.")
+tf.flags.DEFINE_string("benchmark_beam_widths", "1,3,5",
+                       "Comma-separated beam widths.")
+tf.flags.DEFINE_integer("benchmark_warmup_batches", 2,
+                        "Number of untimed batches before each measurement.")
+tf.flags.DEFINE_integer("benchmark_batches", 10,
+                        "Number of timed batches of each measurement.")
+tf.flags.DEFINE_integer("benchmark_image_height", 480,
+                        "Height of the synthetic images.")
+tf.flags.DEFINE_integer("benchmark_image_width", 640,
+                        "Width of the synthetic images.")
+tf.flags.DEFINE_string("benchmark_worker_output", "",
+                       "Set by the parent process: the JSON lines file of a "
+                       "worker.")
+
+tf.logging.set_verbosity(tf.logging.INFO)
+
+_PATHS = ("outgraph", "ingraph")
+
+
+def _int_list(value):
+  return [int(x) for x in value.split(",") if x]
+
+
+def get_model_names():
+  """Returns the model classes exported by im2txt_models."""
+  return sorted(name for name, value in vars(im2txt_models).items()
+                if inspect.isclass(value) and hasattr(value, "create_model"))
+
+
+def make_images(num_images):
+  """Returns num_images distinct random JPEG images."""
+  with tf.Graph().as_default():
+    pixels = tf.placeholder(tf.uint8, shape=[None, None, 3])
+    encoded_image = tf.image.encode_jpeg(pixels)
+    with tf.Session() as sess:
+      rng = np.random.RandomState(0)
+      shape = [FLAGS.benchmark_image_height, FLAGS.benchmark_image_width, 3]
+      return [sess.run(encoded_image,
+                       feed_dict={pixels: rng.randint(0, 256, size=shape)})
+              for _ in range(num_images)]
+
+
+def _result(path, batch_size, status, **kwargs):
+  result = {
+      "model": FLAGS.model,
+      "path": path,
+      "beam_width": FLAGS.beam_width,
+      "batch_size": batch_size,
+      "status": status,
+  }
+  result.update(kwargs)
+  return result
+
+
+def measure(sess, generator, images, batch_size):
+  """Captions batches of images and returns their latency statistics."""
+  batches = [images[(i * batch_size) % len(images):][:batch_size]
+             for i in range(FLAGS.benchmark_warmup_batches +
+                            FLAGS.benchmark_batches)]
+  batches = [batch + images[:batch_size - len(batch)] for batch in batches]
+  for batch in batches[:FLAGS.benchmark_warmup_batches]:
+    generator.beam_search_batch(sess, batch)
+
+  timer = stage_timer.StageTimer()
+  generator.timer = timer
+  for batch in batches[FLAGS.benchmark_warmup_batches:]:
+    with timer.stage("batch"):
+      generator.beam_search_batch(sess, batch)
+  report = timer.report(batch_size * FLAGS.benchmark_batches)
+  generator.timer = stage_timer.StageTimer(enabled=False)
+
+  batch_stats = report["stages"].pop("batch")
+  return {
+      "images_per_second": (batch_size * FLAGS.benchmark_batches /
+                            batch_stats["total_seconds"]),
+      "latency_p50_ms": batch_stats["p50_ms"],
+      "latency_p95_ms": batch_stats["p95_ms"],
+      "latency_p99_ms": batch_stats["p99_ms"],
+      "stages": report["stages"],
+  }
+
+
+def run_worker(path):
+  """Benchmarks the batch sizes of one model, path and beam width."""
+  batch_sizes = _int_list(FLAGS.benchmark_batch_sizes)
+  g = tf.Graph()
+  with g.as_default():
+    model = inference_wrapper.InferenceWrapper()
+    model.build_model()
+    init_ops = [tf.global_variables_initializer(),
+                tf.local_variables_initializer()]
+    if path == "ingraph":
+      supported = model.support_ingraph() and hasattr(model, "predicted_ids")
+    else:
+      supported = any(op.name == "softmax" for op in g.get_operations())
+  g.finalize()
+  if not supported:
+    return [_result(path, batch_size, "unsupported")
+            for batch_size in batch_sizes]
+
+  vocab = vocabulary.Vocabulary(FLAGS.vocab_file)
+  images = make_images(max(batch_sizes))
+  results = []
+  with tf.Session(graph=g) as sess:
+    sess.run(init_ops)
+    generator = caption_generator.CaptionGenerator(
+        model, vocab, beam_size=FLAGS.beam_width,
+        max_caption_length=FLAGS.max_caption_length)
+    for batch_size in batch_sizes:
+      stats = measure(sess, generator, images, batch_size)
+      tf.logging.info("%s %s beam %d batch %d: %.2f images/s", FLAGS.model,
+                      path, FLAGS.beam_width, batch_size,
+                      stats["images_per_second"])
+      results.append(_result(path, batch_size, "ok", **stats))
+  return results
+
+
+def main(_):
+  assert FLAGS.vocab_file, "--vocab_file is required"
+  assert FLAGS.output, "--output is required"
+
+  if FLAGS.benchmark_worker_output:
+    path = "ingraph" if FLAGS.support_ingraph else "outgraph"
+    results = run_worker(path)
+    with open(FLAGS.benchmark_worker_output, "w") as f:
+      for result in results:
+        f.write(json.dumps(result) + "\n")
+    return
+
+  models = ([m for m in FLAGS.benchmark_models.split(",") if m] or
+            get_model_names())
+  paths = [p for p in FLAGS.benchmark_paths.split(",") if p]
+  for path in paths:
+    assert path in _PATHS, "Unknown --benchmark_paths entry: %s" % path
+
+  results = []
+  t_start = time.time()
+  for model_name in models:
+    for path in paths:
+      for beam_width in _int_list(FLAGS.benchmark_beam_widths):
+        fd, worker_output = tempfile.mkstemp(suffix=".jsonl")
+        os.close(fd)
+        args = [sys.executable, os.path.abspath(__file__)] + sys.argv[1:] + [
+            "--model=%s" % model_name,
+            "--support_ingraph=%s" % (path == "ingraph"),
+            "--batched_image_feed=%s" % (path == "ingraph"),
+            "--beam_width=%d" % beam_width,
+            "--benchmark_worker_output=%s" % worker_output]
+        tf.logging.info("Benchmarking %s %s beam %d.", model_name, path,
+                        beam_width)
+        returncode = subprocess.call(args)
+        with open(worker_output) as f:
+          worker_results = [json.loads(line) for line in f]
+        os.remove(worker_output)
+        if returncode != 0 or not worker_results:
+          worker_results = [
+              {"model": model_name, "path": path, "beam_width": beam_width,
+               "batch_size": batch_size, "status": "error"}
+              for batch_size in _int_list(FLAGS.benchmark_batch_sizes)]
+        results.extend(worker_results)
+
+  with open(FLAGS.output, "w") as f:
+    f.write(json.dumps(results, indent=2, sort_keys=True))
+  tf.logging.info("Wrote %d results to %s in %f seconds.", len(results),
+                  FLAGS.output, time.time() - t_start)
+
+
+if __name__ == "__main__":
+  tf.app.run()
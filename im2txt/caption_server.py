@@ -0,0 +1,217 @@
+# Copyright 2016 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+r"""Serve captions over HTTP from a model loaded once.
+
+The checkpoint is restored once at startup. Concurrent requests are gathered
+into micro-batches of at most --max_batch_size images, waiting at most
+--max_batch_wait_ms for a batch to fill, and decoded together.
+
+  POST /caption   The body is an encoded image. Returns a JSON object:
+                  {"captions": [{"caption": ..., "score": ...}, ...],
+                   "timing": {"queue_ms": ..., "batch_ms": ...,
+                              "total_ms": ..., "batch_size": ...}}
+                  with the captions sorted by descending score.
+  GET  /stats     Returns the number of batches and images served.
+
+Listens on --host:--port, or on the Unix socket --unix_socket if set, e.g.
+
+  curl --data-binary @image.jpg http://localhost:8000/caption
+  curl --unix-socket /tmp/caption.sock --data-binary @image.jpg \
+      http://localhost/caption
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+import time
+
+try:
+  from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+  from SocketServer import ThreadingMixIn, UnixStreamServer
+except ImportError:
+  from http.server import BaseHTTPRequestHandler, HTTPServer
+  from socketserver import ThreadingMixIn, UnixStreamServer
+
+import tensorflow as tf
+
+import inference_wrapper
+from inference_utils import caption_generator
+from inference_utils import micro_batcher
+from inference_utils import vocabulary
+
+FLAGS = tf.flags.FLAGS
+
+tf.flags.DEFINE_string("checkpoint_path", "",
+                       "Model checkpoint file or directory containing a "
+                       "model checkpoint file.")
+tf.flags.DEFINE_string("frozen_graph", "",
+                       "Frozen graph written by export_frozen_graph.py, used "
+                       "instead of --checkpoint_path.")
+tf.flags.DEFINE_float("gpu_memory_fraction", 1.0, "Fraction of gpu memory used in inference.")
+tf.flags.DEFINE_string("host", "localhost", "The address the server listens on.")
+tf.flags.DEFINE_integer("port", 8000, "The port the server listens on.")
+tf.flags.DEFINE_string("unix_socket", "",
+                       "If set, listen on this Unix socket instead of "
+                       "--host:--port.")
+tf.flags.DEFINE_integer("max_batch_size", 8,
+                        "Maximum number of images decoded together.")
+tf.flags.DEFINE_float("max_batch_wait_ms", 10.0,
+                      "Maximum time a request waits for its batch to fill.")
+tf.flags.DEFINE_integer("num_captions", 1,
+                        "Number of captions returned per image, at most the "
+                        "beam width.")
+
+tf.logging.set_verbosity(tf.logging.INFO)
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+  daemon_threads = True
+
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+  daemon_threads = True
+
+  def server_bind(self):
+    UnixStreamServer.server_bind(self)
+    # Attributes BaseHTTPRequestHandler expects from HTTPServer.
+    self.server_name = "localhost"
+    self.server_port = 0
+
+
+def make_handler(batcher, vocab, num_captions):
+  """Creates the request handler class of the server.
+
+  Args:
+    batcher: A MicroBatcher mapping encoded images to their lists of
+      (caption, score) pairs.
+    vocab: A Vocabulary object.
+    num_captions: Number of captions returned per image.
+  """
+
+  class CaptionHandler(BaseHTTPRequestHandler):
+    """Handles /caption and /stats requests."""
+
+    def _send_json(self, code, obj):
+      body = json.dumps(obj).encode("utf-8")
+      self.send_response(code)
+      self.send_header("Content-Type", "application/json; charset=utf-8")
+      self.send_header("Content-Length", str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+
+    def do_GET(self):
+      if self.path != "/stats":
+        self._send_json(404, {"error": "unknown path %s" % self.path})
+        return
+      self._send_json(200, {"num_batches": batcher.num_batches,
+                            "num_images": batcher.num_items})
+
+    def do_POST(self):
+      if self.path != "/caption":
+        self._send_json(404, {"error": "unknown path %s" % self.path})
+        return
+      t_start = time.time()
+      length = int(self.headers.get("Content-Length", 0))
+      if length <= 0:
+        self._send_json(400, {"error": "the body must be an encoded image"})
+        return
+      encoded_image = self.rfile.read(length)
+      try:
+        captions, timing = batcher.submit(encoded_image)
+      except tf.errors.InvalidArgumentError as e:
+        # The batcher retries a failed batch image by image, so this is the
+        # image of this request, e.g. a corrupt or non-JPEG upload.
+        self._send_json(400, {"error": "invalid image: %s" % e.message})
+        return
+      except Exception as e:  # pylint: disable=broad-except
+        tf.logging.error("Failed to caption image: %s", e)
+        self._send_json(500, {"error": str(e)})
+        return
+      captions = captions[:num_captions]
+      sentences = vocab.decode_batch([caption for caption, _ in captions])
+      result = {}
+      result["captions"] = [{"caption": sentence, "score": float(score)}
+                            for sentence, (_, score) in zip(sentences, captions)]
+      result["timing"] = {
+          "queue_ms": timing["queue_seconds"] * 1000.0,
+          "batch_ms": timing["batch_seconds"] * 1000.0,
+          "total_ms": (time.time() - t_start) * 1000.0,
+          "batch_size": timing["batch_size"]}
+      self._send_json(200, result)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+      tf.logging.debug(format, *args)
+
+  return CaptionHandler
+
+
+def main(_):
+  assert FLAGS.checkpoint_path or FLAGS.frozen_graph, \
+      "--checkpoint_path or --frozen_graph is required"
+  assert FLAGS.vocab_file, "--vocab_file is required"
+
+  # Build the inference graph.
+  g = tf.Graph()
+  with g.as_default():
+    model = inference_wrapper.InferenceWrapper()
+    if FLAGS.frozen_graph:
+      restore_fn = model.build_graph_from_frozen(FLAGS.frozen_graph)
+    else:
+      restore_fn = model.build_graph(FLAGS.checkpoint_path)
+  g.finalize()
+
+  # Create the vocabulary.
+  vocab = vocabulary.Vocabulary(FLAGS.vocab_file)
+
+  gpu_options = tf.GPUOptions(per_process_gpu_memory_fraction=FLAGS.gpu_memory_fraction)
+  with tf.Session(graph=g, config=tf.ConfigProto(gpu_options=gpu_options)) as sess:
+    # Load the model from checkpoint.
+    restore_fn(sess)
+
+    generator = caption_generator.CaptionGenerator(model, vocab)
+    # The session is only used from the batcher thread.
+    batcher = micro_batcher.MicroBatcher(
+        lambda images: generator.beam_search_batch(sess, images,
+                                                   with_scores=True),
+        max_batch_size=FLAGS.max_batch_size,
+        max_wait_seconds=FLAGS.max_batch_wait_ms / 1000.0)
+
+    handler = make_handler(batcher, vocab, FLAGS.num_captions)
+    if FLAGS.unix_socket:
+      if os.path.exists(FLAGS.unix_socket):
+        os.remove(FLAGS.unix_socket)
+      server = ThreadingUnixHTTPServer(FLAGS.unix_socket, handler)
+      tf.logging.info("Serving captions on unix socket %s", FLAGS.unix_socket)
+    else:
+      server = ThreadingHTTPServer((FLAGS.host, FLAGS.port), handler)
+      tf.logging.info("Serving captions on http://%s:%d", FLAGS.host,
+                      FLAGS.port)
+    try:
+      server.serve_forever()
+    except KeyboardInterrupt:
+      pass
+    finally:
+      server.server_close()
+      batcher.close()
+      tf.logging.info("Served %d images in %d batches.", batcher.num_items,
+                      batcher.num_batches)
+      generator.log_decode_stats()
+
+
+if __name__ == "__main__":
+  tf.app.run()
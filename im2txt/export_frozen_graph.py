@@ -0,0 +1,224 @@
+# Copyright 2016 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+r"""Export the inference graph of a model as a single frozen graph file.
+
+Builds the inference graph of --model with the same flags as inference.py,
+restores --checkpoint_path and writes a MetaGraphDef to --output_graph where:
+
+  * the model variables are constants, so there is no checkpoint to restore,
+  * only the nodes the inference outputs depend on are kept, which drops the
+    summaries, the saver and the training ops,
+  * --graph_transforms are applied, by default constant folding and folding of
+    batch norms into the preceding convolutions.
+
+With --quantize, the weights (the Inception convolutions, the image_embedding
+projection, the embedding map, the output_layer and the LSTM) are stored as
+int8 and the convolutions of the image model run in eight bits. The ranges of
+their requantized outputs are calibrated on --num_calibration_images images of
+--calibration_file_pattern; without calibration images they are computed at
+run time, which is slower. Compare the captions of the float and quantized
+graphs with tools/eval/compare_evaluations.py, see quantized-eval.sh.
+
+The local variables keeping the decoder state in the session (see
+im2txt_models/decoder_state.py) stay variables. The collections the
+InferenceWrapper needs are exported with the graph, so the inference scripts
+load it with --frozen_graph instead of --checkpoint_path.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import tempfile
+import time
+
+import tensorflow as tf
+from tensorflow.tools.graph_transforms import TransformGraph
+
+import inference_wrapper
+
+FLAGS = tf.flags.FLAGS
+
+tf.flags.DEFINE_string("checkpoint_path", "",
+                       "Model checkpoint file or directory containing a "
+                       "model checkpoint file.")
+tf.flags.DEFINE_string("output_graph", "", "The frozen graph file to write.")
+tf.flags.DEFINE_string("graph_transforms",
+                       "fold_constants(ignore_errors=true) fold_batch_norms "
+                       "fold_old_batch_norms",
+                       "Space-separated graph transforms applied to the "
+                       "frozen graph, see tensorflow/tools/graph_transforms.")
+tf.flags.DEFINE_boolean("quantize", False,
+                        "Whether to export int8 weights and eight-bit image "
+                        "model convolutions.")
+tf.flags.DEFINE_string("calibration_file_pattern", "",
+                       "The pattern of the images calibrating the quantized "
+                       "ranges, e.g. validation images.")
+tf.flags.DEFINE_integer("num_calibration_images", 100,
+                        "Number of images used for calibration.")
+
+tf.logging.set_verbosity(tf.logging.INFO)
+
+
+def _op_name(item):
+  """Returns the op name of an op or tensor of a collection."""
+  return item.op.name if isinstance(item, tf.Tensor) else item.name
+
+
+def get_output_nodes(collections):
+  """Returns the names of the ops inference runs, which the export keeps."""
+  names = set()
+  for collection in collections:
+    for item in tf.get_collection(collection):
+      if isinstance(item, (tf.Tensor, tf.Operation)):
+        names.add(_op_name(item))
+  # The ops the out-of-graph decoder fetches by name.
+  for name in ["lstm/initial_state", "lstm/state", "softmax"]:
+    try:
+      tf.get_default_graph().get_operation_by_name(name)
+      names.add(name)
+    except KeyError:
+      pass
+  return sorted(names)
+
+
+def get_input_nodes(graph_def):
+  return [node.name for node in graph_def.node
+          if node.op in ("Placeholder", "PlaceholderWithDefault")]
+
+
+# Ops of the image model run in eight bits. The ops of the decoder loop keep
+# float32 compute on dequantized weights.
+_QUANTIZED_OPS = ["Conv2D", "BiasAdd", "Relu", "MaxPool", "AvgPool"]
+
+
+def _read_image(filename):
+  with tf.gfile.GFile(filename, "r") as f:
+    return f.read()
+
+
+def calibrate(graph_def, input_nodes, output_nodes, calibration_fetch,
+              batched_image_feed, files):
+  """Runs images through a quantized graph and logs its requantization ranges.
+
+  Args:
+    graph_def: A GraphDef after the quantize_nodes transform.
+    input_nodes: Names of the input nodes.
+    output_nodes: Names of the output nodes.
+    calibration_fetch: Name of a tensor computed from "image_feed".
+    batched_image_feed: Whether "image_feed" takes a batch of images.
+    files: The calibration images.
+
+  Returns:
+    The name of the file with the logged ranges, as expected by the
+    freeze_requantization_ranges transform.
+  """
+  logged_graph_def = TransformGraph(
+      graph_def, input_nodes, output_nodes,
+      ['insert_logging(op=RequantizationRange, show_name=true, '
+       'message="__requant_min_max:")'])
+  fd, log_file = tempfile.mkstemp(suffix=".log")
+  with tf.Graph().as_default():
+    tf.import_graph_def(logged_graph_def, name="")
+    with tf.Session() as sess:
+      # The Print ops of insert_logging write to stderr.
+      stderr = os.dup(2)
+      os.dup2(fd, 2)
+      try:
+        for filename in files:
+          encoded_image = _read_image(filename)
+          sess.run(calibration_fetch, feed_dict={
+              "image_feed:0": ([encoded_image] if batched_image_feed
+                               else encoded_image)})
+      finally:
+        os.dup2(stderr, 2)
+        os.close(stderr)
+        os.close(fd)
+  tf.logging.info("Calibrated on %d images.", len(files))
+  return log_file
+
+
+def quantize(graph_def, input_nodes, output_nodes, model):
+  """Stores the weights as int8 and runs the image model in eight bits."""
+  graph_def = TransformGraph(
+      graph_def, input_nodes, output_nodes,
+      ["quantize_weights",
+       "quantize_nodes(%s)" % ", ".join("op=%s" % op for op in _QUANTIZED_OPS)])
+  files = sorted(tf.gfile.Glob(FLAGS.calibration_file_pattern)
+                 if FLAGS.calibration_file_pattern else [])
+  files = files[:FLAGS.num_calibration_images]
+  if not files:
+    tf.logging.warning("No calibration images, the quantized ranges are "
+                       "computed at run time.")
+    return graph_def
+
+  if model.support_ingraph():
+    calibration_fetch = model.predicted_ids.name
+  else:
+    calibration_fetch = "lstm/initial_state:0"
+  log_file = calibrate(graph_def, input_nodes, output_nodes, calibration_fetch,
+                       model.support_batched_image_feed(), files)
+  graph_def = TransformGraph(
+      graph_def, input_nodes, output_nodes,
+      ['freeze_requantization_ranges(min_max_log_file="%s")' % log_file])
+  os.remove(log_file)
+  return graph_def
+
+
+def main(_):
+  assert FLAGS.checkpoint_path, "--checkpoint_path is required"
+  assert FLAGS.output_graph, "--output_graph is required"
+
+  g = tf.Graph()
+  with g.as_default():
+    model = inference_wrapper.InferenceWrapper()
+    restore_fn = model.build_graph(FLAGS.checkpoint_path)
+    collections = model.add_frozen_collections()
+    output_nodes = get_output_nodes(collections)
+    local_variables = [v.op.name for v in tf.local_variables()]
+
+    with tf.Session() as sess:
+      restore_fn(sess)
+      graph_def = tf.graph_util.convert_variables_to_constants(
+          sess, g.as_graph_def(), output_nodes,
+          variable_names_blacklist=local_variables)
+    num_nodes = len(g.as_graph_def().node)
+
+    input_nodes = get_input_nodes(graph_def)
+    if FLAGS.graph_transforms:
+      graph_def = TransformGraph(graph_def, input_nodes, output_nodes,
+                                 FLAGS.graph_transforms.split())
+    if FLAGS.quantize:
+      graph_def = quantize(graph_def, input_nodes, output_nodes, model)
+
+    tf.train.export_meta_graph(filename=FLAGS.output_graph,
+                               graph_def=graph_def,
+                               collection_list=collections,
+                               clear_devices=True)
+  tf.logging.info("Wrote %s with %d of the %d nodes of the inference graph.",
+                  FLAGS.output_graph, len(graph_def.node), num_nodes)
+
+  # Check the export and report its load time.
+  t_start = time.time()
+  with tf.Graph().as_default():
+    inference_wrapper.InferenceWrapper().build_graph_from_frozen(
+        FLAGS.output_graph)
+  tf.logging.info("Loaded the frozen graph in %f seconds.",
+                  time.time() - t_start)
+
+
+if __name__ == "__main__":
+  tf.app.run()
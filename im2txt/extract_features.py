@@ -0,0 +1,113 @@
+# Copyright 2016 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+r"""Precompute the image model outputs of a set of images into a FeatureStore.
+
+In inference mode the Inception weights are not trainable, so unless Inception
+was fine-tuned its outputs are the same for every caption model checkpoint.
+The stored features are decoded with inference_from_features.py, which only
+runs the caption model. Set the same image model flags (--model,
+--inception_return_tuple, --use_box, --yet_another_inception, ...) as for
+inference.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+
+import tensorflow as tf
+
+import im2txt_model
+from inference_utils import feature_store
+from inference_utils import image_prefetcher
+
+FLAGS = tf.flags.FLAGS
+
+tf.flags.DEFINE_string("checkpoint_path", "",
+                       "Checkpoint file containing the image model variables, "
+                       "a caption model checkpoint or an Inception checkpoint.")
+tf.flags.DEFINE_string("input_file_pattern", "", "The pattern of images.")
+tf.flags.DEFINE_string("feature_dir", "", "Directory of the feature store to write.")
+tf.flags.DEFINE_string("feature_dtype", "float32",
+                       "Numpy dtype of the stored features, e.g. float16 to halve "
+                       "the store size.")
+tf.flags.DEFINE_float("gpu_memory_fraction", 1.0, "Fraction of gpu memory used in inference.")
+tf.flags.DEFINE_integer("batch_size", 16, "Number of images processed per run.")
+
+tf.logging.set_verbosity(tf.logging.INFO)
+
+
+def _get_image_id(filename):
+  image_id = filename.split('.')[0]
+  if "/" in image_id:
+    image_id = image_id.split("/")[-1]
+  return image_id
+
+
+def main(_):
+  assert FLAGS.checkpoint_path, "--checkpoint_path is required"
+  assert FLAGS.input_file_pattern , "--input_file_pattern is required"
+  assert FLAGS.feature_dir, "--feature_dir is required"
+
+  # Build the image model only, with a batched image feed.
+  g = tf.Graph()
+  with g.as_default():
+    model = im2txt_model.Im2TxtModel(mode="inference", batched_image_feed=True)
+    model.build_image_model()
+    outputs = model.image_model_output
+    if not isinstance(outputs, tuple):
+      outputs = (outputs,)
+    variables = list(model.inception_variables)
+    # ya_inception_variables is a dict only with --yet_another_inception.
+    if isinstance(model.ya_inception_variables, dict):
+      variables += list(model.ya_inception_variables.values())
+    saver = tf.train.Saver(variables)
+  g.finalize()
+
+  feature_shapes = [output.get_shape().as_list()[1:] for output in outputs]
+  tf.logging.info("Image model output shapes: %s", feature_shapes)
+
+  files = tf.gfile.Glob(FLAGS.input_file_pattern)
+  writer = feature_store.FeatureStoreWriter(FLAGS.feature_dir,
+                                            [_get_image_id(f) for f in files],
+                                            feature_shapes,
+                                            dtype=FLAGS.feature_dtype)
+
+  gpu_options = tf.GPUOptions(per_process_gpu_memory_fraction=FLAGS.gpu_memory_fraction)
+  with tf.Session(graph=g, config=tf.ConfigProto(gpu_options=gpu_options)) as sess:
+    tf.logging.info("Loading image model from checkpoint: %s", FLAGS.checkpoint_path)
+    saver.restore(sess, FLAGS.checkpoint_path)
+
+    t_start = time.time()
+    prefetcher = image_prefetcher.ImagePrefetcher(
+        files,
+        num_threads=FLAGS.num_read_threads,
+        queue_depth=FLAGS.prefetch_queue_depth)
+    start = 0
+    for batch_files, images in prefetcher.batches(FLAGS.batch_size):
+      if start % 1000 < len(batch_files):
+          print(start)
+      features = sess.run(list(outputs), feed_dict={"image_feed:0": images})
+      writer.write(start, features)
+      start += len(batch_files)
+    prefetcher.close()
+
+  writer.close()
+  t_end = time.time()
+  print("time: %f" %(t_end - t_start))
+
+if __name__ == "__main__":
+  tf.app.run()
@@ -52,7 +52,11 @@ tf.flags.DEFINE_boolean("cropping_images", True,
                        "If you use the localization data, turn it off")
 
 tf.flags.DEFINE_string("image_format", "jpeg",
-                        "Image format: jpeg or png.")
+                        "Image format: jpeg, png or raw. raw is for records built "
+                        "with --stored_image_format=raw, not for image files.")
+tf.flags.DEFINE_integer("raw_image_size", 346,
+                        "Height and width of the uint8 pixels of raw images, the "
+                        "--stored_image_size of the TFRecord builder.")
 tf.flags.DEFINE_integer("values_per_input_shard", 2300,
                         "Approximate number of values per input shard. Used to ensure sufficient"
                         " mixing between shards in training..")
@@ -67,7 +71,29 @@ tf.flags.DEFINE_string("caption_feature_name", "image/caption_ids",
 tf.flags.DEFINE_string("flip_caption_feature_name", "image/flip_caption_ids",
                         "Name of the SequenceExample feature list containing integer flip captions.")
 tf.flags.DEFINE_integer("num_preprocess_threads", 4,
-                        "Number of threads for image preprocessing. Should be a multiple of 2.")
+                        "Number of threads for image preprocessing. With the queue "
+                        "input pipeline it should be a multiple of 2.")
+tf.flags.DEFINE_string("input_pipeline", "queue",
+                        "How training examples are read: queue (queue runners) or "
+                        "dataset (tf.data).")
+tf.flags.DEFINE_integer("num_parallel_reads", 4,
+                        "Number of input files read in parallel by the tf.data input "
+                        "pipeline.")
+tf.flags.DEFINE_string("caption_layout", "single",
+                        "Captions of the training SequenceExamples: single (one "
+                        "caption per record), or all the captions of the image in "
+                        "one record, see build_tfrecords.py --image_once. Such "
+                        "records are used whole with all (each visit of a record "
+                        "yields all its captions, --input_pipeline=dataset only) or "
+                        "with sample (each visit yields one of its captions at "
+                        "random).")
+tf.flags.DEFINE_string("caption_length_buckets", "",
+                        "Comma-separated caption length boundaries, e.g. 10,13,16. "
+                        "If set, the tf.data input pipeline batches captions of "
+                        "similar lengths together.")
+tf.flags.DEFINE_integer("dataset_prefetch_batches", 2,
+                        "Number of batches the tf.data input pipeline prepares ahead "
+                        "of the model.")
 tf.flags.DEFINE_integer("image_height", 299,
                         "Dimensions of Inception v3 input images.")
 tf.flags.DEFINE_integer("image_width", 299,
@@ -79,6 +105,12 @@ tf.flags.DEFINE_float("initializer_scale", 0.08,
 tf.flags.DEFINE_boolean("support_ingraph", False,
                         "Whether the model supports in-graph inference. If the model supports it, "
                         "the output of the model should contains key 'bs_result'")
+tf.flags.DEFINE_boolean("batched_image_feed", False,
+                        "In inference mode, feed a 1-D batch of encoded images through "
+                        "'image_feed' instead of a single one. Only for in-graph models.")
+tf.flags.DEFINE_integer("image_decode_parallelism", 8,
+                        "Number of images of a batched image_feed, or of a batch of "
+                        "the ImageCaptionTestReader, decoded in parallel.")
 tf.flags.DEFINE_boolean("support_flip", False,
                         "Whether the model supports flip image. If the model supports it, "
                         "the SequenceExample should contains feature key 'image/flip_caption_ids'")
@@ -148,11 +180,18 @@ def pad_or_truncate(tensor, lengths, axis, max_length):
 class Im2TxtModel(object):
   """Image-to-text implementation"""
 
-  def __init__(self, mode):
+  def __init__(self, mode, batched_image_feed=None, image_feature_shapes=None):
     """Basic setup.
 
     Args:
       mode: "train", "eval" or "inference".
+      batched_image_feed: Whether image_feed takes a batch of encoded images
+        in inference mode. Defaults to --batched_image_feed for in-graph
+        models.
+      image_feature_shapes: If not None, a list of per-image shapes of the
+        image model outputs. In inference mode the image model is then
+        skipped and its outputs are fed through the placeholders
+        "image_feature_feed_<i>", e.g. from a FeatureStore.
     """
     assert mode in ["train", "inference"]
     self.mode = mode
@@ -203,6 +242,14 @@ class Im2TxtModel(object):
     # In-graph inference support
     self.support_ingraph = FLAGS.support_ingraph
 
+    # Whether image_feed takes a batch of encoded images (in-graph only).
+    if batched_image_feed is None:
+      batched_image_feed = FLAGS.support_ingraph and FLAGS.batched_image_feed
+    self.batched_image_feed = mode == "inference" and batched_image_feed
+
+    # Shapes of the image features fed instead of images in inference mode.
+    self.image_feature_shapes = image_feature_shapes
+
   def is_training(self):
     """Returns true if the model is built for training mode."""
     return self.mode == "train"
@@ -219,13 +266,29 @@ class Im2TxtModel(object):
     if FLAGS.reader == "OriginalReader":
       if self.mode == "inference":
         # In inference mode, images and inputs are fed via placeholders.
-        image_feed = tf.placeholder(dtype=tf.string, shape=[], name="image_feed")
+        if self.batched_image_feed:
+          image_feed = tf.placeholder(dtype=tf.string, shape=[None], name="image_feed")
+        else:
+          image_feed = tf.placeholder(dtype=tf.string, shape=[], name="image_feed")
         input_feed = tf.placeholder(dtype=tf.int64,
                                     shape=[None],  # batch_size
                                     name="input_feed")
 
-        # Process image and insert batch dimensions.
-        images = tf.expand_dims(simple_process_image(image_feed), 0)
+        if self.image_feature_shapes is not None:
+          # Image features are fed directly, see get_image_output().
+          images = None
+        elif self.batched_image_feed:
+          # Decode and process the images of the batch in parallel. A nonzero
+          # even thread_id keeps the color ordering of thread 0 but does not
+          # create image summaries inside the loop.
+          images = tf.map_fn(lambda x: simple_process_image(x, thread_id=2),
+                             image_feed,
+                             dtype=tf.float32,
+                             parallel_iterations=FLAGS.image_decode_parallelism,
+                             back_prop=False)
+        else:
+          # Process image and insert batch dimensions.
+          images = tf.expand_dims(simple_process_image(image_feed), 0)
         input_seqs = tf.expand_dims(input_feed, 1)
 
         # No target sequences or input mask in inference mode.
@@ -252,18 +315,20 @@ class Im2TxtModel(object):
       else:
         images, input_seqs, target_seqs, input_mask, target_lengths = cols
     elif FLAGS.reader == "ImageCaptionTestReader":
-      reader = readers.ImageCaptionTestReader()
-      cols = readers.get_test_input_data_tensors(reader,
+      reader = readers.ImageCaptionTestReader(
+          num_decode_threads=FLAGS.image_decode_parallelism)
+      cols, image_valid = readers.get_test_input_data_tensors(reader,
                                     data_pattern=FLAGS.input_file_pattern,
                                     batch_size=FLAGS.batch_size,
                                     num_epochs=1,
-                                    num_readers=1)
+                                    num_readers=FLAGS.num_test_readers)
       if FLAGS.localization_attention:
         images, image_names, localizations = cols
         self.localizations = localizations
       else:
         images, image_names = cols
       self.image_names = image_names
+      self.image_valid = image_valid
       target_seqs = None
       input_mask = None
       input_seqs = None
@@ -284,6 +349,15 @@ class Im2TxtModel(object):
     Outputs:
       self.image_embeddings
     """
+    if self.mode == "inference" and self.image_feature_shapes is not None:
+      # Skip the image model, its outputs are fed from precomputed features.
+      feeds = tuple(tf.placeholder(dtype=tf.float32,
+                                   shape=[None] + list(shape),
+                                   name="image_feature_feed_%d" % i)
+                    for i, shape in enumerate(self.image_feature_shapes))
+      self.image_model_output = feeds[0] if len(feeds) == 1 else feeds
+      return
+
     if self.mode == "inference":
       trainable = False
     else:
@@ -358,6 +432,10 @@ class Im2TxtModel(object):
         self.scores = outputs["bs_results"].beam_search_decoder_output.scores
         if "bs_results_lengths" in outputs:
           self.predicted_ids_lengths = outputs["bs_results_lengths"]
+        # The decoder loop exits once all beams are finished.
+        self.decode_steps_saved = tf.subtract(
+            FLAGS.max_caption_length, tf.shape(self.predicted_ids)[1],
+            name="decode_steps_saved")
       if "top_n_attributes" in outputs:
         self.top_n_attributes = outputs["top_n_attributes"]
     else:
@@ -520,6 +598,16 @@ class Im2TxtModel(object):
 
       self.init_fn = restore_fn
 
+  def build_image_model(self):
+    """Creates only the image inputs and the image model, e.g. for extracting
+    image features.
+
+    Outputs:
+      self.image_model_output
+    """
+    self.build_inputs()
+    self.get_image_output()
+
   def setup_global_step(self):
     """Sets up the global step Tensor."""
     global_step = tf.Variable(
@@ -13,6 +13,31 @@ tf.flags.DEFINE_integer("beam_width", 3,
                         "The beam width")
 tf.flags.DEFINE_integer("max_caption_length", 20,
                         "The max caption length for beam search decoding")
+tf.flags.DEFINE_float("length_penalty_weight", 0.0,
+                        "The length penalty weight of in-graph beam search decoding.")
+tf.flags.DEFINE_boolean("beam_search_early_stopping", False,
+                        "Whether in-graph beam search stops an image once its best "
+                        "finished caption beats all live beams.")
+tf.flags.DEFINE_float("beam_search_early_stopping_threshold", 0.0,
+                        "The score margin by which the best finished caption must "
+                        "beat the live beams to stop early.")
+tf.flags.DEFINE_integer("beam_search_num_groups", 1,
+                        "The number of groups of diverse in-graph beam search, "
+                        "beam_width must be a multiple of it.")
+tf.flags.DEFINE_float("beam_search_diversity_penalty", 0.0,
+                        "The penalty of diverse beam search for a word chosen by "
+                        "a previous group.")
+tf.flags.DEFINE_boolean("beam_search_skip_finished", True,
+                        "Whether in-graph beam search skips the output projection "
+                        "(and if possible the cell) of finished beams.")
+tf.flags.DEFINE_string("output_shortlist", "",
+                        "If set, in-graph beam search only scores a shortlist of "
+                        "words per image: word_predictions (the most likely words "
+                        "of the word prediction head) or frequency (the most "
+                        "frequent words of --vocab_file).")
+tf.flags.DEFINE_integer("output_shortlist_size", 1000,
+                        "The number of words of --output_shortlist, including "
+                        "the end token.")
 
 # flags for advanced model
 tf.flags.DEFINE_boolean("use_scheduled_sampling", False,
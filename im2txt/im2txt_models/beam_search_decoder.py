@@ -0,0 +1,395 @@
+"""In-graph beam search decoder with early stopping and diverse beam search.
+
+BeamSearchDecoder extends tf.contrib.seq2seq.BeamSearchDecoder with:
+
+  * length_penalty_weight: the GNMT length penalty of the contrib decoder.
+  * early_stopping: a batch entry is finished as soon as its best finished
+    caption scores at least early_stopping_threshold above all of its live
+    beams. Without length penalty and with a threshold of 0, the live beams
+    can no longer beat it, so the best caption is exactly the one of the full
+    search. dynamic_decode stops when all entries are finished, instead of
+    running until every beam has produced the end token.
+  * num_groups, diversity_penalty: diverse beam search
+    (https://arxiv.org/abs/1610.02424). The beam is split into num_groups
+    groups of beam_width / num_groups beams, searched one after the other at
+    each step. A group selects its words with a penalty of diversity_penalty
+    per time the word was chosen by the previous groups at this step. The end
+    token is not penalized, so finished captions are kept. The penalty only
+    affects the selection, the scores are the plain ones. The beams are
+    ordered by group, so beam 0 is the best of the first group. At the first
+    step all groups start from beam 0.
+
+  * skip_finished: the output projection (and, for cells without tiled
+    memory, the cell) only runs on the beams that are not finished. Finished
+    beams can only produce the end token, so the results are unchanged.
+  * shortlist: the output projection and the search only cover a shortlist of
+    word ids per image, e.g. its most likely words according to the word
+    prediction head, or the most frequent words. The first shortlist entry
+    must be the end token. The kernel and bias of the output layer are
+    gathered for the shortlist, so no new variables are created, and the
+    predicted ids are mapped back to word ids.
+
+dynamic_decode exits its loop as soon as all beams of the batch are finished.
+
+Arguments left to None take the values of the flags --length_penalty_weight,
+--beam_search_early_stopping, --beam_search_early_stopping_threshold,
+--beam_search_num_groups, --beam_search_diversity_penalty and
+--beam_search_skip_finished.
+"""
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.contrib.seq2seq.python.ops import beam_search_decoder as bsd
+from tensorflow.python.framework import tensor_util
+from tensorflow.python.util import nest
+from inference_utils import binary_vocab
+
+FLAGS = tf.app.flags.FLAGS
+
+
+def _get_or_flag(value, flag_value):
+  return flag_value if value is None else value
+
+
+def frequency_order(vocab_file):
+  """Returns the word ids of a vocabulary file, most frequent first.
+
+  Words without a count keep their order after the counted ones.
+  """
+  _, counts = binary_vocab.load_words(vocab_file)
+  return sorted(range(len(counts)), key=lambda word_id: -counts[word_id])
+
+
+def output_shortlist(batch_size, word_predictions=None):
+  """Builds the shortlist of --output_shortlist for in-graph decoding.
+
+  Args:
+    batch_size: The number of images.
+    word_predictions: The [batch_size, vocab_size] word prediction head of the
+      model, if any.
+
+  Returns:
+    None if --output_shortlist is not set, otherwise an int32 tensor of shape
+    [batch_size, output_shortlist_size]: the end token followed by the most
+    likely (word_predictions) or most frequent (frequency) other words.
+  """
+  if not FLAGS.output_shortlist:
+    return None
+  num_words = FLAGS.output_shortlist_size - 1
+  special = [FLAGS.end_token, FLAGS.start_token]
+  end_tokens = tf.fill([batch_size, 1], FLAGS.end_token)
+  if FLAGS.output_shortlist == "frequency":
+    if not FLAGS.vocab_file:
+      raise ValueError("--output_shortlist=frequency requires --vocab_file")
+    word_ids = [word_id for word_id in frequency_order(FLAGS.vocab_file)
+                if word_id < FLAGS.vocab_size and word_id not in special]
+    word_ids = tf.tile(tf.constant([word_ids[:num_words]], dtype=tf.int32),
+                       [batch_size, 1])
+  elif FLAGS.output_shortlist == "word_predictions":
+    if word_predictions is None:
+      raise ValueError("--output_shortlist=word_predictions requires a model "
+                       "with a word prediction head, "
+                       "e.g. --predict_words_via_image_output")
+    # Predictions are in [0, 1], so this excludes the special tokens.
+    special_mask = tf.reduce_sum(tf.one_hot(special, FLAGS.vocab_size), axis=0)
+    _, word_ids = tf.nn.top_k(word_predictions - 2.0 * special_mask,
+                              k=num_words)
+  else:
+    raise ValueError("Unknown output_shortlist: %s" % FLAGS.output_shortlist)
+  return tf.concat([end_tokens, word_ids], axis=1)
+
+
+class BeamSearchDecoder(tf.contrib.seq2seq.BeamSearchDecoder):
+  """BeamSearchDecoder with early stopping, diverse beam search and skipping
+  of finished beams."""
+
+  def __init__(self,
+               cell,
+               embedding,
+               start_tokens,
+               end_token,
+               initial_state,
+               beam_width,
+               output_layer=None,
+               length_penalty_weight=None,
+               early_stopping=None,
+               early_stopping_threshold=None,
+               num_groups=None,
+               diversity_penalty=None,
+               skip_finished=None,
+               row_wise_cell=None,
+               shortlist=None):
+    """Initializes the decoder, see tf.contrib.seq2seq.BeamSearchDecoder.
+
+    Args:
+      row_wise_cell: Whether the cell computes each row of the batch on its
+        own, so that it can be run on the unfinished beams only. Defaults to
+        False for an AttentionWrapper, whose memory is tiled over all beams,
+        and True otherwise. Cells holding such memory themselves must pass
+        False.
+      shortlist: Optional int32 tensor of shape [batch_size, shortlist_size],
+        the word ids each image is decoded with, starting with end_token, e.g.
+        from output_shortlist(). Requires an output_layer.
+    """
+    self._shortlist = shortlist
+    if shortlist is not None:
+      if output_layer is None:
+        raise ValueError("A shortlist requires an output_layer")
+      # The search runs over shortlist positions, where the end token is 0.
+      end_token = 0
+      self._shortlist_size = (shortlist.shape[1].value or
+                              tf.shape(shortlist)[1])
+    super(BeamSearchDecoder, self).__init__(
+        cell=cell,
+        embedding=embedding,
+        start_tokens=start_tokens,
+        end_token=end_token,
+        initial_state=initial_state,
+        beam_width=beam_width,
+        output_layer=output_layer,
+        length_penalty_weight=_get_or_flag(length_penalty_weight,
+                                           FLAGS.length_penalty_weight))
+    self._early_stopping = _get_or_flag(early_stopping,
+                                        FLAGS.beam_search_early_stopping)
+    self._early_stopping_threshold = _get_or_flag(
+        early_stopping_threshold, FLAGS.beam_search_early_stopping_threshold)
+    self._num_groups = _get_or_flag(num_groups, FLAGS.beam_search_num_groups)
+    self._diversity_penalty = _get_or_flag(diversity_penalty,
+                                           FLAGS.beam_search_diversity_penalty)
+    self._skip_finished = _get_or_flag(skip_finished,
+                                       FLAGS.beam_search_skip_finished)
+    self._row_wise_cell = _get_or_flag(
+        row_wise_cell,
+        not isinstance(cell, tf.contrib.seq2seq.AttentionWrapper))
+    if self._num_groups < 1 or beam_width % self._num_groups != 0:
+      raise ValueError("beam_width (%d) must be a multiple of num_groups (%d)"
+                       % (beam_width, self._num_groups))
+
+  def step(self, time, inputs, state, name=None):
+    with tf.name_scope(name, "BeamSearchDecoderStep", (time, inputs, state)):
+      logits, next_cell_state = self._run_cell(inputs, state)
+      if self._num_groups == 1:
+        kwargs = {}
+        if hasattr(self, "_coverage_penalty_weight"):
+          kwargs["coverage_penalty_weight"] = self._coverage_penalty_weight
+        output, next_state = bsd._beam_search_step(
+            time=time,
+            logits=logits,
+            next_cell_state=next_cell_state,
+            beam_state=state,
+            batch_size=self._batch_size,
+            beam_width=self._beam_width,
+            end_token=self._end_token,
+            length_penalty_weight=self._length_penalty_weight,
+            **kwargs)
+      else:
+        output, next_state = self._diverse_beam_search_step(
+            time, logits, next_cell_state, state)
+
+      if self._early_stopping:
+        next_state = self._stop_early(output, next_state)
+
+      finished = next_state.finished
+      next_inputs = tf.cond(
+          tf.reduce_all(finished), lambda: self._start_inputs,
+          lambda: self._embedding_fn(self._to_word_ids(output.predicted_ids)))
+
+    return (output, next_state, next_inputs, finished)
+
+  def finalize(self, outputs, final_state, sequence_lengths):
+    outputs, final_state = super(BeamSearchDecoder, self).finalize(
+        outputs, final_state, sequence_lengths)
+    if self._shortlist is not None:
+      outputs = outputs._replace(
+          predicted_ids=self._to_word_ids(outputs.predicted_ids))
+    return outputs, final_state
+
+  def _to_word_ids(self, ids):
+    """Maps shortlist positions of shape [batch_size, ...] to word ids.
+
+    Negative ids (padding) are kept.
+    """
+    if self._shortlist is None:
+      return ids
+    offsets = tf.range(self._batch_size) * self._shortlist_size
+    offsets = tf.reshape(offsets, [-1] + [1] * (ids.shape.ndims - 1))
+    word_ids = tf.gather(tf.reshape(self._shortlist, [-1]),
+                         tf.maximum(ids, 0) + offsets)
+    return tf.where(ids >= 0, word_ids, ids)
+
+  def _shortlist_logits(self, cell_outputs):
+    """Projects the cell outputs of all beams onto the shortlist.
+
+    Args:
+      cell_outputs: [batch_size * beam_width, num_units].
+
+    Returns:
+      The logits, [batch_size * beam_width, shortlist_size].
+    """
+    if not self._output_layer.built:
+      # Creates the variables under the scope the full projection would use.
+      self._output_layer(cell_outputs[:0])
+    # [batch_size, num_units, shortlist_size]
+    kernel = tf.transpose(
+        tf.gather(self._output_layer.kernel, self._shortlist, axis=1),
+        [1, 0, 2])
+    bias = tf.gather(self._output_layer.bias, self._shortlist)
+    cell_outputs = tf.reshape(cell_outputs,
+                              [self._batch_size, self._beam_width, -1])
+    logits = tf.matmul(cell_outputs, kernel) + tf.expand_dims(bias, 1)
+    logits = tf.reshape(logits, [self._batch_size * self._beam_width, -1])
+    logits.set_shape([None, self._shortlist.shape[1]])
+    return logits
+
+  def _run_cell(self, inputs, state):
+    """Runs the cell and the output layer on the beams.
+
+    Returns:
+      logits: [batch_size, beam_width, vocab_size], or shortlist_size with a
+        shortlist. Zero for the finished beams when skip_finished is set and
+        there is no shortlist.
+      next_cell_state: The new cell state, [batch_size, beam_width, ...].
+    """
+    cell_state = nest.map_structure(self._maybe_merge_batch_beams,
+                                    state.cell_state, self._cell.state_size)
+    inputs = nest.map_structure(
+        lambda inp: self._merge_batch_beams(inp, s=inp.shape[2:]), inputs)
+
+    if not self._skip_finished:
+      cell_outputs, next_cell_state = self._cell(inputs, cell_state)
+      if self._shortlist is not None:
+        cell_outputs = self._shortlist_logits(cell_outputs)
+      elif self._output_layer is not None:
+        cell_outputs = self._output_layer(cell_outputs)
+      logits = cell_outputs
+    else:
+      finished = tf.reshape(state.finished, [-1])
+      live = tf.to_int32(tf.reshape(tf.where(tf.logical_not(finished)), [-1]))
+      done = tf.to_int32(tf.reshape(tf.where(finished), [-1]))
+      if self._row_wise_cell:
+        gather_live = lambda t: tf.gather(t, live)
+        cell_outputs, live_cell_state = self._cell(
+            nest.map_structure(gather_live, inputs),
+            nest.map_structure(gather_live, cell_state))
+        # Finished beams keep their state.
+        next_cell_state = nest.map_structure(
+            lambda new, old: tf.dynamic_stitch([live, done],
+                                               [new, tf.gather(old, done)]),
+            live_cell_state, cell_state)
+      else:
+        cell_outputs, next_cell_state = self._cell(inputs, cell_state)
+        cell_outputs = tf.gather(cell_outputs, live)
+      if self._shortlist is None and self._output_layer is not None:
+        cell_outputs = self._output_layer(cell_outputs)
+      logits = tf.scatter_nd(
+          tf.expand_dims(live, 1), cell_outputs,
+          tf.stack([tf.size(finished), tf.shape(cell_outputs)[1]]))
+      logits.set_shape([None, cell_outputs.shape[1]])
+      if self._shortlist is not None:
+        # The shortlist differs per image, so all beams are projected; it is
+        # small enough for that to be cheap.
+        logits = self._shortlist_logits(logits)
+
+    logits = self._split_batch_beams(logits, logits.shape[1:])
+    next_cell_state = nest.map_structure(
+        self._maybe_split_batch_beams, next_cell_state, self._cell.state_size)
+    return logits, next_cell_state
+
+  def _stop_early(self, output, state):
+    """Finishes all beams of the batch entries whose best caption is final."""
+    neg_inf = tf.fill(tf.shape(output.scores), -np.inf)
+    best_finished = tf.reduce_max(
+        tf.where(state.finished, output.scores, neg_inf), axis=1)
+    best_live = tf.reduce_max(
+        tf.where(state.finished, neg_inf, output.scores), axis=1)
+    done = tf.logical_and(
+        tf.reduce_any(state.finished, axis=1),
+        best_finished >= best_live + self._early_stopping_threshold)
+    return state._replace(
+        finished=tf.logical_or(state.finished, tf.expand_dims(done, 1)))
+
+  def _diverse_beam_search_step(self, time, logits, next_cell_state, state):
+    """Runs a diverse beam search step, see module docstring."""
+    batch_size = self._batch_size
+    beam_width = self._beam_width
+    group_width = beam_width // self._num_groups
+    static_batch_size = tensor_util.constant_value(batch_size)
+
+    # Total log probs and scores of all continuations, as in the contrib
+    # decoder, [batch_size, beam_width, vocab_size].
+    vocab_size = logits.shape[-1].value or tf.shape(logits)[-1]
+    step_log_probs = tf.nn.log_softmax(logits)
+    step_log_probs = bsd._mask_probs(step_log_probs, self._end_token,
+                                     state.finished)
+    total_probs = tf.expand_dims(state.log_probs, 2) + step_log_probs
+    lengths_to_add = tf.one_hot(
+        indices=tf.fill([batch_size, beam_width], self._end_token),
+        depth=vocab_size, on_value=np.int64(0), off_value=np.int64(1),
+        dtype=tf.int64)
+    lengths_to_add *= tf.expand_dims(
+        tf.to_int64(tf.logical_not(state.finished)), 2)
+    scores = bsd._get_scores(
+        log_probs=total_probs,
+        sequence_lengths=lengths_to_add + tf.expand_dims(state.lengths, 2),
+        length_penalty_weight=self._length_penalty_weight)
+
+    # Select the continuations of each group among its own beams, penalizing
+    # the words chosen by the previous groups.
+    word_counts = tf.zeros([batch_size, vocab_size])
+    not_end_token = 1.0 - tf.one_hot(self._end_token, vocab_size)
+    group_indices = []
+    for group in range(self._num_groups):
+      first_beam = group * group_width
+      penalty = self._diversity_penalty * word_counts
+      group_scores = scores[:, first_beam:first_beam + group_width]
+      group_scores -= tf.expand_dims(penalty, 1)
+      # During the first time step every group continues beam 0, the only live
+      # one: newer contrib decoders start the other beams with a log prob of
+      # -inf and finished.
+      indices = tf.cond(
+          time > 0,
+          lambda: tf.nn.top_k(tf.reshape(group_scores, [batch_size, -1]),
+                              k=group_width)[1] + first_beam * vocab_size,
+          lambda: tf.nn.top_k(scores[:, 0] - penalty, k=group_width)[1])
+      word_counts += not_end_token * tf.reduce_sum(
+          tf.one_hot(indices % vocab_size, vocab_size), axis=1)
+      group_indices.append(indices)
+    word_indices = tf.concat(group_indices, axis=1)
+    word_indices.set_shape([static_batch_size, beam_width])
+
+    next_word_ids = tf.to_int32(word_indices % vocab_size)
+    next_beam_ids = tf.to_int32(word_indices // vocab_size)
+
+    def _gather_continuations(gather_from):
+      return bsd._tensor_gather_helper(
+          gather_indices=word_indices, gather_from=gather_from,
+          batch_size=batch_size, range_size=beam_width * vocab_size,
+          gather_shape=[-1])
+
+    def _gather_beams(gather_from):
+      return bsd._tensor_gather_helper(
+          gather_indices=next_beam_ids, gather_from=gather_from,
+          batch_size=batch_size, range_size=beam_width, gather_shape=[-1])
+
+    next_beam_scores = _gather_continuations(scores)
+    next_beam_probs = _gather_continuations(total_probs)
+    previously_finished = _gather_beams(state.finished)
+    next_finished = tf.logical_or(previously_finished,
+                                  tf.equal(next_word_ids, self._end_token))
+    next_lengths = _gather_beams(state.lengths)
+    next_lengths += tf.to_int64(tf.logical_not(previously_finished))
+    next_cell_state = nest.map_structure(
+        lambda gather_from: bsd._maybe_tensor_gather_helper(
+            gather_indices=next_beam_ids, gather_from=gather_from,
+            batch_size=batch_size, range_size=beam_width,
+            gather_shape=[batch_size * beam_width, -1]),
+        next_cell_state)
+
+    output = bsd.BeamSearchDecoderOutput(scores=next_beam_scores,
+                                         predicted_ids=next_word_ids,
+                                         parent_ids=next_beam_ids)
+    next_state = bsd.BeamSearchDecoderState(cell_state=next_cell_state,
+                                            log_probs=next_beam_probs,
+                                            finished=next_finished,
+                                            lengths=next_lengths)
+    return output, next_state
@@ -0,0 +1,110 @@
+# Copyright 2016 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for the in-graph BeamSearchDecoder."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+
+import numpy as np
+import tensorflow as tf
+
+from im2txt_models import beam_search_decoder
+
+_BATCH_SIZE = 2
+_BEAM_WIDTH = 4
+_VOCAB_SIZE = 20
+_NUM_UNITS = 8
+_START_TOKEN = 1
+_END_TOKEN = 2
+
+
+class BeamSearchDecoderTest(tf.test.TestCase):
+
+  def _decode(self, num_groups, diversity_penalty):
+    """Decodes with a random GRU and returns the predicted ids and scores.
+
+    Returns:
+      predicted_ids: [batch_size, time, beam_width].
+      scores: The scores of the last step, [batch_size, beam_width].
+    """
+    # The end token is unlikely, so that captions differ in their words.
+    bias = np.zeros(_VOCAB_SIZE, dtype=np.float32)
+    bias[_END_TOKEN] = -10.0
+    with tf.Graph().as_default():
+      tf.set_random_seed(1234)
+      cell = tf.contrib.rnn.GRUCell(_NUM_UNITS)
+      embedding = tf.get_variable("embedding", [_VOCAB_SIZE, _NUM_UNITS])
+      initial_state = tf.get_variable("initial_state",
+                                      [_BATCH_SIZE, _NUM_UNITS])
+      decoder = beam_search_decoder.BeamSearchDecoder(
+          cell=cell,
+          embedding=embedding,
+          start_tokens=tf.fill([_BATCH_SIZE], _START_TOKEN),
+          end_token=_END_TOKEN,
+          initial_state=tf.contrib.seq2seq.tile_batch(
+              initial_state, multiplier=_BEAM_WIDTH),
+          beam_width=_BEAM_WIDTH,
+          output_layer=tf.layers.Dense(
+              _VOCAB_SIZE, bias_initializer=tf.constant_initializer(bias)),
+          length_penalty_weight=0.0,
+          early_stopping=False,
+          early_stopping_threshold=0.0,
+          num_groups=num_groups,
+          diversity_penalty=diversity_penalty,
+          skip_finished=False)
+      outputs, _, _ = tf.contrib.seq2seq.dynamic_decode(
+          decoder=decoder,
+          output_time_major=False,
+          impute_finished=False,
+          maximum_iterations=6)
+      with self.test_session() as sess:
+        sess.run(tf.global_variables_initializer())
+        predicted_ids, scores = sess.run(
+            [outputs.predicted_ids, outputs.beam_search_decoder_output.scores])
+    return predicted_ids, scores[:, -1, :]
+
+  def _captions(self, predicted_ids, batch_index):
+    """Returns the captions of the beams of a batch entry, up to the end."""
+    captions = []
+    for beam in range(_BEAM_WIDTH):
+      caption = []
+      for word_id in predicted_ids[batch_index, :, beam]:
+        if word_id == _END_TOKEN or word_id < 0:
+          break
+        caption.append(int(word_id))
+      captions.append(tuple(caption))
+    return captions
+
+  def testDiverseGroupsAreAllAlive(self):
+    predicted_ids, scores = self._decode(num_groups=2, diversity_penalty=10.0)
+    self.assertTrue(np.all(np.isfinite(scores)), scores)
+    group_width = _BEAM_WIDTH // 2
+    for batch_index in range(_BATCH_SIZE):
+      captions = self._captions(predicted_ids, batch_index)
+      self.assertEqual(len(captions), len(set(captions)), captions)
+      # The penalty keeps the second group off the first words of the first.
+      first_words = [set(caption[:1]) for caption in captions]
+      self.assertFalse(set.union(*first_words[:group_width]) &
+                       set.union(*first_words[group_width:]))
+
+  def testOneGroupIsAllAlive(self):
+    _, scores = self._decode(num_groups=1, diversity_penalty=0.0)
+    self.assertTrue(np.all(np.isfinite(scores)), scores)
+
+
+if __name__ == "__main__":
+  tf.test.main()
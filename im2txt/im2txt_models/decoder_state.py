@@ -0,0 +1,105 @@
+"""Keeps the decoder state of out-of-graph beam search in the session.
+
+Out-of-graph beam search feeds the state of every hypothesis into
+"lstm/state_feed" and fetches "lstm/state" at each step. The ops built here let
+the decoder state (and the attention memory of attention models) stay in local
+variables instead:
+
+  * the ops in the DECODER_STATE_INIT collection store the values of the image
+    in "image_feed" (its initial state, its attention memory) as the first
+    row, the ops in the DECODER_STATE_APPEND collection append them,
+  * the op in the DECODER_STATE_UPDATE collection stores the new states of a
+    step, one row per fed hypothesis.
+
+A step then only feeds the word ids, "lstm/beam_indices" (the row of the stored
+state each hypothesis continues) and, for attention models,
+"lstm/image_indices" (the image of each hypothesis). Feeding "lstm/state_feed"
+still overrides the stored state, so the stateless API keeps working; attention
+models then read the memory of a single stored image.
+"""
+
+import tensorflow as tf
+
+DECODER_STATE_INIT = "decoder_state_init"
+DECODER_STATE_APPEND = "decoder_state_append"
+DECODER_STATE_UPDATE = "decoder_state_update"
+
+
+def _create_store(value, name):
+  """Creates a local variable holding rows of the shape of value.
+
+  The variable is not saved in checkpoints and needs no initialization: it is
+  assigned by its init op before use.
+  """
+  row_shape = value.get_shape().as_list()[1:]
+  store = tf.Variable(tf.zeros([0] + [d or 0 for d in row_shape],
+                               dtype=value.dtype),
+                      trainable=False,
+                      validate_shape=False,
+                      collections=[tf.GraphKeys.LOCAL_VARIABLES],
+                      name=name)
+  init = tf.assign(store, value, validate_shape=False, name="init_" + name)
+  append = tf.assign(store, tf.concat([store, value], axis=0),
+                     validate_shape=False, name="append_" + name)
+  tf.add_to_collection(DECODER_STATE_INIT, init.op)
+  tf.add_to_collection(DECODER_STATE_APPEND, append.op)
+  return store, row_shape
+
+
+class DecoderState(object):
+  """Builds the stored decoder state ops of a single-step inference graph.
+
+  All methods must be called in the same name scope, e.g. "lstm".
+  """
+
+  def __init__(self):
+    self._stored_state = None
+    self._image_indices = None
+
+  def state_feed(self, initial_state, name="state_feed"):
+    """Creates the state placeholder of a decoding step.
+
+    Args:
+      initial_state: The concatenated initial state of the fed image, of shape
+        [1, state_size].
+      name: Name of the placeholder.
+
+    Returns:
+      A placeholder of shape [None, state_size] that defaults to the rows
+      "beam_indices" of the stored state.
+    """
+    beam_indices = tf.placeholder(dtype=tf.int32,
+                                  shape=[None],  # batch_size
+                                  name="beam_indices")
+    self._stored_state, row_shape = _create_store(initial_state, "stored_state")
+    stored_rows = tf.gather(self._stored_state, beam_indices)
+    stored_rows.set_shape([None] + row_shape)
+    return tf.placeholder_with_default(stored_rows, shape=[None] + row_shape,
+                                       name=name)
+
+  def update_state(self, new_state):
+    """Creates the op storing the concatenated new state of a step."""
+    update = tf.assign(self._stored_state, new_state, validate_shape=False,
+                       name="update_stored_state")
+    tf.add_to_collection(DECODER_STATE_UPDATE, update.op)
+    return update
+
+  def stored_memory(self, memory, name):
+    """Keeps a per-image attention memory in the session.
+
+    Args:
+      memory: The memory of the fed image, of shape [1, ...].
+      name: Name of the local variable holding the memories.
+
+    Returns:
+      A tensor with the memory of the image of each hypothesis, selected by
+      the "image_indices" placeholder.
+    """
+    if self._image_indices is None:
+      self._image_indices = tf.placeholder(dtype=tf.int32,
+                                           shape=[None],  # batch_size
+                                           name="image_indices")
+    store, row_shape = _create_store(memory, name)
+    rows = tf.gather(store, self._image_indices)
+    rows.set_shape([None] + row_shape)
+    return rows
@@ -2,6 +2,7 @@
 import tensorflow as tf
 from tensorflow.python.layers.core import Dense
 import custom_rnn_cell
+import beam_search_decoder
 
 FLAGS = tf.app.flags.FLAGS
 
@@ -308,15 +309,14 @@ class MultiRefModel(object):
         zero_state = lstm_cell.zero_state(batch_size=batch_size*FLAGS.beam_width, dtype=tf.float32)
         _, initial_state = lstm_cell(image_embeddings, zero_state)
 
-        decoder = tf.contrib.seq2seq.BeamSearchDecoder(
+        decoder = beam_search_decoder.BeamSearchDecoder(
           cell=lstm_cell,
           embedding=embedding_map,
           start_tokens=tf.fill([batch_size], FLAGS.start_token),    #[batch_size]
           end_token=FLAGS.end_token,
           initial_state=initial_state,
           beam_width=FLAGS.beam_width,
-          output_layer=output_layer,
-          length_penalty_weight=0.0)
+          output_layer=output_layer)
 
         maximum_iterations = FLAGS.max_caption_length
         outputs, _ , outputs_sequence_lengths = tf.contrib.seq2seq.dynamic_decode(
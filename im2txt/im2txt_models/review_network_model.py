@@ -1,6 +1,7 @@
 
 import tensorflow as tf
 from tensorflow.python.layers.core import Dense
+import beam_search_decoder
 
 FLAGS = tf.app.flags.FLAGS
 
@@ -191,15 +192,14 @@ class ReviewNetworkModel(object):
           output_layer=output_layer)
 
       elif mode == "inference":
-        decoder = tf.contrib.seq2seq.BeamSearchDecoder(
+        decoder = beam_search_decoder.BeamSearchDecoder(
           cell=lstm_cell,
           embedding=embedding_map,
           start_tokens=tf.fill([batch_size], FLAGS.start_token),    #[batch_size]
           end_token=FLAGS.end_token,
           initial_state=initial_state, #[batch_size*beam_width]
           beam_width=FLAGS.beam_width,
-          output_layer=output_layer,
-          length_penalty_weight=0.0)
+          output_layer=output_layer)
       else:
         raise Exception("Unknown mode!")
 
@@ -1,6 +1,8 @@
 
 import tensorflow as tf
 from tensorflow.python.layers.core import Dense
+import beam_search_decoder
+from inference_utils import binary_vocab
 
 FLAGS = tf.app.flags.FLAGS
 
@@ -143,15 +145,14 @@ class SemanticAttentionModel(object):
 
 
       elif mode == "inference":
-        decoder = tf.contrib.seq2seq.BeamSearchDecoder(
+        decoder = beam_search_decoder.BeamSearchDecoder(
           cell=lstm_cell,
           embedding=embedding_map,
           start_tokens=tf.fill([batch_size], FLAGS.start_token),    #[batch_size]
           end_token=FLAGS.end_token,
           initial_state=initial_state, #[batch_size*beam_width]
           beam_width=FLAGS.beam_width,
-          output_layer=output_layer,
-          length_penalty_weight=0.0)
+          output_layer=output_layer)
 
 
       else:
@@ -174,9 +175,7 @@ class SemanticAttentionModel(object):
       return {"bs_results": outputs, "bs_results_lengths":outputs_sequence_lengths, "top_n_attributes": (top_attributes_probs, top_attributes_indices)}
 
   def build_attributes_mask(self, attributes_num=1000):
-    input = open(FLAGS.vocab_file)
-    vocab = [line.split(" ")[0] for line in input.readlines()]
-    input.close()
+    vocab, _ = binary_vocab.load_words(FLAGS.vocab_file)
     input = open(FLAGS.attributes_file)
     attributes = set([line.split(" ")[0] for line in input.readlines()])
     input.close()
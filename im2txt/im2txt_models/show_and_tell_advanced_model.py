@@ -3,6 +3,7 @@ import tensorflow as tf
 import numpy as np
 from tensorflow.python.layers.core import Dense
 import custom_rnn_cell
+import beam_search_decoder
 
 FLAGS = tf.app.flags.FLAGS
 
@@ -396,7 +397,7 @@ class ShowAndTellAdvancedModel(object):
             output_layer=output_layer)
 
       elif mode == "inference":
-        decoder = tf.contrib.seq2seq.BeamSearchDecoder(
+        decoder = beam_search_decoder.BeamSearchDecoder(
           cell=lstm_cell,
           embedding=embedding_map,
           start_tokens=tf.fill([batch_size], FLAGS.start_token),    #[batch_size]
@@ -404,7 +405,8 @@ class ShowAndTellAdvancedModel(object):
           initial_state=initial_state,
           beam_width=FLAGS.beam_width,
           output_layer=output_layer,
-          length_penalty_weight=0.0)
+          shortlist=beam_search_decoder.output_shortlist(
+              batch_size, model_outputs.get("word_predictions")))
 
       else:
         raise Exception("Unknown mode!")
@@ -1,6 +1,7 @@
 
 import tensorflow as tf
 from tensorflow.python.layers.core import Dense
+import beam_search_decoder
 
 FLAGS = tf.app.flags.FLAGS
 
@@ -129,7 +130,7 @@ class ShowAndTellInGraphModel(object):
 
 
       elif mode == "inference":
-        decoder = tf.contrib.seq2seq.BeamSearchDecoder(
+        decoder = beam_search_decoder.BeamSearchDecoder(
           cell=lstm_cell,
           embedding=embedding_map,
           start_tokens=tf.fill([batch_size], FLAGS.start_token),    #[batch_size]
@@ -137,7 +138,7 @@ class ShowAndTellInGraphModel(object):
           initial_state=tf.contrib.seq2seq.tile_batch(initial_state, multiplier=FLAGS.beam_width), #[batch_size*beam_width]
           beam_width=FLAGS.beam_width,
           output_layer=output_layer,
-          length_penalty_weight=0.0)
+          shortlist=beam_search_decoder.output_shortlist(batch_size))
 
 
       else:
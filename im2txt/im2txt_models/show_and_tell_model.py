@@ -1,6 +1,8 @@
 
 import tensorflow as tf
 
+import decoder_state
+
 FLAGS = tf.app.flags.FLAGS
 
 
@@ -72,12 +74,12 @@ class ShowAndTellModel(object):
       if mode == "inference":
         # In inference mode, use concatenated states for convenient feeding and
         # fetching.
-        tf.concat(axis=1, values=initial_state, name="initial_state")
+        initial_state = tf.concat(axis=1, values=initial_state, name="initial_state")
 
-        # Placeholder for feeding a batch of concatenated states.
-        state_feed = tf.placeholder(dtype=tf.float32,
-                                    shape=[None, sum(lstm_cell.state_size)],
-                                    name="state_feed")
+        # Placeholder for feeding a batch of concatenated states. When it is
+        # not fed, the states are read from the session, see decoder_state.
+        decoder = decoder_state.DecoderState()
+        state_feed = decoder.state_feed(initial_state)
         state_tuple = tf.split(value=state_feed, num_or_size_splits=2, axis=1)
 
         # Run a single LSTM step.
@@ -86,7 +88,7 @@ class ShowAndTellModel(object):
             state=state_tuple)
 
         # Concatentate the resulting state.
-        tf.concat(axis=1, values=state_tuple, name="state")
+        decoder.update_state(tf.concat(axis=1, values=state_tuple, name="state"))
       else:
         # Run the batch of sequence embeddings through the LSTM.
         sequence_length = tf.reduce_sum(input_mask, 1)
@@ -1,5 +1,7 @@
 import tensorflow as tf
 import math
+
+import decoder_state
 FLAGS = tf.app.flags.FLAGS
 
 class ShowAttendTellModel(object):
@@ -86,16 +88,20 @@ class ShowAttendTellModel(object):
             lstm_scope.reuse_variables()
 
             if mode == "inference":
-                tf.concat(axis=1, values=state, name='initial_state')
-                state_feed = tf.placeholder(dtype=tf.float32,
-                                            shape=[None, sum(lstm_cell.state_size)],
-                                            name="state_feed")
+                initial_state = tf.concat(axis=1, values=state, name='initial_state')
+                # The states and the attention memory of the images are kept
+                # in the session, see decoder_state.
+                decoder = decoder_state.DecoderState()
+                state_feed = decoder.state_feed(initial_state)
                 state_tuple = tf.split(value=state_feed, num_or_size_splits=2, axis=1)
+                image = decoder.stored_memory(self.image, "stored_image")
+                stored_context_encode = decoder.stored_memory(self.context_encode,
+                                                              "stored_context_encode")
 
 
                 x_t = tf.squeeze(seq_embeddings, axis=[1])
 
-                context_encode = self.context_encode + \
+                context_encode = stored_context_encode + \
                                    tf.expand_dims(tf.matmul(state_tuple[1], self.hidden_att_W), 1) + \
                                    self.pre_att_b
                 context_encode = tf.nn.tanh(context_encode)
@@ -104,7 +110,7 @@ class ShowAttendTellModel(object):
                 alpha = tf.matmul(context_encode_flat, self.att_W) + self.att_b
                 alpha = tf.reshape(alpha, [-1, self.ctx_shape[0]])
                 alpha = tf.nn.softmax(alpha)
-                weighted_context = tf.reduce_sum(self.image * tf.expand_dims(alpha, 2), 1)
+                weighted_context = tf.reduce_sum(image * tf.expand_dims(alpha, 2), 1)
                 #weighted_context = tf.tile(weighted_context, 
 
                 lstm_preactive = tf.concat(axis=1, values=[state_tuple[1], x_t, weighted_context])
@@ -114,7 +120,7 @@ class ShowAttendTellModel(object):
                     lstm_preactive,
                     state=state_tuple
                 )
-                tf.concat(axis=1, values=state_tuple, name='state')
+                decoder.update_state(tf.concat(axis=1, values=state_tuple, name='state'))
 
                 logits = tf.matmul(lstm_outputs, self.decode_lstm_W) + self.decode_lstm_b
                 logits = tf.nn.relu(logits)
@@ -2,6 +2,7 @@
 import tensorflow as tf
 from tensorflow.python.layers.core import Dense
 from top_down_rnn_cell import TopDownRNNCell
+import beam_search_decoder
 
 FLAGS = tf.app.flags.FLAGS
 
@@ -170,7 +171,7 @@ class TopDownAttentionModel(object):
           output_layer=output_layer)
 
       elif mode == "inference":
-        decoder = tf.contrib.seq2seq.BeamSearchDecoder(
+        decoder = beam_search_decoder.BeamSearchDecoder(
           cell=lstm_cell,
           embedding=embedding_map,
           start_tokens=tf.fill([batch_size], FLAGS.start_token),    #[batch_size]
@@ -178,7 +179,7 @@ class TopDownAttentionModel(object):
           initial_state=initial_state,
           beam_width=FLAGS.beam_width,
           output_layer=output_layer,
-          length_penalty_weight=0.0)
+          row_wise_cell=False)  # The cell holds the tiled image memory.
 
       else:
         raise Exception("Unknown mode!")
@@ -21,7 +21,6 @@ from __future__ import print_function
 
 import os
 import math
-import json
 import time
 import random
 
@@ -29,6 +28,9 @@ import tensorflow as tf
 
 import inference_wrapper
 from inference_utils import caption_generator
+from inference_utils import image_prefetcher
+from inference_utils import result_writer
+from inference_utils import stage_timer
 from inference_utils import vocabulary
 
 FLAGS = tf.flags.FLAGS
@@ -36,18 +38,30 @@ FLAGS = tf.flags.FLAGS
 tf.flags.DEFINE_string("checkpoint_path", "",
                        "Model checkpoint file or directory containing a "
                        "model checkpoint file.")
+tf.flags.DEFINE_string("frozen_graph", "",
+                       "Frozen graph written by export_frozen_graph.py, used "
+                       "instead of --checkpoint_path.")
 #tf.flags.DEFINE_string("vocab_file", "", "Text file containing the vocabulary.")
 tf.flags.DEFINE_string("input_file_pattern", "", "The pattern of images.")
 tf.flags.DEFINE_string("output", "", "The output file.")
 tf.flags.DEFINE_float("gpu_memory_fraction", 1.0, "Fraction of gpu memory used in inference.")
 tf.flags.DEFINE_boolean("predict_attributes_only", False,
                         "If true, the model only predicts attributes")
+tf.flags.DEFINE_integer("batch_size", 1, "Number of images decoded together by beam search.")
 
 tf.logging.set_verbosity(tf.logging.INFO)
 
 
+def _get_image_id(filename):
+  image_id = filename.split('.')[0]
+  if "/" in image_id:
+    image_id = image_id.split("/")[-1]
+  return image_id
+
+
 def main(_):
-  assert FLAGS.checkpoint_path, "--checkpoint_path is required"
+  assert FLAGS.checkpoint_path or FLAGS.frozen_graph, \
+      "--checkpoint_path or --frozen_graph is required"
   assert FLAGS.vocab_file, "--vocab_file is required"
   assert FLAGS.input_file_pattern , "--input_file_pattern is required"
   assert FLAGS.output, "--output is required"
@@ -56,51 +70,76 @@ def main(_):
   g = tf.Graph()
   with g.as_default():
     model = inference_wrapper.InferenceWrapper()
-    restore_fn = model.build_graph(FLAGS.checkpoint_path)
+    if FLAGS.frozen_graph:
+      restore_fn = model.build_graph_from_frozen(FLAGS.frozen_graph)
+    else:
+      restore_fn = model.build_graph(FLAGS.checkpoint_path)
   g.finalize()
 
   # Create the vocabulary.
   vocab = vocabulary.Vocabulary(FLAGS.vocab_file)
 
-  results = []
+  writer = result_writer.ResultWriter(FLAGS.output,
+                                      flush_every=FLAGS.output_flush_every,
+                                      resume=FLAGS.resume_output,
+                                      compact=FLAGS.compact_output)
+
+  timer = stage_timer.StageTimer(enabled=bool(FLAGS.profile_report))
 
   gpu_options = tf.GPUOptions(per_process_gpu_memory_fraction=FLAGS.gpu_memory_fraction)
   with tf.Session(graph=g, config=tf.ConfigProto(gpu_options=gpu_options)) as sess:
     # Load the model from checkpoint.
     restore_fn(sess)
+    # Traces are only worth their cost if their op times are reported or
+    # their timelines written.
+    if FLAGS.profile_trace_every and (FLAGS.profile_report or
+                                      FLAGS.profile_timeline_dir):
+      sess = stage_timer.TracingSession(sess, timer,
+                                        FLAGS.profile_trace_every,
+                                        FLAGS.profile_timeline_dir)
 
     # Prepare the caption generator. Here we are implicitly using the default
     # beam search parameters. See caption_generator.py for a description of the
     # available beam search parameters.
-    generator = caption_generator.CaptionGenerator(model, vocab)
+    generator = caption_generator.CaptionGenerator(model, vocab, timer=timer)
     t_start = time.time()
     files = tf.gfile.Glob(FLAGS.input_file_pattern)
-    for i, filename in enumerate(files):
-      if i % 100 == 0:
-          print(i)
-      with tf.gfile.GFile(filename, "r") as f:
-        image = f.read()
-      image_id = filename.split('.')[0]
-      if "/" in image_id:
-        image_id = image_id.split("/")[-1]
-      result = {}
-      result['image_id'] = image_id
-      if FLAGS.predict_attributes_only:
-        attributes_ids, attributes_probs = generator.predict_attributes(sess, image)
-        attributes = [vocab.id_to_word(w) for w in attributes_ids]
-        result['attributes'] = " ".join(attributes)
-        result['probabilities'] = " ".join([str(prob) for prob in attributes_probs])
-      else:
-        captions = generator.beam_search(sess, image)
-        sent = [vocab.id_to_word(w) for w in captions[0]]
-        result['caption'] = "".join(sent)
-      results.append(result)
+    files = [f for f in files if _get_image_id(f) not in writer.done_ids]
+    prefetcher = image_prefetcher.ImagePrefetcher(
+        files,
+        num_threads=FLAGS.num_read_threads,
+        queue_depth=FLAGS.prefetch_queue_depth,
+        timer=timer)
+    start = 0
+    for batch_files, images in prefetcher.batches(FLAGS.batch_size):
+      if start % 100 < len(batch_files):
+          print(start)
+      start += len(batch_files)
+      if not FLAGS.predict_attributes_only:
+        batch_captions = generator.beam_search_batch(sess, images)
+        with timer.stage("vocab_decode"):
+          sentences = vocab.decode_batch(
+              [captions[0] for captions in batch_captions])
+      for i, filename in enumerate(batch_files):
+        result = {}
+        result['image_id'] = _get_image_id(filename)
+        if FLAGS.predict_attributes_only:
+          attributes_ids, attributes_probs = generator.predict_attributes(sess, images[i])
+          attributes = [vocab.id_to_word(w) for w in attributes_ids]
+          result['attributes'] = " ".join(attributes)
+          result['probabilities'] = " ".join([str(prob) for prob in attributes_probs])
+        else:
+          result['caption'] = sentences[i]
+        with timer.stage("output_write"):
+          writer.write(result)
+    prefetcher.close()
+    generator.log_decode_stats()
   
   t_end = time.time()
   print("time: %f" %(t_end - t_start))
-  output = open(FLAGS.output, 'w')
-  json.dump(results, output, ensure_ascii=False, indent=4)
-  output.close()
+  writer.close()
+  if FLAGS.profile_report:
+    timer.write_report(FLAGS.profile_report, start)
 
 if __name__ == "__main__":
   tf.app.run()
@@ -21,7 +21,6 @@ from __future__ import print_function
 
 import os
 import math
-import json
 import time
 import random
 
@@ -29,6 +28,8 @@ import tensorflow as tf
 
 import inference_wrapper
 from inference_utils import caption_generator
+from inference_utils import image_prefetcher
+from inference_utils import result_writer
 from inference_utils import vocabulary
 
 FLAGS = tf.flags.FLAGS
@@ -40,11 +41,19 @@ tf.flags.DEFINE_string("checkpoint_path", "",
 tf.flags.DEFINE_string("input_file_pattern", "", "The pattern of images.")
 tf.flags.DEFINE_string("output", "", "The output file.")
 tf.flags.DEFINE_float("gpu_memory_fraction", 1.0, "Fraction of gpu memory used in inference.")
+tf.flags.DEFINE_integer("batch_size", 1, "Number of images decoded together by beam search.")
 
 
 tf.logging.set_verbosity(tf.logging.INFO)
 
 
+def _get_image_id(filename):
+  image_id = filename.split('.')[0]
+  if "/" in image_id:
+    image_id = image_id.split("/")[-1]
+  return image_id
+
+
 def main(_):
   assert FLAGS.checkpoint_path, "--checkpoint_path is required"
   assert FLAGS.vocab_file, "--vocab_file is required"
@@ -61,7 +70,10 @@ def main(_):
   # Create the vocabulary.
   vocab = vocabulary.Vocabulary(FLAGS.vocab_file)
 
-  results = []
+  writer = result_writer.ResultWriter(FLAGS.output,
+                                      flush_every=FLAGS.output_flush_every,
+                                      resume=FLAGS.resume_output,
+                                      compact=FLAGS.compact_output)
 
   gpu_options = tf.GPUOptions(per_process_gpu_memory_fraction=FLAGS.gpu_memory_fraction)
   with tf.Session(graph=g, config=tf.ConfigProto(gpu_options=gpu_options)) as sess:
@@ -74,28 +86,31 @@ def main(_):
     generator = caption_generator.CaptionGenerator(model, vocab)
     t_start = time.time()
     files = tf.gfile.Glob(FLAGS.input_file_pattern)
-    for i, filename in enumerate(files):
-      if i % 100 == 0:
-          print(i)
-      with tf.gfile.GFile(filename, "r") as f:
-        image = f.read()
-      captions = generator.beam_search(sess, image)
-      image_id = filename.split('.')[0]
-      if "/" in image_id:
-        image_id = image_id.split("/")[-1]
-      result = {}
-      result['image_id'] = image_id
-      sents = ["".join([vocab.id_to_word(w) for w in caption]) for i, caption in enumerate(captions)]
-      sent_ids = [" ".join(map(str, caption)) for caption in captions]
-      result['captions'] = sents
-      result['caption_ids'] = sent_ids
-      results.append(result)
+    files = [f for f in files if _get_image_id(f) not in writer.done_ids]
+    prefetcher = image_prefetcher.ImagePrefetcher(
+        files,
+        num_threads=FLAGS.num_read_threads,
+        queue_depth=FLAGS.prefetch_queue_depth)
+    start = 0
+    for batch_files, images in prefetcher.batches(FLAGS.batch_size):
+      if start % 100 < len(batch_files):
+          print(start)
+      start += len(batch_files)
+      batch_captions = generator.beam_search_batch(sess, images)
+      for filename, captions in zip(batch_files, batch_captions):
+        result = {}
+        result['image_id'] = _get_image_id(filename)
+        sents = vocab.decode_batch(captions)
+        sent_ids = [" ".join(map(str, caption)) for caption in captions]
+        result['captions'] = sents
+        result['caption_ids'] = sent_ids
+        writer.write(result)
+    prefetcher.close()
+    generator.log_decode_stats()
   
   t_end = time.time()
   print("time: %f" %(t_end - t_start))
-  output = open(FLAGS.output, 'w')
-  json.dump(results, output, ensure_ascii=False, indent=4)
-  output.close()
+  writer.close()
 
 if __name__ == "__main__":
   tf.app.run()
@@ -0,0 +1,100 @@
+# Copyright 2016 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+r"""Generate captions from image features precomputed by extract_features.py.
+
+The image model is not built: the stored features are fed straight into the
+caption model, so only the decoder runs. In-graph models only
+(--support_ingraph=True).
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+
+import tensorflow as tf
+
+import inference_wrapper
+from inference_utils import caption_generator
+from inference_utils import feature_store
+from inference_utils import result_writer
+from inference_utils import vocabulary
+
+FLAGS = tf.flags.FLAGS
+
+tf.flags.DEFINE_string("checkpoint_path", "",
+                       "Model checkpoint file or directory containing a "
+                       "model checkpoint file.")
+tf.flags.DEFINE_string("feature_dir", "", "Directory of the feature store.")
+tf.flags.DEFINE_string("output", "", "The output file.")
+tf.flags.DEFINE_float("gpu_memory_fraction", 1.0, "Fraction of gpu memory used in inference.")
+tf.flags.DEFINE_integer("batch_size", 32, "Number of images decoded per run.")
+
+tf.logging.set_verbosity(tf.logging.INFO)
+
+
+def main(_):
+  assert FLAGS.checkpoint_path, "--checkpoint_path is required"
+  assert FLAGS.vocab_file, "--vocab_file is required"
+  assert FLAGS.feature_dir, "--feature_dir is required"
+  assert FLAGS.output, "--output is required"
+  assert FLAGS.support_ingraph, "--support_ingraph is required"
+
+  store = feature_store.FeatureStore(FLAGS.feature_dir)
+
+  # Build the inference graph on top of the feature placeholders.
+  g = tf.Graph()
+  with g.as_default():
+    model = inference_wrapper.InferenceWrapper(
+        image_feature_shapes=store.feature_shapes)
+    restore_fn = model.build_graph(FLAGS.checkpoint_path)
+  g.finalize()
+
+  # Create the vocabulary.
+  vocab = vocabulary.Vocabulary(FLAGS.vocab_file)
+
+  writer = result_writer.ResultWriter(FLAGS.output,
+                                      flush_every=FLAGS.output_flush_every,
+                                      resume=FLAGS.resume_output,
+                                      compact=FLAGS.compact_output)
+
+  gpu_options = tf.GPUOptions(per_process_gpu_memory_fraction=FLAGS.gpu_memory_fraction)
+  with tf.Session(graph=g, config=tf.ConfigProto(gpu_options=gpu_options)) as sess:
+    # Load the model from checkpoint.
+    restore_fn(sess)
+
+    generator = caption_generator.CaptionGenerator(model, vocab)
+    t_start = time.time()
+    image_ids = [i for i in store.image_ids if i not in writer.done_ids]
+    for start in range(0, len(image_ids), FLAGS.batch_size):
+      if start % 1000 < FLAGS.batch_size:
+          print(start)
+      batch_ids = image_ids[start:start + FLAGS.batch_size]
+      batch_captions = generator.beam_search_features(sess, store.get(batch_ids))
+      sentences = vocab.decode_batch([captions[0] for captions in batch_captions])
+      for image_id, sentence in zip(batch_ids, sentences):
+        result = {}
+        result['image_id'] = image_id
+        result['caption'] = sentence
+        writer.write(result)
+    generator.log_decode_stats()
+
+  t_end = time.time()
+  print("time: %f" %(t_end - t_start))
+  writer.close()
+
+if __name__ == "__main__":
+  tf.app.run()
@@ -0,0 +1,190 @@
+# Copyright 2016 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+r"""Generate captions for many checkpoints of one model in a single process.
+
+The inference graph is built once and the images are listed once. For every
+selected checkpoint only the variables are restored before decoding, and the
+captions are written to <output_dir>/model.ckpt-<step>.eval/out.json, the
+layout the eval scripts use. The images of each checkpoint are streamed
+through an ImagePrefetcher, or with --cache_images read into memory once for
+all checkpoints.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import re
+import time
+
+import tensorflow as tf
+
+import inference_wrapper
+from inference_utils import caption_generator
+from inference_utils import image_prefetcher
+from inference_utils import result_writer
+from inference_utils import vocabulary
+
+FLAGS = tf.flags.FLAGS
+
+tf.flags.DEFINE_string("checkpoint_dir", "",
+                       "Directory containing the model.ckpt-* checkpoints.")
+tf.flags.DEFINE_integer("checkpoint_every_n_steps", 0,
+                        "Decode the first checkpoint of every interval of this "
+                        "many steps, like tools/every_n_step.py. 0 means every "
+                        "checkpoint.")
+tf.flags.DEFINE_string("checkpoint_steps", "",
+                       "Comma-separated list of checkpoint steps to decode. "
+                       "Overrides --checkpoint_every_n_steps.")
+tf.flags.DEFINE_string("input_file_pattern", "", "The pattern of images.")
+tf.flags.DEFINE_string("output_dir", "",
+                       "Directory of the per-checkpoint outputs. Defaults to "
+                       "--checkpoint_dir.")
+tf.flags.DEFINE_float("gpu_memory_fraction", 1.0, "Fraction of gpu memory used in inference.")
+tf.flags.DEFINE_integer("batch_size", 1, "Number of images decoded together by beam search.")
+tf.flags.DEFINE_boolean("cache_images", False,
+                        "Whether to keep the encoded images in memory across "
+                        "checkpoints instead of reading them for each one. "
+                        "This holds all images of --input_file_pattern in "
+                        "memory.")
+
+tf.logging.set_verbosity(tf.logging.INFO)
+
+
+def _get_image_id(filename):
+  image_id = filename.split('.')[0]
+  if "/" in image_id:
+    image_id = image_id.split("/")[-1]
+  return image_id
+
+
+def _read_image(filename):
+  with tf.gfile.GFile(filename, "r") as f:
+    return f.read()
+
+
+def get_checkpoint_steps(checkpoint_dir, every_n_steps=0, steps=""):
+  """Lists the checkpoint steps to decode, in increasing order.
+
+  Args:
+    checkpoint_dir: Directory containing the model.ckpt-* checkpoints.
+    every_n_steps: If > 0, keep only the first checkpoint of every interval
+      [k * every_n_steps, (k + 1) * every_n_steps).
+    steps: Comma-separated list of steps; if set, these are returned as is.
+
+  Returns:
+    A sorted list of integer steps.
+  """
+  if steps:
+    return sorted(int(step) for step in steps.split(","))
+
+  regex_step = re.compile(r"model\.ckpt-([0-9]+)\.index$")
+  points = set()
+  for filename in tf.gfile.ListDirectory(checkpoint_dir):
+    match = regex_step.match(os.path.basename(filename))
+    if match:
+      points.add(int(match.group(1)))
+  points = sorted(points)
+
+  if every_n_steps <= 0:
+    return points
+  selected = {}
+  for point in points:
+    selected.setdefault(point // every_n_steps, point)
+  return sorted(selected.values())
+
+
+def main(_):
+  assert FLAGS.checkpoint_dir, "--checkpoint_dir is required"
+  assert FLAGS.vocab_file, "--vocab_file is required"
+  assert FLAGS.input_file_pattern , "--input_file_pattern is required"
+  output_dir = FLAGS.output_dir or FLAGS.checkpoint_dir
+
+  steps = get_checkpoint_steps(FLAGS.checkpoint_dir,
+                               every_n_steps=FLAGS.checkpoint_every_n_steps,
+                               steps=FLAGS.checkpoint_steps)
+  steps = [step for step in steps if not tf.gfile.Exists(
+      os.path.join(output_dir, "model.ckpt-%d.eval" % step, "out.json"))]
+  if not steps:
+    tf.logging.info("No checkpoint left to decode in %s", FLAGS.checkpoint_dir)
+    return
+  tf.logging.info("Decoding %d checkpoints: %s", len(steps), steps)
+
+  # Build the inference graph once for all checkpoints.
+  g = tf.Graph()
+  with g.as_default():
+    model = inference_wrapper.InferenceWrapper()
+    model.build_graph(os.path.join(FLAGS.checkpoint_dir,
+                                   "model.ckpt-%d" % steps[0]))
+  g.finalize()
+
+  # Create the vocabulary.
+  vocab = vocabulary.Vocabulary(FLAGS.vocab_file)
+
+  files = tf.gfile.Glob(FLAGS.input_file_pattern)
+  tf.logging.info("Found %d images to process", len(files))
+  images = {}
+  if FLAGS.cache_images:
+    for filename in files:
+      images[filename] = _read_image(filename)
+
+  gpu_options = tf.GPUOptions(per_process_gpu_memory_fraction=FLAGS.gpu_memory_fraction)
+  with tf.Session(graph=g, config=tf.ConfigProto(gpu_options=gpu_options)) as sess:
+    generator = caption_generator.CaptionGenerator(model, vocab)
+
+    for step in steps:
+      checkpoint_path = os.path.join(FLAGS.checkpoint_dir, "model.ckpt-%d" % step)
+      eval_dir = os.path.join(output_dir, "model.ckpt-%d.eval" % step)
+      if not tf.gfile.IsDirectory(eval_dir):
+        tf.gfile.MakeDirs(eval_dir)
+
+      # Only the variables change between checkpoints.
+      model.create_restore_fn(checkpoint_path)(sess)
+
+      writer = result_writer.ResultWriter(os.path.join(eval_dir, "out.json"),
+                                          flush_every=FLAGS.output_flush_every,
+                                          resume=FLAGS.resume_output,
+                                          compact=True)
+      todo = [f for f in files if _get_image_id(f) not in writer.done_ids]
+      t_start = time.time()
+      if FLAGS.cache_images:
+        prefetcher = None
+        batches = ((todo[start:start + FLAGS.batch_size],
+                    [images[f] for f in todo[start:start + FLAGS.batch_size]])
+                   for start in range(0, len(todo), FLAGS.batch_size))
+      else:
+        prefetcher = image_prefetcher.ImagePrefetcher(
+            todo,
+            num_threads=FLAGS.num_read_threads,
+            queue_depth=FLAGS.prefetch_queue_depth)
+        batches = prefetcher.batches(FLAGS.batch_size)
+      for batch_files, batch_images in batches:
+        batch_captions = generator.beam_search_batch(sess, batch_images)
+        sentences = vocab.decode_batch([captions[0] for captions in batch_captions])
+        for filename, sentence in zip(batch_files, sentences):
+          result = {}
+          result['image_id'] = _get_image_id(filename)
+          result['caption'] = sentence
+          writer.write(result)
+      if prefetcher:
+        prefetcher.close()
+      writer.close()
+      print("checkpoint %d time: %f" % (step, time.time() - t_start))
+    generator.log_decode_stats()
+
+
+if __name__ == "__main__":
+  tf.app.run()
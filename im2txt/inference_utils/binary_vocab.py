@@ -0,0 +1,193 @@
+# Copyright 2016 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Binary vocabulary format and a loader shared by both vocabulary formats.
+
+A binary vocabulary file holds, after an 8-byte magic and the number of words
+n (uint64), little-endian:
+
+  offsets     int64[n + 1]  byte offsets of the words in the blob,
+  counts      int64[n]      word counts,
+  sorted_ids  int32[n]      word ids sorted by the UTF-8 bytes of their words,
+  blob        the UTF-8 bytes of all words, in id order.
+
+The arrays of a local file are memory-mapped, so id_to_word() is a slice of
+the blob and word_to_id() a binary search over sorted_ids, without parsing the
+file. Files on other file systems of tf.gfile (e.g. gs://) are read into memory.
+
+Convert a word_counts.txt file with
+
+  python binary_vocab.py word_counts.txt word_counts.bin
+
+load_words() reads either format, so every --vocab_file flag accepts both.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import struct
+import sys
+
+import numpy as np
+import tensorflow as tf
+
+_MAGIC = b"IMVOCAB\x01"
+_HEADER_SIZE = len(_MAGIC) + 8
+
+
+def _to_native(word_bytes):
+  """Returns UTF-8 bytes as the native str type (bytes in python 2)."""
+  if str is bytes:
+    return word_bytes
+  return word_bytes.decode("utf-8")
+
+
+def _to_bytes(word):
+  if isinstance(word, bytes):
+    return word
+  return word.encode("utf-8")
+
+
+def is_binary_vocab(vocab_file):
+  """Returns whether vocab_file is in the binary format."""
+  with tf.gfile.GFile(vocab_file, mode="rb") as f:
+    return f.read(len(_MAGIC)) == _MAGIC
+
+
+def write_binary_vocab(words, counts, output_file):
+  """Writes a binary vocabulary file.
+
+  Args:
+    words: List of words (str or unicode), the word ids are their positions.
+    counts: List of word counts, or None.
+    output_file: Path of the file to write.
+  """
+  word_bytes = [_to_bytes(word) for word in words]
+  num_words = len(word_bytes)
+  offsets = np.zeros(num_words + 1, dtype="<i8")
+  offsets[1:] = np.cumsum([len(w) for w in word_bytes])
+  if counts is None:
+    counts = np.zeros(num_words, dtype="<i8")
+  sorted_ids = np.array(sorted(range(num_words), key=lambda i: word_bytes[i]),
+                        dtype="<i4").reshape(num_words)
+  with tf.gfile.GFile(output_file, mode="wb") as f:
+    f.write(_MAGIC)
+    f.write(struct.pack("<Q", num_words))
+    f.write(offsets.tobytes())
+    f.write(np.asarray(counts, dtype="<i8").tobytes())
+    f.write(sorted_ids.tobytes())
+    f.write(b"".join(word_bytes))
+
+
+class BinaryVocab(object):
+  """Memory-mapped binary vocabulary file."""
+
+  def __init__(self, vocab_file):
+    """Maps the arrays of the file.
+
+    Args:
+      vocab_file: A file written by write_binary_vocab(). np.memmap needs a
+        local file, so the arrays of a non-local file are read through gfile.
+    """
+    with tf.gfile.GFile(vocab_file, mode="rb") as f:
+      header = f.read(_HEADER_SIZE)
+    if header[:len(_MAGIC)] != _MAGIC:
+      raise ValueError("Not a binary vocabulary file: %s" % vocab_file)
+    num_words, = struct.unpack("<Q", header[len(_MAGIC):])
+    self.num_words = num_words
+
+    if "://" in vocab_file:
+      with tf.gfile.GFile(vocab_file, mode="rb") as f:
+        data = f.read()
+
+      def _map(dtype, count, offset):
+        return np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+    else:
+      def _map(dtype, count, offset):
+        return np.memmap(vocab_file, dtype=dtype, mode="r", offset=offset,
+                         shape=(count,))
+
+    offset = _HEADER_SIZE
+    self.offsets = _map("<i8", num_words + 1, offset)
+    offset += 8 * (num_words + 1)
+    self.counts = _map("<i8", num_words, offset)
+    offset += 8 * num_words
+    self.sorted_ids = _map("<i4", num_words, offset)
+    offset += 4 * num_words
+    self._blob = _map(np.uint8, int(self.offsets[-1]), offset)
+
+  def __len__(self):
+    return self.num_words
+
+  def _word_bytes(self, word_id):
+    return self._blob[self.offsets[word_id]:self.offsets[word_id + 1]].tobytes()
+
+  def id_to_word(self, word_id):
+    """Returns the word of an id in [0, len(self))."""
+    return _to_native(self._word_bytes(word_id))
+
+  def word_to_id(self, word):
+    """Returns the id of a word, or None if it is not in the vocabulary."""
+    key = _to_bytes(word)
+    lo, hi = 0, self.num_words
+    while lo < hi:
+      mid = (lo + hi) // 2
+      if self._word_bytes(self.sorted_ids[mid]) < key:
+        lo = mid + 1
+      else:
+        hi = mid
+    if lo < self.num_words and self._word_bytes(self.sorted_ids[lo]) == key:
+      return int(self.sorted_ids[lo])
+    return None
+
+  def words(self):
+    """Returns all words in id order."""
+    blob = self._blob.tobytes()
+    offsets = self.offsets.tolist()
+    return [_to_native(blob[offsets[i]:offsets[i + 1]])
+            for i in range(self.num_words)]
+
+
+def load_words(vocab_file):
+  """Reads the words and counts of a vocabulary file in either format.
+
+  Args:
+    vocab_file: A binary vocabulary file, or a text file where the words are
+      the first whitespace-separated token on each line, optionally followed
+      by their count, and the word ids are the line numbers.
+
+  Returns:
+    words: List of words (native str), in id order.
+    counts: List of word counts, 0 where a text line has none.
+  """
+  if is_binary_vocab(vocab_file):
+    vocab = BinaryVocab(vocab_file)
+    return vocab.words(), vocab.counts.tolist()
+  words = []
+  counts = []
+  with tf.gfile.GFile(vocab_file, mode="r") as f:
+    for line in f:
+      parts = line.split()
+      words.append(parts[0])
+      counts.append(int(parts[1]) if len(parts) > 1 else 0)
+  return words, counts
+
+
+if __name__ == "__main__":
+  if len(sys.argv) != 3:
+    sys.exit("Usage: python binary_vocab.py <word_counts.txt> <output.bin>")
+  _words, _counts = load_words(sys.argv[1])
+  write_binary_vocab(_words, _counts, sys.argv[2])
+  print("Wrote %d words to %s" % (len(_words), sys.argv[2]))
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Unit tests for the binary vocabulary format."""
+
+import io
+import os
+
+import tensorflow as tf
+
+from im2txt.inference_utils import binary_vocab
+from im2txt.inference_utils import vocabulary
+
+
+class BinaryVocabTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(BinaryVocabTest, self).setUp()
+    self._text_file = os.path.join(self.get_temp_dir(), "word_counts.txt")
+    with io.open(self._text_file, "w", encoding="utf-8") as f:
+      f.write(u"的 50\n<S> 40\n</S> 40\n一个 30\n男人 7\n")
+    self._binary_file = os.path.join(self.get_temp_dir(), "word_counts.bin")
+    words, counts = binary_vocab.load_words(self._text_file)
+    binary_vocab.write_binary_vocab(words, counts, self._binary_file)
+
+  def testLoadWordsIsTheSameForBothFormats(self):
+    self.assertFalse(binary_vocab.is_binary_vocab(self._text_file))
+    self.assertTrue(binary_vocab.is_binary_vocab(self._binary_file))
+    self.assertEqual(binary_vocab.load_words(self._text_file),
+                     binary_vocab.load_words(self._binary_file))
+    _, counts = binary_vocab.load_words(self._binary_file)
+    self.assertEqual([50, 40, 40, 30, 7], counts)
+
+  def testLookups(self):
+    words, _ = binary_vocab.load_words(self._text_file)
+    vocab = binary_vocab.BinaryVocab(self._binary_file)
+    self.assertEqual(len(words), len(vocab))
+    for word_id, word in enumerate(words):
+      self.assertEqual(word, vocab.id_to_word(word_id))
+      self.assertEqual(word_id, vocab.word_to_id(word))
+    self.assertIsNone(vocab.word_to_id("<UNK>"))
+    self.assertIsNone(vocab.word_to_id(""))
+
+  def testVocabularyIsTheSameForBothFormats(self):
+    text_vocab = vocabulary.Vocabulary(self._text_file)
+    vocab = vocabulary.Vocabulary(self._binary_file)
+    self.assertEqual(
+        (text_vocab.start_id, text_vocab.end_id, text_vocab.unk_id),
+        (vocab.start_id, vocab.end_id, vocab.unk_id))
+    for word in [u"的", u"一个", u"男人", u"女人", "<UNK>"]:
+      self.assertEqual(text_vocab.word_to_id(word), vocab.word_to_id(word))
+    for word_id in range(8):
+      self.assertEqual(text_vocab.id_to_word(word_id),
+                       vocab.id_to_word(word_id))
+    word_ids = [[1, 3, 4, 0, 7], [1, 4, 2, 3, -1]]
+    self.assertEqual(text_vocab.decode_batch(word_ids),
+                     vocab.decode_batch(word_ids))
+    self.assertEqual(text_vocab.decode_batch(word_ids, separator=" "),
+                     vocab.decode_batch(word_ids, separator=" "))
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -19,13 +19,15 @@ from __future__ import division
 from __future__ import print_function
 
 import heapq
-import math
+import time
 
 import tensorflow as tf
 FLAGS = tf.flags.FLAGS
 
 import numpy as np
 
+from . import stage_timer
+
 
 class Caption(object):
   """Represents a complete or partial caption."""
@@ -110,6 +112,45 @@ class TopN(object):
     self._data = []
 
 
+def _get_ingraph_captions(predicted_ids):
+  """Converts the in-graph beam search output of one image to captions.
+
+  Args:
+    predicted_ids: A numpy array of shape [beam_width, max_caption_length].
+
+  Returns:
+    A list of beam_width captions, each a list of word ids without the start
+    word, cut at the end word.
+  """
+  final_captions = []
+  for caption in predicted_ids:
+    partial_caption = []
+    for word_id in caption:
+      if word_id != FLAGS.end_token:
+        if word_id >= 0 and word_id != FLAGS.start_token:
+          partial_caption.append(word_id)
+      else:
+        break
+    final_captions.append(partial_caption)
+  return final_captions
+
+
+def _top_k_indices(scores, k):
+  """Returns the column indices of the k largest entries of each row.
+
+  Ties are broken in favour of the lower column, i.e. the candidate extending
+  the better ranked hypothesis.
+
+  Args:
+    scores: A numpy array of shape [batch_size, n].
+    k: Number of indices to keep per row.
+
+  Returns:
+    A numpy array of shape [batch_size, min(k, n)], sorted by descending score.
+  """
+  return np.argsort(-scores, axis=1, kind="mergesort")[:, :k]
+
+
 class CaptionGenerator(object):
   """Class to generate captions from an image-to-text model."""
 
@@ -118,7 +159,8 @@ class CaptionGenerator(object):
                vocab,
                beam_size=3,
                max_caption_length=20,
-               length_normalization_factor=0.0):
+               length_normalization_factor=0.0,
+               timer=None):
     """Initializes the generator.
 
     Args:
@@ -132,6 +174,8 @@ class CaptionGenerator(object):
         scored by logprob/length^x, rather than logprob. This changes the
         relative scores of captions depending on their lengths. For example, if
         x > 0 then longer captions will be favored.
+      timer: An optional StageTimer receiving the time of the session runs and
+        of the beam bookkeeping.
     """
     self.vocab = vocab
     self.model = model
@@ -139,36 +183,68 @@ class CaptionGenerator(object):
     self.beam_size = beam_size
     self.max_caption_length = max_caption_length
     self.length_normalization_factor = length_normalization_factor
+    self.timer = timer or stage_timer.StageTimer(enabled=False)
+
+    # Number of in-graph decoder runs and decode steps they saved.
+    self.num_ingraph_runs = 0
+    self.ingraph_steps_saved = 0
+
+  def _run_ingraph(self, sess, fetches, feed_dict=None):
+    """Runs an in-graph decoder and counts the decode steps it saved."""
+    if not hasattr(self.model, "decode_steps_saved"):
+      with self.timer.stage("ingraph_decode"):
+        return sess.run(fetches, feed_dict=feed_dict)
+    with self.timer.stage("ingraph_decode"):
+      results = sess.run([fetches, self.model.decode_steps_saved],
+                         feed_dict=feed_dict)
+    self.num_ingraph_runs += 1
+    self.ingraph_steps_saved += results[1]
+    return results[0]
+
+  def log_decode_stats(self):
+    """Logs the average number of decode steps saved per in-graph run."""
+    if self.num_ingraph_runs:
+      tf.logging.info("Saved %.2f decode steps per batch on average over %d "
+                      "batches.", self.ingraph_steps_saved /
+                      float(self.num_ingraph_runs), self.num_ingraph_runs)
+
+  def batched_beam_search_ids(self, sess):
+    """Runs the in-graph beam search decoder on a batch of the test reader.
+
+    The padding of the final batch of the test reader is dropped, so the
+    batch may be smaller than the batch size.
+
+    Args:
+      sess: TensorFlow Session object.
+
+    Returns:
+      image_names: The names of the images of the batch.
+      predicted_ids: A numpy array of shape [batch_size, beam_width,
+        max_caption_length] with the word ids of the beams, e.g. for
+        Vocabulary.decode_batch().
+    """
+    predicted_ids, image_names, image_valid = self._run_ingraph(
+        sess, [self.model.predicted_ids, self.model.image_names,
+               self.model.image_valid])
+    with self.timer.stage("beam_bookkeeping"):
+      predicted_ids = np.transpose(predicted_ids, (0,2,1))
+      return image_names[image_valid], predicted_ids[image_valid]
 
   def batched_beam_search(self, sess):
-    """Runs beam search caption generation on a single image.
+    """Runs the in-graph beam search decoder on a batch of the test reader.
 
     Args:
       sess: TensorFlow Session object.
-      encoded_image: An encoded image string.
 
     Returns:
-      A list of Caption sorted by descending score.
+      image_names: The names of the images of the batch.
+      final_captions: A list with one entry per image, each a list of
+        captions (lists of word ids) in beam order.
     """
-    predicted_ids, image_names, scores = sess.run([self.model.predicted_ids, 
-                                                   self.model.image_names,
-                                                   self.model.scores])
-    predicted_ids = np.transpose(predicted_ids, (0,2,1))   
-    scores = np.transpose(scores, (0,2,1))
-
-    final_captions = []
-    for captions in predicted_ids:
-      partial_captions = []
-      for caption in captions:
-        partial_caption = []
-        for word_id in caption:
-          if word_id != FLAGS.end_token:
-            if word_id >= 0 and word_id != FLAGS.start_token:
-              partial_caption.append(word_id)
-          else:
-            break
-        partial_captions.append(partial_caption)
-      final_captions.append(partial_captions)
+    image_names, predicted_ids = self.batched_beam_search_ids(sess)
+    with self.timer.stage("beam_bookkeeping"):
+      final_captions = [_get_ingraph_captions(captions)
+                        for captions in predicted_ids]
     return image_names, final_captions
 
   def beam_search(self, sess, encoded_image):
@@ -182,89 +258,248 @@ class CaptionGenerator(object):
       A list of Caption sorted by descending score.
     """
     if self.model.support_ingraph():
-      predicted_ids, scores = sess.run(
-        [self.model.predicted_ids, self.model.scores], 
-        feed_dict={"image_feed:0": encoded_image})
-      predicted_ids = np.transpose(predicted_ids, (0,2,1))   
-      scores = np.transpose(scores, (0,2,1))
-
-      final_captions = []
-      for caption in predicted_ids[0]:
-        partial_caption = []
-        for word_id in caption:
-          if word_id != FLAGS.end_token:
-            if word_id >= 0 and word_id != FLAGS.start_token:
-              partial_caption.append(word_id)
-          else:
-            break
-        final_captions.append(partial_caption)
+      final_captions = self._ingraph_beam_search(sess, [encoded_image])[0]
+
+    else:
+      # The original out-graph inference, run through the vectorized search.
+      final_captions = [c.sentence[1:-1] for c in
+                        self.vectorized_beam_search(sess, [encoded_image])[0]]
+
+    return final_captions
+
+  def beam_search_batch(self, sess, encoded_images, with_scores=False):
+    """Runs beam search caption generation on a batch of images.
+
+    Args:
+      sess: TensorFlow Session object.
+      encoded_images: A list of encoded image strings.
+      with_scores: Whether to return the score of each caption.
+
+    Returns:
+      A list with one entry per image, each a list of captions (lists of word
+      ids without the start and end words) sorted by descending score. With
+      with_scores, each caption is a (caption, score) pair.
+    """
+    if self.model.support_ingraph():
+      if self.model.support_batched_image_feed():
+        return self._ingraph_beam_search(sess, encoded_images, with_scores)
+      return [self._ingraph_beam_search(sess, [image], with_scores)[0]
+              for image in encoded_images]
+    if with_scores:
+      return [[(c.sentence[1:-1], c.score) for c in captions]
+              for captions in self.vectorized_beam_search(sess, encoded_images)]
+    return [[c.sentence[1:-1] for c in captions]
+            for captions in self.vectorized_beam_search(sess, encoded_images)]
+
+  def _ingraph_beam_search(self, sess, encoded_images, with_scores=False):
+    """Runs the in-graph beam search decoder.
+
+    Args:
+      sess: TensorFlow Session object.
+      encoded_images: A list of encoded image strings. Unless the graph takes
+        a batched image_feed, it must contain a single image.
+      with_scores: Whether to pair each caption with its final beam score.
 
+    Returns:
+      A list with one entry per image, each a list of captions (lists of word
+      ids) in beam order, or of (caption, score) pairs.
+    """
+    if self.model.support_batched_image_feed():
+      image_feed = encoded_images
     else:
-      # The original out-graph inference
-      # Feed in the image to get the initial state.
-      initial_state = self.model.feed_image(sess, encoded_image)
-
-      initial_beam = Caption(
-          sentence=[self.vocab.start_id],
-          state=initial_state[0],
-          logprob=0.0,
-          score=0.0,
-          metadata=[""])
-      partial_captions = TopN(self.beam_size)
-      partial_captions.push(initial_beam)
-      complete_captions = TopN(self.beam_size)
-
-      # Run beam search.
-      for _ in range(self.max_caption_length - 1):
-        partial_captions_list = partial_captions.extract()
-        partial_captions.reset()
-        input_feed = np.array([c.sentence[-1] for c in partial_captions_list])
-        state_feed = np.array([c.state for c in partial_captions_list])
-
-        softmax, new_states, metadata = self.model.inference_step(sess,
-                                                                  input_feed,
-                                                                  state_feed,
-                                                                  encoded_image=encoded_image,
-                                                                  use_attention=False)
-
-        for i, partial_caption in enumerate(partial_captions_list):
-          word_probabilities = softmax[i]
-          state = new_states[i]
-          # For this partial caption, get the beam_size most probable next words.
-          words_and_probs = list(enumerate(word_probabilities))
-          words_and_probs.sort(key=lambda x: -x[1])
-          words_and_probs = words_and_probs[0:self.beam_size]
-          # Each next word gives a new partial caption.
-          for w, p in words_and_probs:
-            if p < 1e-12:
-              continue  # Avoid log(0).
-            sentence = partial_caption.sentence + [w]
-            logprob = partial_caption.logprob + math.log(p)
-            score = logprob
-            if metadata:
-              metadata_list = partial_caption.metadata + [metadata[i]]
-            else:
-              metadata_list = None
-            if w == self.vocab.end_id:
-              if self.length_normalization_factor > 0:
-                score /= len(sentence)**self.length_normalization_factor
-              beam = Caption(sentence, state, logprob, score, metadata_list)
-              complete_captions.push(beam)
-            else:
-              beam = Caption(sentence, state, logprob, score, metadata_list)
-              partial_captions.push(beam)
-        if partial_captions.size() == 0:
-          # We have run out of partial candidates; happens when beam_size = 1.
-          break
-
-      # If we have no complete captions then fall back to the partial captions.
-      # But never output a mixture of complete and partial captions because a
-      # partial caption could have a higher score than all the complete captions.
-      if not complete_captions.size():
-        complete_captions = partial_captions
-
-      final_captions = [item.sentence[1:-1] for item in complete_captions.extract(sort=True)]
+      assert len(encoded_images) == 1
+      image_feed = encoded_images[0]
+    predicted_ids, scores = self._run_ingraph(
+      sess, [self.model.predicted_ids, self.model.scores], 
+      feed_dict={"image_feed:0": image_feed})
+    with self.timer.stage("beam_bookkeeping"):
+      predicted_ids = np.transpose(predicted_ids, (0,2,1))
+      final_captions = [_get_ingraph_captions(captions)
+                        for captions in predicted_ids]
+      if with_scores:
+        # The scores of the last step are the final scores of the beams.
+        final_scores = scores[:, -1, :]
+        final_captions = [list(zip(captions, image_scores.tolist()))
+                          for captions, image_scores
+                          in zip(final_captions, final_scores)]
+    return final_captions
+
+  def beam_search_features(self, sess, image_features):
+    """Runs the in-graph beam search decoder on precomputed image features.
 
+    The model must be built with image_feature_shapes, see Im2TxtModel.
+
+    Args:
+      sess: TensorFlow Session object.
+      image_features: A list of arrays of shape [batch_size] + feature_shape,
+        one per image model output, e.g. from FeatureStore.get().
+
+    Returns:
+      A list with one entry per image, each a list of captions (lists of word
+      ids) in beam order.
+    """
+    feed_dict = dict(("image_feature_feed_%d:0" % i, feature)
+                     for i, feature in enumerate(image_features))
+    predicted_ids = self._run_ingraph(sess, self.model.predicted_ids,
+                                      feed_dict=feed_dict)
+    predicted_ids = np.transpose(predicted_ids, (0,2,1))   
+    return [_get_ingraph_captions(captions) for captions in predicted_ids]
+
+  def vectorized_beam_search(self, sess, encoded_images):
+    """Runs out-of-graph beam search caption generation on a batch of images.
+
+    All live hypotheses of all images are advanced together, so each time step
+    costs a single inference_step() call of at most
+    len(encoded_images) * beam_size rows. Hypotheses are kept in arrays of word
+    ids with back-pointers to their parent slot in the previous step; sentences
+    are only assembled once the search is over. If the model supports stateful
+    decoding, the states stay in the session and a step only feeds word ids
+    and row indices.
+
+    Args:
+      sess: TensorFlow Session object.
+      encoded_images: A list of encoded image strings.
+
+    Returns:
+      A list with one entry per image, each a list of Caption sorted by
+      descending score. The Caption state is not kept.
+    """
+    num_images = len(encoded_images)
+    beam_size = self.beam_size
+    end_id = self.vocab.end_id
+    image_range = np.arange(num_images)[:, None]
+
+    # Feed in the images to get the initial states, [num_images, state_size].
+    # A stateful model keeps them in the session instead, and states holds the
+    # row of the stored state of each hypothesis.
+    stateful = self.model.support_stateful_decoding()
+    with self.timer.stage("image_feed"):
+      if stateful:
+        self.model.start_decoding(sess, encoded_images)
+        states = np.arange(num_images)
+      else:
+        states = np.concatenate(
+            [self.model.feed_image(sess, image) for image in encoded_images],
+            axis=0)
+
+    # Hypotheses of the current step, [num_images, width]. Empty slots have a
+    # logprob of -inf. Only the start hypothesis exists at the first step.
+    words = np.full([num_images, 1], self.vocab.start_id, dtype=np.int64)
+    logprobs = np.zeros([num_images, 1])
+    step_words = [words]
+    step_parents = [None]
+
+    # The best complete captions found so far, [num_images, beam_size]. A
+    # complete caption is the end word appended to slot complete_slots of
+    # step complete_steps.
+    complete_scores = np.full([num_images, beam_size], -np.inf)
+    complete_logprobs = np.full([num_images, beam_size], -np.inf)
+    complete_steps = np.zeros([num_images, beam_size], dtype=np.int64)
+    complete_slots = np.zeros([num_images, beam_size], dtype=np.int64)
+
+    active = np.ones([num_images], dtype=bool)
+
+    # Run beam search.
+    for step in range(self.max_caption_length - 1):
+      width = words.shape[1]
+      rows = np.flatnonzero((active[:, None] & np.isfinite(logprobs)).ravel())
+      with self.timer.stage("decoder_step"):
+        if stateful:
+          softmax = self.model.inference_step_stateful(
+              sess, words.ravel()[rows], states[rows], rows // width)
+          new_states = np.arange(len(rows))
+        else:
+          softmax, new_states, _ = self.model.inference_step(
+              sess, words.ravel()[rows], states[rows],
+              encoded_image=None, use_attention=False)
+      t_bookkeeping = time.time()
+
+      # For each fed hypothesis, get the beam_size most probable next words.
+      k = min(beam_size, softmax.shape[1])
+      row_range = np.arange(len(rows))[:, None]
+      top_words = np.argpartition(-softmax, k - 1, axis=1)[:, :k]
+      top_probs = softmax[row_range, top_words]
+      top_logprobs = np.log(np.maximum(top_probs, 1e-12))
+      top_logprobs[top_probs < 1e-12] = -np.inf  # Avoid log(0).
+      top_logprobs += logprobs.ravel()[rows][:, None]
+
+      # Scatter the candidates back to [num_images, width * k].
+      columns = (rows % width)[:, None] * k + np.arange(k)
+      candidate_logprobs = np.full([num_images, width * k], -np.inf)
+      candidate_logprobs[(rows // width)[:, None], columns] = top_logprobs
+      candidate_words = np.zeros([num_images, width * k], dtype=np.int64)
+      candidate_words[(rows // width)[:, None], columns] = top_words
+      is_end = candidate_words == end_id
+
+      # Candidates ending with the end word go to the complete captions.
+      end_logprobs = np.where(is_end, candidate_logprobs, -np.inf)
+      end_scores = end_logprobs
+      if self.length_normalization_factor > 0:
+        end_scores = end_logprobs / (step + 2)**self.length_normalization_factor
+      merged_scores = np.concatenate([complete_scores, end_scores], axis=1)
+      best = _top_k_indices(merged_scores, beam_size)
+      complete_scores = merged_scores[image_range, best]
+      complete_logprobs = np.concatenate(
+          [complete_logprobs, end_logprobs], axis=1)[image_range, best]
+      complete_steps = np.concatenate(
+          [complete_steps, np.full(end_scores.shape, step, dtype=np.int64)],
+          axis=1)[image_range, best]
+      complete_slots = np.concatenate(
+          [complete_slots, np.tile(np.arange(width * k) // k, (num_images, 1))],
+          axis=1)[image_range, best]
+
+      # The other candidates become the partial captions of the next step.
+      partial_logprobs = np.where(is_end, -np.inf, candidate_logprobs)
+      best = _top_k_indices(partial_logprobs, beam_size)
+      logprobs = partial_logprobs[image_range, best]
+      words = candidate_words[image_range, best]
+      parents = best // k
+      row_of_slot = np.zeros([num_images * width], dtype=np.int64)
+      row_of_slot[rows] = np.arange(len(rows))
+      states = new_states[row_of_slot[(image_range * width + parents).ravel()]]
+      step_words.append(words)
+      step_parents.append(parents)
+      self.timer.add("beam_bookkeeping", time.time() - t_bookkeeping)
+
+      # An image is done when it has run out of partial captions or, without
+      # length normalization, when its best partial caption can no longer
+      # beat the worst of beam_size complete captions.
+      active &= np.isfinite(logprobs).any(axis=1)
+      if self.length_normalization_factor <= 0:
+        active &= ~(logprobs.max(axis=1) <= complete_scores.min(axis=1))
+      if not active.any():
+        # We have run out of partial candidates; happens when beam_size = 1.
+        break
+
+    def _sentence(i, step, slot):
+      sentence = []
+      while step >= 0:
+        sentence.append(int(step_words[step][i, slot]))
+        if step:
+          slot = step_parents[step][i, slot]
+        step -= 1
+      return sentence[::-1]
+
+    final_captions = []
+    for i in range(num_images):
+      captions = []
+      complete = np.isfinite(complete_scores[i])
+      if complete.any():
+        for j in np.flatnonzero(complete):
+          sentence = _sentence(i, complete_steps[i, j], complete_slots[i, j])
+          captions.append(Caption(sentence + [end_id], None,
+                                  complete_logprobs[i, j], complete_scores[i, j]))
+      else:
+        # If we have no complete captions then fall back to the partial
+        # captions. But never output a mixture of complete and partial
+        # captions because a partial caption could have a higher score than
+        # all the complete captions.
+        last_step = len(step_words) - 1
+        for j in np.flatnonzero(np.isfinite(logprobs[i])):
+          captions.append(Caption(_sentence(i, last_step, j), None,
+                                  logprobs[i, j], logprobs[i, j]))
+      captions.sort(key=lambda c: -c.score)
+      final_captions.append(captions)
     return final_captions
 
   def predict_attributes(self, sess, encoded_image):
@@ -277,6 +512,8 @@ class CaptionGenerator(object):
     Returns:
       A list of attributes and probabilities sorted by descending score,.
     """
+    if self.model.support_batched_image_feed():
+      encoded_image = [encoded_image]
     top_n_attributes = sess.run(self.model.top_n_attributes, feed_dict={"image_feed:0": encoded_image})
     attr_probs, attr_ids = top_n_attributes
     return attr_ids[0], attr_probs[0]
@@ -72,7 +72,8 @@ class FakeModel(object):
     # Return a nominal model state.
     return np.zeros([1, self._state_size])
 
-  def inference_step(self, sess, input_feed, state_feed):
+  def inference_step(self, sess, input_feed, state_feed, encoded_image=None,
+                     use_attention=False):
     # Compute the matrix of softmax distributions for the next batch of words.
     batch_size = input_feed.shape[0]
     softmax_output = np.zeros([batch_size, self._vocab_size])
@@ -86,16 +87,54 @@ class FakeModel(object):
 
     return softmax_output, new_state, metadata
 
+  def support_ingraph(self):
+    return False
+
+  def support_stateful_decoding(self):
+    return False
+
   # pylint: enable=unused-argument
 
 
+class FakeStatefulModel(FakeModel):
+  """Fake model keeping its states, the last fed word ids, in "the session"."""
+
+  def __init__(self):
+    super(FakeStatefulModel, self).__init__()
+    self._stored_states = None
+    self._num_images = 0
+
+  def support_stateful_decoding(self):
+    return True
+
+  def start_decoding(self, sess, encoded_images):
+    self._num_images = len(encoded_images)
+    self._stored_states = np.full([self._num_images], -1)
+
+  def inference_step_stateful(self, sess, input_feed, beam_indices,
+                              image_indices):
+    # Each word must follow the word of the hypothesis it continues.
+    for word_id, parent_word_id in zip(input_feed,
+                                       self._stored_states[beam_indices]):
+      if parent_word_id < 0:
+        assert word_id == 0
+      else:
+        assert word_id in self._probabilities[parent_word_id]
+    assert np.all((0 <= image_indices) & (image_indices < self._num_images))
+    self._stored_states = np.array(input_feed)
+    softmax_output, _, _ = self.inference_step(sess, input_feed, None)
+    return softmax_output
+
+
 class CaptionGeneratorTest(tf.test.TestCase):
 
   def _assertExpectedCaptions(self,
                               expected_captions,
                               beam_size=3,
                               max_caption_length=20,
-                              length_normalization_factor=0):
+                              length_normalization_factor=0,
+                              num_images=1,
+                              model=None):
     """Tests that beam search generates the expected captions.
 
     Args:
@@ -104,24 +143,29 @@ class CaptionGeneratorTest(tf.test.TestCase):
       beam_size: Parameter passed to beam_search().
       max_caption_length: Parameter passed to beam_search().
       length_normalization_factor: Parameter passed to beam_search().
+      num_images: Number of identical images searched in one batch.
+      model: The model, FakeModel() by default.
     """
     expected_sentences = [c[0] for c in expected_captions]
     expected_probabilities = [c[1] for c in expected_captions]
 
     # Generate captions.
     generator = caption_generator.CaptionGenerator(
-        model=FakeModel(),
+        model=model or FakeModel(),
         vocab=FakeVocab(),
         beam_size=beam_size,
         max_caption_length=max_caption_length,
         length_normalization_factor=length_normalization_factor)
-    actual_captions = generator.beam_search(sess=None, encoded_image=None)
+    batch_captions = generator.vectorized_beam_search(
+        sess=None, encoded_images=[None] * num_images)
+    self.assertEqual(num_images, len(batch_captions))
 
-    actual_sentences = [c.sentence for c in actual_captions]
-    actual_probabilities = [math.exp(c.logprob) for c in actual_captions]
+    for actual_captions in batch_captions:
+      actual_sentences = [c.sentence for c in actual_captions]
+      actual_probabilities = [math.exp(c.logprob) for c in actual_captions]
 
-    self.assertEqual(expected_sentences, actual_sentences)
-    self.assertAllClose(expected_probabilities, actual_probabilities)
+      self.assertEqual(expected_sentences, actual_sentences)
+      self.assertAllClose(expected_probabilities, actual_probabilities)
 
   def testBeamSize(self):
     # Beam size = 1.
@@ -173,6 +217,47 @@ class CaptionGeneratorTest(tf.test.TestCase):
     self._assertExpectedCaptions(
         expected, beam_size=4, length_normalization_factor=3)
 
+  def testBatch(self):
+    expected = [
+        ([0, 2, 6, 1], 0.18), ([0, 4, 10, 1], 0.16), ([0, 3, 8, 1], 0.15)
+    ]
+    self._assertExpectedCaptions(expected, beam_size=3, num_images=4)
+
+    expected = [
+        ([0, 4, 9, 11, 1], 0.06),
+        ([0, 2, 6, 1], 0.18),
+        ([0, 4, 10, 1], 0.16),
+        ([0, 3, 8, 1], 0.15),
+    ]
+    self._assertExpectedCaptions(
+        expected, beam_size=4, length_normalization_factor=3, num_images=2)
+
+  def testStatefulDecoding(self):
+    expected = [
+        ([0, 2, 6, 1], 0.18), ([0, 4, 10, 1], 0.16), ([0, 3, 8, 1], 0.15)
+    ]
+    self._assertExpectedCaptions(expected, beam_size=3, num_images=3,
+                                 model=FakeStatefulModel())
+
+    expected = [
+        ([0, 4, 9, 11, 1], 0.06),
+        ([0, 2, 6, 1], 0.18),
+        ([0, 4, 10, 1], 0.16),
+        ([0, 3, 8, 1], 0.15),
+    ]
+    self._assertExpectedCaptions(
+        expected, beam_size=4, length_normalization_factor=3, num_images=2,
+        model=FakeStatefulModel())
+
+  def testBeamSearchStripsStartAndEnd(self):
+    generator = caption_generator.CaptionGenerator(
+        model=FakeModel(), vocab=FakeVocab(), beam_size=2)
+    self.assertEqual([[4, 10], [3, 8]],
+                     generator.beam_search(sess=None, encoded_image=None))
+    self.assertEqual([[[4, 10], [3, 8]]] * 2,
+                     generator.beam_search_batch(sess=None,
+                                                 encoded_images=[None, None]))
+
 
 if __name__ == '__main__':
   tf.test.main()
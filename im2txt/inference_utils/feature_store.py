@@ -0,0 +1,120 @@
+# Copyright 2016 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""On-disk store of precomputed image model outputs, keyed by image id.
+
+A store is a directory with one .npy file per image model output (e.g. the
+pooled and the spatial Inception features when --inception_return_tuple is
+set), each of shape [num_images] + feature_shape, and a features.json holding
+the image ids (row order) and the feature shapes. The .npy files are opened
+memory-mapped, so a store larger than memory can be read in batches.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+
+import numpy as np
+
+_METADATA_FILE = "features.json"
+
+
+def _feature_file(directory, index):
+  return os.path.join(directory, "feature_%d.npy" % index)
+
+
+class FeatureStoreWriter(object):
+  """Writes image model outputs into a new feature store."""
+
+  def __init__(self, directory, image_ids, feature_shapes, dtype="float32"):
+    """Creates the memory-mapped arrays of the store.
+
+    Args:
+      directory: Directory of the store; created if needed.
+      image_ids: List of image ids, in the order rows will be written.
+      feature_shapes: List of per-image shapes, one per image model output.
+      dtype: Numpy dtype of the stored features.
+    """
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+    self.directory = directory
+    self.image_ids = list(image_ids)
+    self.feature_shapes = [list(shape) for shape in feature_shapes]
+    self._arrays = [
+        np.lib.format.open_memmap(_feature_file(directory, i), mode="w+",
+                                  dtype=dtype,
+                                  shape=tuple([len(self.image_ids)] + shape))
+        for i, shape in enumerate(self.feature_shapes)]
+
+  def write(self, start, features):
+    """Writes the features of rows [start, start + batch_size).
+
+    Args:
+      start: Row of the first image of the batch.
+      features: List of arrays of shape [batch_size] + feature_shape, one per
+        image model output.
+    """
+    for array, feature in zip(self._arrays, features):
+      array[start:start + len(feature)] = feature
+
+  def close(self):
+    """Flushes the arrays and writes the metadata, which marks the store as
+    complete."""
+    for array in self._arrays:
+      array.flush()
+    self._arrays = []
+    with open(os.path.join(self.directory, _METADATA_FILE), "w") as f:
+      json.dump({"image_ids": self.image_ids,
+                 "feature_shapes": self.feature_shapes}, f)
+
+
+class FeatureStore(object):
+  """Reads image model outputs from a feature store."""
+
+  def __init__(self, directory):
+    """Opens the store memory-mapped.
+
+    Args:
+      directory: Directory of a store written by FeatureStoreWriter.
+    """
+    with open(os.path.join(directory, _METADATA_FILE)) as f:
+      metadata = json.load(f)
+    self.image_ids = metadata["image_ids"]
+    self.feature_shapes = metadata["feature_shapes"]
+    self._rows = dict((image_id, i) for i, image_id in enumerate(self.image_ids))
+    self._arrays = [np.load(_feature_file(directory, i), mmap_mode="r")
+                    for i in range(len(self.feature_shapes))]
+
+  def __len__(self):
+    return len(self.image_ids)
+
+  def __contains__(self, image_id):
+    return image_id in self._rows
+
+  def get(self, image_ids):
+    """Returns the features of a batch of images.
+
+    Args:
+      image_ids: List of image ids in the store.
+
+    Returns:
+      A list of float32 arrays of shape [len(image_ids)] + feature_shape, one
+      per image model output.
+    """
+    rows = np.array([self._rows[image_id] for image_id in image_ids],
+                    dtype=np.int64)
+    return [np.asarray(array[rows], dtype=np.float32) for array in self._arrays]
@@ -0,0 +1,143 @@
+# Copyright 2016 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Reads encoded images ahead of the inference loop on a pool of threads.
+
+The file reads of the next queue_depth images run while the session decodes the
+current ones, so sess.run() does not wait on the filesystem. Images are
+returned in the order of the file list. The prefetcher counts how often the
+consumer still had to wait for an image (starvation), which tells whether
+num_threads or queue_depth should be raised.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import threading
+import time
+
+try:
+  import queue
+except ImportError:
+  import Queue as queue
+
+import tensorflow as tf
+
+tf.flags.DEFINE_integer("num_read_threads", 4,
+                        "Number of threads reading image files ahead of inference.")
+tf.flags.DEFINE_integer("prefetch_queue_depth", 32,
+                        "Maximum number of encoded images read ahead of inference.")
+
+
+def _read_image(filename):
+  with tf.gfile.GFile(filename, "r") as f:
+    return f.read()
+
+
+class ImagePrefetcher(object):
+  """Reads encoded images ahead of the consumer on a pool of threads."""
+
+  def __init__(self, filenames, num_threads=4, queue_depth=32, timer=None):
+    """Starts the reader threads.
+
+    Args:
+      filenames: List of image files, in the order they are consumed.
+      num_threads: Number of reader threads.
+      queue_depth: Maximum number of images read but not yet consumed,
+        including the ones being read.
+      timer: An optional StageTimer receiving the time of each file read and
+        of each wait of the consumer.
+    """
+    self.filenames = list(filenames)
+    self._timer = timer
+
+    # Number of times the consumer had to wait for an image, and for how long.
+    self.starved_count = 0
+    self.starved_seconds = 0.0
+
+    self._slots = threading.Semaphore(max(queue_depth, 1))
+    self._tasks = queue.Queue()
+    for task in enumerate(self.filenames):
+      self._tasks.put(task)
+    self._results = {}
+    self._cond = threading.Condition()
+    self._stopped = False
+
+    self._threads = []
+    for _ in range(max(num_threads, 1)):
+      thread = threading.Thread(target=self._read_loop)
+      thread.daemon = True
+      thread.start()
+      self._threads.append(thread)
+
+  def _read_loop(self):
+    while True:
+      # Tasks are taken in order, so holding a slot bounds the read-ahead.
+      self._slots.acquire()
+      if self._stopped:
+        return
+      try:
+        index, filename = self._tasks.get_nowait()
+      except queue.Empty:
+        self._slots.release()
+        return
+      t_start = time.time()
+      try:
+        result = (_read_image(filename), None)
+        if self._timer:
+          self._timer.add("file_read", time.time() - t_start)
+      except Exception as e:  # pylint: disable=broad-except
+        result = (None, e)
+      with self._cond:
+        self._results[index] = result
+        self._cond.notify_all()
+
+  def __iter__(self):
+    """Yields (filename, encoded_image) pairs in the order of the file list."""
+    for index, filename in enumerate(self.filenames):
+      with self._cond:
+        if index not in self._results:
+          self.starved_count += 1
+          t_start = time.time()
+          while index not in self._results:
+            self._cond.wait()
+          self.starved_seconds += time.time() - t_start
+          if self._timer:
+            self._timer.add("file_read_wait", time.time() - t_start)
+        encoded_image, error = self._results.pop(index)
+      self._slots.release()
+      if error is not None:
+        raise error
+      yield filename, encoded_image
+
+  def batches(self, batch_size):
+    """Yields (filenames, encoded_images) lists of at most batch_size images."""
+    batch_files, batch_images = [], []
+    for filename, encoded_image in self:
+      batch_files.append(filename)
+      batch_images.append(encoded_image)
+      if len(batch_files) == batch_size:
+        yield batch_files, batch_images
+        batch_files, batch_images = [], []
+    if batch_files:
+      yield batch_files, batch_images
+
+  def close(self):
+    """Stops the reader threads and logs the starvation counters."""
+    self._stopped = True
+    for _ in self._threads:
+      self._slots.release()
+    tf.logging.info("Image prefetch starved %d times for %.3f seconds in total.",
+                    self.starved_count, self.starved_seconds)
@@ -0,0 +1,77 @@
+# Copyright 2016 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Unit tests for ImagePrefetcher."""
+
+import os
+
+import tensorflow as tf
+
+from im2txt.inference_utils import image_prefetcher
+
+
+class ImagePrefetcherTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(ImagePrefetcherTest, self).setUp()
+    self._files = []
+    for i in range(7):
+      filename = os.path.join(self.get_temp_dir(), "image_%d.jpg" % i)
+      with open(filename, "wb") as f:
+        f.write(b"image %d" % i)
+      self._files.append(filename)
+
+  def _contents(self, filenames):
+    return [b"image %d" % self._files.index(f) for f in filenames]
+
+  def _assertImages(self, filenames, images):
+    self.assertEqual(self._contents(filenames),
+                     [tf.compat.as_bytes(image) for image in images])
+
+  def testBatchesInFileOrder(self):
+    prefetcher = image_prefetcher.ImagePrefetcher(self._files, num_threads=3,
+                                                  queue_depth=2)
+    batches = list(prefetcher.batches(3))
+    prefetcher.close()
+    self.assertEqual([3, 3, 1], [len(files) for files, _ in batches])
+    self.assertEqual(self._files, sum([files for files, _ in batches], []))
+    for files, images in batches:
+      self._assertImages(files, images)
+
+  def testReadErrorIsRaised(self):
+    files = self._files[:2] + [
+        os.path.join(self.get_temp_dir(), "missing.jpg")] + self._files[2:]
+    prefetcher = image_prefetcher.ImagePrefetcher(files, num_threads=2,
+                                                  queue_depth=4)
+    batches = prefetcher.batches(2)
+    files, images = next(batches)
+    self._assertImages(self._files[:2], images)
+    with self.assertRaises(tf.errors.NotFoundError):
+      next(batches)
+    prefetcher.close()
+
+  def testCloseBeforeTheEnd(self):
+    prefetcher = image_prefetcher.ImagePrefetcher(self._files, num_threads=2,
+                                                  queue_depth=2)
+    filename, image = next(iter(prefetcher))
+    self.assertEqual(self._files[0], filename)
+    self._assertImages(self._files[:1], [image])
+    prefetcher.close()
+    for thread in prefetcher._threads:
+      thread.join(10)
+      self.assertFalse(thread.is_alive())
+
+
+if __name__ == '__main__':
+  tf.test.main()
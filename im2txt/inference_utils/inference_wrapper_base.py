@@ -32,10 +32,15 @@ Subclasses must implement the following methods:
     Optionally also returns metadata about the current inference step, e.g. a
     serialized numpy array containing activations from a particular model layer.
 
+  Optionally, subclasses keep the model states in the session instead, see
+  support_stateful_decoding(), start_decoding() and inference_step_stateful().
+
 Client usage:
   1. Build the model inference graph via build_graph() or
-     build_graph_from_proto().
-  2. Call the resulting restore_fn to load the model checkpoint.
+     build_graph_from_proto(), or load a frozen graph written by
+     export_frozen_graph.py via build_graph_from_frozen().
+  2. Call the resulting restore_fn to load the model checkpoint. Other
+     checkpoints of the same model can be loaded with create_restore_fn().
   3. For each image in a batch of images:
      a) Call feed_image() once to get the initial state.
      b) For each step of caption generation, call inference_step().
@@ -57,7 +62,8 @@ class InferenceWrapperBase(object):
   """Base wrapper class for performing inference with an image-to-text model."""
 
   def __init__(self):
-    pass
+    # Saver of the built graph, set by build_graph*().
+    self.saver = None
 
   def build_model(self):
     """Builds the model for inference.
@@ -112,6 +118,7 @@ class InferenceWrapperBase(object):
     tf.logging.info("Building model.")
     self.build_model()
     saver = tf.train.Saver()
+    self.saver = saver
 
     return self._create_restore_fn(checkpoint_path, saver)
 
@@ -142,9 +149,59 @@ class InferenceWrapperBase(object):
     with tf.gfile.FastGFile(saver_def_file, "rb") as f:
       saver_def.ParseFromString(f.read())
     saver = tf.train.Saver(saver_def=saver_def)
+    self.saver = saver
 
     return self._create_restore_fn(checkpoint_path, saver)
 
+  def load_frozen_model(self):
+    """Sets up the wrapper for a frozen graph imported into the default graph.
+
+    Subclasses read what build_model() would have set from the collections
+    of the frozen graph.
+    """
+    tf.logging.fatal("Please implement load_frozen_model in subclass")
+
+  def build_graph_from_frozen(self, frozen_graph_file):
+    """Builds the inference graph from a frozen graph file.
+
+    The file is a MetaGraphDef written by export_frozen_graph.py, whose model
+    variables are constants.
+
+    Args:
+      frozen_graph_file: File containing the frozen MetaGraphDef.
+
+    Returns:
+      restore_fn: A function such that restore_fn(sess) prepares the session;
+        there are no variables to restore.
+    """
+    tf.logging.info("Loading frozen graph from file: %s", frozen_graph_file)
+    tf.train.import_meta_graph(frozen_graph_file, clear_devices=True)
+    self.saver = None
+    self.load_frozen_model()
+
+    def _restore_fn(sess):
+      tf.logging.info("Model weights are frozen in: %s",
+                      os.path.basename(frozen_graph_file))
+
+    return _restore_fn
+
+  def create_restore_fn(self, checkpoint_path):
+    """Creates a restore_fn for another checkpoint of the already built graph.
+
+    The graph is built once with build_graph() or build_graph_from_proto();
+    this lets callers such as a checkpoint sweep restore other checkpoints of
+    the same model into it.
+
+    Args:
+      checkpoint_path: Checkpoint file or a directory containing a checkpoint
+        file.
+
+    Returns:
+      restore_fn: A function such that restore_fn(sess) loads model variables
+        from the checkpoint file.
+    """
+    return self._create_restore_fn(checkpoint_path, self.saver)
+
   def feed_image(self, sess, encoded_image):
     """Feeds an image and returns the initial model state.
 
@@ -176,4 +233,37 @@ class InferenceWrapperBase(object):
     """
     tf.logging.fatal("Please implement inference_step in subclass")
 
+  def support_stateful_decoding(self):
+    """Returns whether start_decoding() and inference_step_stateful() work."""
+    return False
+
+  def start_decoding(self, sess, encoded_images):
+    """Feeds a batch of images and keeps their initial states in the session.
+
+    Args:
+      sess: TensorFlow Session object.
+      encoded_images: A list of encoded image strings. Row i of the stored
+        state belongs to encoded_images[i].
+    """
+    tf.logging.fatal("Please implement start_decoding in subclass")
+
+  def inference_step_stateful(self, sess, input_feed, beam_indices,
+                              image_indices):
+    """Runs one step of inference on the states kept in the session.
+
+    The new states replace the stored ones, one row per input.
+
+    Args:
+      sess: TensorFlow Session object.
+      input_feed: A numpy array of shape [batch_size].
+      beam_indices: A numpy array of shape [batch_size], the row of the stored
+        state each input continues.
+      image_indices: A numpy array of shape [batch_size], the index in the
+        start_decoding() batch of the image of each input.
+
+    Returns:
+      softmax_output: A numpy array of shape [batch_size, vocab_size].
+    """
+    tf.logging.fatal("Please implement inference_step_stateful in subclass")
+
 # pylint: enable=unused-argument
@@ -0,0 +1,161 @@
+# Copyright 2016 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Gathers concurrent requests into micro-batches run on a single thread.
+
+Callers on any thread submit() one item and block until its result is ready.
+A worker thread takes the oldest waiting item and waits at most
+max_wait_seconds for more, until max_batch_size items are gathered, then runs
+them through process_fn in one call. All process_fn calls happen on the worker
+thread, so it can own a session. If a batch of several items fails, its items
+are run again one at a time, so a bad item only fails its own submit().
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import threading
+import time
+
+try:
+  import queue
+except ImportError:
+  import Queue as queue
+
+
+class _Request(object):
+  """An item waiting for its result."""
+
+  def __init__(self, item):
+    self.item = item
+    self.enqueue_time = time.time()
+    self.done = threading.Event()
+    self.result = None
+    self.error = None
+    self.timing = None
+
+
+class MicroBatcher(object):
+  """Runs items submitted from many threads in batches on one thread."""
+
+  def __init__(self, process_fn, max_batch_size=8, max_wait_seconds=0.01):
+    """Starts the worker thread.
+
+    Args:
+      process_fn: Function mapping a list of items to the list of their
+        results, in the same order.
+      max_batch_size: Maximum number of items per process_fn call.
+      max_wait_seconds: Maximum time the oldest item of a batch waits for more
+        items before the batch is run.
+    """
+    self._process_fn = process_fn
+    self._max_batch_size = max(max_batch_size, 1)
+    self._max_wait_seconds = max_wait_seconds
+    self._requests = queue.Queue()
+    self._stopped = False
+
+    # Number of batches and items processed so far.
+    self.num_batches = 0
+    self.num_items = 0
+
+    self._thread = threading.Thread(target=self._run_loop)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def submit(self, item):
+    """Runs an item in the next batch and waits for its result.
+
+    Args:
+      item: The item to process.
+
+    Returns:
+      result: The result of process_fn for the item.
+      timing: A dict with the seconds the item waited for its batch
+        ("queue_seconds"), the seconds process_fn took ("batch_seconds") and
+        the number of items of the batch ("batch_size").
+
+    Raises:
+      The exception raised by process_fn on the item alone.
+    """
+    if self._stopped:
+      raise RuntimeError("MicroBatcher is closed")
+    request = _Request(item)
+    self._requests.put(request)
+    request.done.wait()
+    if request.error is not None:
+      raise request.error
+    return request.result, request.timing
+
+  def _next_batch(self):
+    """Blocks for the next batch of requests, or returns None when closed."""
+    request = self._requests.get()
+    if request is None:
+      return None
+    batch = [request]
+    deadline = request.enqueue_time + self._max_wait_seconds
+    while len(batch) < self._max_batch_size:
+      timeout = deadline - time.time()
+      try:
+        if timeout > 0:
+          request = self._requests.get(timeout=timeout)
+        else:
+          request = self._requests.get_nowait()
+      except queue.Empty:
+        break
+      if request is None:
+        # Run what was gathered, then stop.
+        self._requests.put(None)
+        break
+      batch.append(request)
+    return batch
+
+  def _run_loop(self):
+    while True:
+      batch = self._next_batch()
+      if batch is None:
+        return
+      self.num_batches += 1
+      self.num_items += len(batch)
+      self._process(batch)
+
+  def _process(self, batch):
+    """Runs process_fn on a batch and completes its requests."""
+    t_start = time.time()
+    try:
+      results = self._process_fn([request.item for request in batch])
+      assert len(results) == len(batch)
+      error = None
+    except Exception as e:  # pylint: disable=broad-except
+      if len(batch) > 1:
+        # Find the failing items, so the others still get their results.
+        for request in batch:
+          self._process([request])
+        return
+      results = [None]
+      error = e
+    t_end = time.time()
+    for request, result in zip(batch, results):
+      request.result = result
+      request.error = error
+      request.timing = {"queue_seconds": t_start - request.enqueue_time,
+                        "batch_seconds": t_end - t_start,
+                        "batch_size": len(batch)}
+      request.done.set()
+
+  def close(self):
+    """Runs the items already submitted and stops the worker thread."""
+    self._stopped = True
+    self._requests.put(None)
+    self._thread.join()
@@ -0,0 +1,130 @@
+# Copyright 2016 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Unit tests for MicroBatcher."""
+
+import threading
+
+import tensorflow as tf
+
+from im2txt.inference_utils import micro_batcher
+
+
+class MicroBatcherTest(tf.test.TestCase):
+
+  def _submitAll(self, batcher, items):
+    """Submits items from one thread each and returns their results."""
+    results = [None] * len(items)
+
+    def _submit(i):
+      results[i] = batcher.submit(items[i])
+
+    threads = [threading.Thread(target=_submit, args=(i,))
+               for i in range(len(items))]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    return results
+
+  def testResultsMatchItems(self):
+    batch_sizes = []
+
+    def _square(items):
+      batch_sizes.append(len(items))
+      return [x * x for x in items]
+
+    batcher = micro_batcher.MicroBatcher(_square, max_batch_size=4,
+                                         max_wait_seconds=0.2)
+    results = self._submitAll(batcher, list(range(10)))
+    batcher.close()
+
+    self.assertEqual([x * x for x in range(10)],
+                     [result for result, _ in results])
+    self.assertEqual(10, batcher.num_items)
+    self.assertEqual(len(batch_sizes), batcher.num_batches)
+    self.assertLessEqual(max(batch_sizes), 4)
+    # Concurrent requests share batches.
+    self.assertLess(batcher.num_batches, 10)
+    for _, timing in results:
+      self.assertGreaterEqual(timing["queue_seconds"], 0.0)
+      self.assertLessEqual(timing["batch_size"], 4)
+
+  def testSingleItemDoesNotWaitForFullBatch(self):
+    batcher = micro_batcher.MicroBatcher(lambda items: items,
+                                         max_batch_size=8,
+                                         max_wait_seconds=0.01)
+    result, timing = batcher.submit("image")
+    batcher.close()
+    self.assertEqual("image", result)
+    self.assertEqual(1, timing["batch_size"])
+
+  def testErrorIsRaisedInSubmitter(self):
+
+    def _fail(items):
+      raise ValueError("bad batch")
+
+    batcher = micro_batcher.MicroBatcher(_fail)
+    with self.assertRaises(ValueError):
+      batcher.submit(1)
+    # The worker keeps serving after a failed batch.
+    with self.assertRaises(ValueError):
+      batcher.submit(2)
+    batcher.close()
+    self.assertEqual(2, batcher.num_batches)
+
+  def testBadItemOnlyFailsItsOwnSubmit(self):
+    batch_sizes = []
+
+    def _invert(items):
+      batch_sizes.append(len(items))
+      return [1.0 / x for x in items]
+
+    batcher = micro_batcher.MicroBatcher(_invert, max_batch_size=8,
+                                         max_wait_seconds=0.2)
+    items = [1, 2, 0, 4]
+    results = [None] * len(items)
+    errors = [None] * len(items)
+
+    def _submit(i):
+      try:
+        results[i], _ = batcher.submit(items[i])
+      except ZeroDivisionError as e:
+        errors[i] = e
+
+    threads = [threading.Thread(target=_submit, args=(i,))
+               for i in range(len(items))]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    batcher.close()
+
+    self.assertEqual([1.0, 0.5, None, 0.25], results)
+    self.assertEqual([None, None], errors[:2])
+    self.assertIsInstance(errors[2], ZeroDivisionError)
+    self.assertIsNone(errors[3])
+    # The failed batch was run again one item at a time.
+    self.assertIn(1, batch_sizes)
+    self.assertGreater(max(batch_sizes), 1)
+
+  def testSubmitAfterCloseFails(self):
+    batcher = micro_batcher.MicroBatcher(lambda items: items)
+    batcher.close()
+    with self.assertRaises(RuntimeError):
+      batcher.submit(1)
+
+
+if __name__ == '__main__':
+  tf.test.main()
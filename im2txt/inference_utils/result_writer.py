@@ -0,0 +1,127 @@
+# Copyright 2016 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Streaming, resumable writer for inference results.
+
+Results are appended to "<output>.jsonl", one JSON object per line, and
+flushed every few results, so a crashed run keeps everything it has written.
+When the writer is opened again on the same output it reads the image ids that
+are already done, so the caller can skip them. On close() the lines are
+optionally compacted into a single JSON array at <output>, the format that
+tools/merge_json_lists.py and tools/eval/run_evaluations.py expect.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import io
+import json
+import os
+
+import tensorflow as tf
+
+tf.flags.DEFINE_integer("output_flush_every", 100,
+                        "Number of results buffered before they are flushed to "
+                        "the JSON Lines output.")
+tf.flags.DEFINE_boolean("resume_output", True,
+                        "Whether to skip the images already in the JSON Lines "
+                        "output of a previous run.")
+tf.flags.DEFINE_boolean("compact_output", True,
+                        "Whether to compact the JSON Lines output into a JSON "
+                        "array at --output when inference finishes.")
+
+
+def _to_text(line):
+  # json.dumps(ensure_ascii=False) returns a byte string in python 2.
+  if isinstance(line, bytes):
+    line = line.decode("utf-8")
+  return line
+
+
+class ResultWriter(object):
+  """Streams inference results to a JSON Lines file."""
+
+  def __init__(self, output, flush_every=100, resume=True, compact=True):
+    """Initializes the writer.
+
+    Args:
+      output: Path of the final JSON array. Results are streamed to
+        output + ".jsonl".
+      flush_every: Number of results buffered before they are written out.
+      resume: If True, keep the results of a previous run and record their
+        image ids in done_ids. Otherwise start from an empty file.
+      compact: If True, close() writes all results as a JSON array to output.
+    """
+    self.output = output
+    self.stream_path = output + ".jsonl"
+    self.flush_every = max(flush_every, 1)
+    self.compact = compact
+
+    # Image ids already written, including those of a previous run.
+    self.done_ids = set()
+    self._pending = []
+
+    if resume and os.path.exists(self.stream_path):
+      self._recover()
+    else:
+      io.open(self.stream_path, "w", encoding="utf-8").close()
+
+  def _recover(self):
+    """Reads the results of a previous run, dropping a truncated last line."""
+    lines = []
+    truncated = False
+    with io.open(self.stream_path, "r", encoding="utf-8") as f:
+      for line in f:
+        try:
+          result = json.loads(line)
+        except ValueError:
+          truncated = True
+          continue
+        lines.append(line if line.endswith("\n") else line + "\n")
+        self.done_ids.add(result["image_id"])
+    if truncated:
+      with io.open(self.stream_path, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+    tf.logging.info("Resuming from %s with %d results.",
+                    self.stream_path, len(self.done_ids))
+
+  def write(self, result):
+    """Buffers a result dict, which must contain the key "image_id"."""
+    if result["image_id"] in self.done_ids:
+      return
+    self.done_ids.add(result["image_id"])
+    self._pending.append(result)
+    if len(self._pending) >= self.flush_every:
+      self.flush()
+
+  def flush(self):
+    """Appends the buffered results to the JSON Lines file."""
+    if not self._pending:
+      return
+    with io.open(self.stream_path, "a", encoding="utf-8") as f:
+      for result in self._pending:
+        f.write(_to_text(json.dumps(result, ensure_ascii=False)) + u"\n")
+    self._pending = []
+
+  def close(self):
+    """Flushes the buffered results and optionally compacts the output."""
+    self.flush()
+    if not self.compact:
+      return
+    with io.open(self.stream_path, "r", encoding="utf-8") as f:
+      results = [json.loads(line) for line in f]
+    with io.open(self.output, "w", encoding="utf-8") as f:
+      f.write(_to_text(json.dumps(results, ensure_ascii=False, indent=4)))
+    tf.logging.info("Wrote %d results to %s", len(results), self.output)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Unit tests for the streaming, resumable result writer."""
+
+import io
+import json
+import os
+
+import tensorflow as tf
+
+from im2txt.inference_utils import result_writer
+
+
+class ResultWriterTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(ResultWriterTest, self).setUp()
+    self._output = os.path.join(self.get_temp_dir(), "captions.json")
+    for path in [self._output, self._output + ".jsonl"]:
+      if os.path.exists(path):
+        os.remove(path)
+
+  def _stream_ids(self):
+    with io.open(self._output + ".jsonl", "r", encoding="utf-8") as f:
+      return [json.loads(line)["image_id"] for line in f]
+
+  def testFlushEvery(self):
+    writer = result_writer.ResultWriter(self._output, flush_every=3,
+                                        compact=False)
+    writer.write({"image_id": "a", "caption": u"一个男人"})
+    writer.write({"image_id": "b", "caption": u"一个女人"})
+    self.assertEqual([], self._stream_ids())
+    writer.write({"image_id": "c", "caption": u"一个孩子"})
+    self.assertEqual(["a", "b", "c"], self._stream_ids())
+    writer.write({"image_id": "d", "caption": u"一只狗"})
+    self.assertEqual(["a", "b", "c"], self._stream_ids())
+    writer.close()
+    self.assertEqual(["a", "b", "c", "d"], self._stream_ids())
+    self.assertFalse(os.path.exists(self._output))
+
+  def testResumeSkipsDoneIds(self):
+    writer = result_writer.ResultWriter(self._output, compact=False)
+    writer.write({"image_id": "a", "caption": u"一个男人"})
+    writer.write({"image_id": "b", "caption": u"一个女人"})
+    writer.write({"image_id": "a", "caption": u"重复"})
+    writer.close()
+    self.assertEqual(["a", "b"], self._stream_ids())
+
+    writer = result_writer.ResultWriter(self._output, compact=False)
+    self.assertEqual(set(["a", "b"]), writer.done_ids)
+    writer.write({"image_id": "b", "caption": u"重复"})
+    writer.write({"image_id": "c", "caption": u"一个孩子"})
+    writer.close()
+    self.assertEqual(["a", "b", "c"], self._stream_ids())
+
+  def testNoResumeStartsEmpty(self):
+    writer = result_writer.ResultWriter(self._output, compact=False)
+    writer.write({"image_id": "a", "caption": u"一个男人"})
+    writer.close()
+    writer = result_writer.ResultWriter(self._output, resume=False,
+                                        compact=False)
+    self.assertEqual(set(), writer.done_ids)
+    writer.close()
+    self.assertEqual([], self._stream_ids())
+
+  def testCompactWritesArrayInOrder(self):
+    writer = result_writer.ResultWriter(self._output, flush_every=2)
+    for image_id in ["c", "a", "b"]:
+      writer.write({"image_id": image_id, "caption": u"一个男人"})
+    writer.close()
+    with io.open(self._output, "r", encoding="utf-8") as f:
+      results = json.load(f)
+    self.assertEqual(["c", "a", "b"], [r["image_id"] for r in results])
+    self.assertEqual(u"一个男人", results[0]["caption"])
+
+
+if __name__ == '__main__':
+  tf.test.main()
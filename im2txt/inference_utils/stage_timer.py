@@ -0,0 +1,187 @@
+# Copyright 2016 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Per-stage latency measurements of the inference path.
+
+A StageTimer collects the wall time of named stages (file read, image feed,
+decoder steps, beam bookkeeping, vocabulary decode, output write) and writes
+their percentiles and the images per second to a JSON report. A disabled timer
+records nothing, so the inference code times its stages unconditionally.
+
+The graph runs the image decode, the image model and the decoder in a few
+sess.run() calls. A TracingSession wrapped around the session traces every
+n-th call with a tf.RunMetadata, adds the op time of each top-level name scope
+of the graph (e.g. "InceptionV3", "lstm") to the timer as "op_time/<scope>",
+and optionally writes the step as a Chrome trace timeline.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import contextlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.python.client import timeline
+
+tf.flags.DEFINE_string("profile_report", "",
+                       "If set, write the latency percentiles of the "
+                       "inference stages to this JSON file.")
+tf.flags.DEFINE_integer("profile_trace_every", 0,
+                        "Trace every n-th sess.run() call to measure the op "
+                        "time of the graph stages. 0 disables tracing, as "
+                        "does leaving --profile_report and "
+                        "--profile_timeline_dir unset.")
+tf.flags.DEFINE_string("profile_timeline_dir", "",
+                       "If set, write a Chrome trace timeline of each traced "
+                       "sess.run() call to this directory.")
+
+
+@contextlib.contextmanager
+def _no_op():
+  yield
+
+
+class StageTimer(object):
+  """Collects the durations of named stages, from any thread."""
+
+  def __init__(self, enabled=True):
+    self.enabled = enabled
+    self._durations = collections.defaultdict(list)
+    self._lock = threading.Lock()
+    self._t_start = time.time()
+
+  def add(self, name, seconds):
+    """Records one duration of stage name."""
+    if not self.enabled:
+      return
+    with self._lock:
+      self._durations[name].append(seconds)
+
+  def stage(self, name):
+    """Returns a context manager recording the time spent in its block."""
+    if not self.enabled:
+      return _no_op()
+    return self._timed(name)
+
+  @contextlib.contextmanager
+  def _timed(self, name):
+    t_start = time.time()
+    try:
+      yield
+    finally:
+      self.add(name, time.time() - t_start)
+
+  def report(self, num_images):
+    """Returns the stage statistics as a dict.
+
+    Args:
+      num_images: Number of images processed since the timer was created.
+
+    Returns:
+      A dict with the images per second and, for each stage, the number of
+      measurements, the total seconds and the mean, p50, p95 and p99 in
+      milliseconds.
+    """
+    seconds = time.time() - self._t_start
+    stages = {}
+    with self._lock:
+      for name, durations in self._durations.items():
+        durations_ms = 1000.0 * np.asarray(durations)
+        p50, p95, p99 = np.percentile(durations_ms, [50, 95, 99])
+        stages[name] = {
+            "count": len(durations),
+            "total_seconds": float(np.sum(durations)),
+            "mean_ms": float(np.mean(durations_ms)),
+            "p50_ms": float(p50),
+            "p95_ms": float(p95),
+            "p99_ms": float(p99),
+        }
+    return {
+        "num_images": num_images,
+        "seconds": seconds,
+        "images_per_second": num_images / seconds if seconds > 0 else 0.0,
+        "stages": stages,
+    }
+
+  def write_report(self, filename, num_images):
+    """Writes report() to a JSON file and logs the slowest stages."""
+    report = self.report(num_images)
+    with tf.gfile.GFile(filename, "w") as f:
+      f.write(json.dumps(report, indent=2, sort_keys=True))
+    tf.logging.info("%.2f images per second, wrote the stage latencies to %s",
+                    report["images_per_second"], filename)
+    by_total = sorted(report["stages"].items(),
+                      key=lambda item: -item[1]["total_seconds"])
+    for name, stats in by_total:
+      tf.logging.info("  %-28s %8.3fs  p50 %8.2fms  p99 %8.2fms", name,
+                      stats["total_seconds"], stats["p50_ms"], stats["p99_ms"])
+
+
+def _scope(node_name):
+  return node_name.split("/")[0].split(":")[0]
+
+
+class TracingSession(object):
+  """Session wrapper tracing every n-th run() call into a StageTimer."""
+
+  def __init__(self, sess, timer, trace_every, timeline_dir=""):
+    """Wraps a session.
+
+    Args:
+      sess: The tf.Session to run.
+      timer: The StageTimer receiving the op time of each name scope.
+      trace_every: Trace every trace_every-th call, 0 to never trace.
+      timeline_dir: If not empty, the directory of the Chrome trace timelines.
+    """
+    self._sess = sess
+    self._timer = timer
+    self._trace_every = trace_every
+    self._timeline_dir = timeline_dir
+    self._num_runs = 0
+    if timeline_dir:
+      tf.gfile.MakeDirs(timeline_dir)
+
+  def __getattr__(self, name):
+    return getattr(self._sess, name)
+
+  def run(self, fetches, feed_dict=None):
+    self._num_runs += 1
+    if not self._trace_every or self._num_runs % self._trace_every:
+      return self._sess.run(fetches, feed_dict=feed_dict)
+
+    run_options = tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE)
+    run_metadata = tf.RunMetadata()
+    results = self._sess.run(fetches, feed_dict=feed_dict,
+                             options=run_options, run_metadata=run_metadata)
+    op_micros = collections.defaultdict(int)
+    for dev_stats in run_metadata.step_stats.dev_stats:
+      for node_stats in dev_stats.node_stats:
+        op_micros[_scope(node_stats.node_name)] += (
+            node_stats.all_end_rel_micros)
+    for scope, micros in op_micros.items():
+      self._timer.add("op_time/" + scope, micros / 1e6)
+    if self._timeline_dir:
+      trace = timeline.Timeline(run_metadata.step_stats)
+      filename = os.path.join(self._timeline_dir,
+                              "timeline-%d.json" % self._num_runs)
+      with tf.gfile.GFile(filename, "w") as f:
+        f.write(trace.generate_chrome_trace_format())
+    return results
@@ -0,0 +1,63 @@
+# Copyright 2016 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Unit tests for StageTimer."""
+
+import json
+import os
+
+import tensorflow as tf
+
+from im2txt.inference_utils import stage_timer
+
+
+class StageTimerTest(tf.test.TestCase):
+
+  def testPercentiles(self):
+    timer = stage_timer.StageTimer()
+    for i in range(1, 101):
+      timer.add("decoder_step", i / 1000.0)
+    with timer.stage("vocab_decode"):
+      pass
+
+    report = timer.report(num_images=10)
+    self.assertEqual(10, report["num_images"])
+    self.assertGreater(report["images_per_second"], 0.0)
+    stats = report["stages"]["decoder_step"]
+    self.assertEqual(100, stats["count"])
+    self.assertAlmostEqual(5.05, stats["total_seconds"])
+    self.assertAlmostEqual(50.5, stats["p50_ms"])
+    self.assertAlmostEqual(95.05, stats["p95_ms"])
+    self.assertAlmostEqual(99.01, stats["p99_ms"])
+    self.assertEqual(1, report["stages"]["vocab_decode"]["count"])
+
+  def testDisabledTimerRecordsNothing(self):
+    timer = stage_timer.StageTimer(enabled=False)
+    timer.add("decoder_step", 1.0)
+    with timer.stage("vocab_decode"):
+      pass
+    self.assertEqual({}, timer.report(num_images=0)["stages"])
+
+  def testWriteReport(self):
+    timer = stage_timer.StageTimer()
+    timer.add("file_read", 0.5)
+    filename = os.path.join(self.get_temp_dir(), "report.json")
+    timer.write_report(filename, num_images=1)
+    with open(filename) as f:
+      report = json.load(f)
+    self.assertEqual(0.5, report["stages"]["file_read"]["total_seconds"])
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -20,55 +20,150 @@ from __future__ import division
 from __future__ import print_function
 
 
+import numpy as np
 import tensorflow as tf
 import im2txt_model
+from im2txt_models import decoder_state
 from inference_utils import inference_wrapper_base
 
+# Attributes of the wrapper that are tensors of the model, kept in collections
+# named "frozen_<attribute>" of frozen graphs.
+FROZEN_TENSORS = ["predicted_ids", "scores", "decode_steps_saved"]
+# Attributes of the wrapper that are (probs, indices) tuples of tensors, kept in
+# collections named "frozen_<attribute>_probs" and "frozen_<attribute>_indices",
+# since a collection item must be a single tensor to be exported.
+FROZEN_TENSOR_PAIRS = ["top_n_attributes"]
+_PAIR_SUFFIXES = ("_probs", "_indices")
+# Boolean properties of the model, kept as int collections of frozen graphs.
+FROZEN_PROPERTIES = ["support_ingraph", "batched_image_feed"]
 
 
 class InferenceWrapper(inference_wrapper_base.InferenceWrapperBase):
   """Model wrapper class for performing inference with a Im2TxtModel."""
 
-  def __init__(self):
+  def __init__(self, image_feature_shapes=None):
+    """Initializes the wrapper.
+
+    Args:
+      image_feature_shapes: If not None, the model skips the image model and
+        takes precomputed image features of these shapes, see Im2TxtModel.
+    """
     super(InferenceWrapper, self).__init__()
+    self.image_feature_shapes = image_feature_shapes
+    self._init_state_ops = []
+    self._append_state_ops = []
+    self._update_state_ops = []
+    self._has_stored_memory = False
+    self._support_ingraph = False
+    self._batched_image_feed = False
 
   def build_model(self):
-    model = im2txt_model.Im2TxtModel(mode="inference")
+    model = im2txt_model.Im2TxtModel(mode="inference",
+                                     image_feature_shapes=self.image_feature_shapes)
     model.build()
     self.model = model
-    if hasattr(model, "predicted_ids"):
-      self.predicted_ids = model.predicted_ids
-    if hasattr(model, "scores"):
-      self.scores = model.scores
-    if hasattr(model, "top_n_attributes"):
-      self.top_n_attributes = model.top_n_attributes
+    for name in FROZEN_TENSORS + FROZEN_TENSOR_PAIRS:
+      if hasattr(model, name):
+        setattr(self, name, getattr(model, name))
     if hasattr(model, "image_names"):
       self.image_names = model.image_names
+      self.image_valid = model.image_valid
+    self._support_ingraph = model.support_ingraph
+    self._batched_image_feed = model.batched_image_feed
+    self._collect_state_ops()
     return model
 
+  def load_frozen_model(self):
+    for name in FROZEN_TENSORS:
+      tensors = tf.get_collection("frozen_" + name)
+      if tensors:
+        setattr(self, name, tensors[0])
+    for name in FROZEN_TENSOR_PAIRS:
+      pair = [tf.get_collection("frozen_" + name + suffix)
+              for suffix in _PAIR_SUFFIXES]
+      if all(pair):
+        setattr(self, name, tuple(tensors[0] for tensors in pair))
+    self._support_ingraph = bool(tf.get_collection("frozen_support_ingraph")[0])
+    self._batched_image_feed = bool(
+        tf.get_collection("frozen_batched_image_feed")[0])
+    self._collect_state_ops()
+
+  def add_frozen_collections(self):
+    """Adds the collections load_frozen_model() reads to the default graph.
+
+    Returns:
+      The names of the collections to export with the frozen graph.
+    """
+    collections = [decoder_state.DECODER_STATE_INIT,
+                   decoder_state.DECODER_STATE_APPEND,
+                   decoder_state.DECODER_STATE_UPDATE]
+    for name in FROZEN_TENSORS:
+      if hasattr(self, name):
+        tf.add_to_collection("frozen_" + name, getattr(self, name))
+        collections.append("frozen_" + name)
+    for name in FROZEN_TENSOR_PAIRS:
+      if hasattr(self, name):
+        for suffix, tensor in zip(_PAIR_SUFFIXES, getattr(self, name)):
+          tf.add_to_collection("frozen_" + name + suffix, tensor)
+          collections.append("frozen_" + name + suffix)
+    tf.add_to_collection("frozen_support_ingraph", int(self._support_ingraph))
+    tf.add_to_collection("frozen_batched_image_feed",
+                         int(self._batched_image_feed))
+    collections += ["frozen_" + name for name in FROZEN_PROPERTIES]
+    return collections
+
+  def _collect_state_ops(self):
+    # Ops keeping the decoder state in the session, see decoder_state.
+    self._init_state_ops = tf.get_collection(decoder_state.DECODER_STATE_INIT)
+    self._append_state_ops = tf.get_collection(decoder_state.DECODER_STATE_APPEND)
+    self._update_state_ops = tf.get_collection(decoder_state.DECODER_STATE_UPDATE)
+    self._has_stored_memory = any(op.name == "lstm/image_indices"
+                                  for op in tf.get_default_graph().get_operations())
+
   def feed_image(self, sess, encoded_image):
     initial_state = sess.run(fetches="lstm/initial_state:0",
                              feed_dict={"image_feed:0": encoded_image})
     return initial_state
 
   def inference_step(self, sess, input_feed, state_feed, encoded_image=None, use_attention=False):
+    feed_dict = {
+        "input_feed:0": input_feed,
+        "lstm/state_feed:0": state_feed
+    }
     # the image_feed need to be used if attention model is used
     if use_attention:
-        softmax_output, state_output = sess.run(
-            fetches=["softmax:0", "lstm/state:0"],
-            feed_dict={
-                "image_feed:0": encoded_image,
-                "input_feed:0": input_feed,
-                "lstm/state_feed:0": state_feed
-            })
-    else:
-        softmax_output, state_output = sess.run(
-            fetches=["softmax:0", "lstm/state:0"],
-            feed_dict={
-                "input_feed:0": input_feed,
-                "lstm/state_feed:0": state_feed
-            })
+      if self._has_stored_memory:
+        # The attention memory is read from the session.
+        self.start_decoding(sess, [encoded_image])
+        feed_dict["lstm/image_indices:0"] = np.zeros(len(input_feed), np.int32)
+      else:
+        feed_dict["image_feed:0"] = encoded_image
+    softmax_output, state_output = sess.run(
+        fetches=["softmax:0", "lstm/state:0"], feed_dict=feed_dict)
     return softmax_output, state_output, None
 
+  def support_stateful_decoding(self):
+    return bool(self._update_state_ops)
+
+  def start_decoding(self, sess, encoded_images):
+    for i, encoded_image in enumerate(encoded_images):
+      sess.run(self._append_state_ops if i else self._init_state_ops,
+               feed_dict={"image_feed:0": encoded_image})
+
+  def inference_step_stateful(self, sess, input_feed, beam_indices,
+                              image_indices):
+    feed_dict = {
+        "input_feed:0": input_feed,
+        "lstm/beam_indices:0": beam_indices
+    }
+    if self._has_stored_memory:
+      feed_dict["lstm/image_indices:0"] = image_indices
+    softmax_output, _ = sess.run(
+        fetches=["softmax:0", self._update_state_ops], feed_dict=feed_dict)
+    return softmax_output
+
   def support_ingraph(self):
-    return self.model.support_ingraph
+    return self._support_ingraph
+
+  def support_batched_image_feed(self):
+    return self._batched_image_feed
@@ -0,0 +1,210 @@
+# Copyright 2016 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+r"""Generate captions with a pool of worker processes on CPU.
+
+The sorted file list of --input_file_pattern is split into --num_workers
+contiguous shards. Each worker is this script started again with
+--worker_index; it builds the inference graph, restores --checkpoint_path (or
+loads the single file of --frozen_graph) and writes its results to
+<output>.part-<index>.jsonl, resuming a previous run. A worker skips the images
+found in any part file, so a run can be resumed with another --num_workers.
+The model files are read through the page cache, so they are loaded from disk
+once for all workers. When all workers are done the results of all part files
+are merged into --output in the order of the file list, once per image.
+
+Each worker session uses --intra_op_threads and --inter_op_threads threads, by
+default the cores divided among the workers, so the workers do not oversubscribe
+the machine.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import io
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+import tensorflow as tf
+
+import inference_wrapper
+from inference_utils import caption_generator
+from inference_utils import image_prefetcher
+from inference_utils import result_writer
+from inference_utils import vocabulary
+
+FLAGS = tf.flags.FLAGS
+
+tf.flags.DEFINE_string("checkpoint_path", "",
+                       "Model checkpoint file or directory containing a "
+                       "model checkpoint file.")
+tf.flags.DEFINE_string("frozen_graph", "",
+                       "Frozen graph written by export_frozen_graph.py, used "
+                       "instead of --checkpoint_path.")
+tf.flags.DEFINE_string("input_file_pattern", "", "The pattern of images.")
+tf.flags.DEFINE_string("output", "", "The output file.")
+tf.flags.DEFINE_integer("batch_size", 1, "Number of images decoded together by beam search.")
+tf.flags.DEFINE_integer("num_workers", 4, "Number of worker processes.")
+tf.flags.DEFINE_integer("intra_op_threads", 0,
+                        "Threads of each worker for a single op. 0 means the "
+                        "number of cores divided by --num_workers.")
+tf.flags.DEFINE_integer("inter_op_threads", 1,
+                        "Threads of each worker for running ops in parallel.")
+tf.flags.DEFINE_integer("worker_index", -1,
+                        "Set by the parent process: the shard a worker decodes.")
+
+tf.logging.set_verbosity(tf.logging.INFO)
+
+
+def _get_image_id(filename):
+  image_id = filename.split('.')[0]
+  if "/" in image_id:
+    image_id = image_id.split("/")[-1]
+  return image_id
+
+
+def get_shard(files, worker_index, num_workers):
+  """Returns the contiguous shard of files of a worker."""
+  start = len(files) * worker_index // num_workers
+  end = len(files) * (worker_index + 1) // num_workers
+  return files[start:end]
+
+
+def _part_output(worker_index):
+  return "%s.part-%d" % (FLAGS.output, worker_index)
+
+
+def _read_parts(output):
+  """Yields the results of all part files, also of runs with other shards."""
+  for part in sorted(tf.gfile.Glob(output + ".part-*.jsonl")):
+    with io.open(part, "r", encoding="utf-8") as f:
+      for line in f:
+        try:
+          yield json.loads(line)
+        except ValueError:
+          # The truncated last line of a crashed worker.
+          continue
+
+
+def run_worker(files):
+  """Captions files in this process and streams them to its part output."""
+  intra_op_threads = FLAGS.intra_op_threads or max(
+      1, multiprocessing.cpu_count() // FLAGS.num_workers)
+
+  # Build the inference graph.
+  g = tf.Graph()
+  with g.as_default():
+    model = inference_wrapper.InferenceWrapper()
+    if FLAGS.frozen_graph:
+      restore_fn = model.build_graph_from_frozen(FLAGS.frozen_graph)
+    else:
+      restore_fn = model.build_graph(FLAGS.checkpoint_path)
+  g.finalize()
+
+  # Create the vocabulary.
+  vocab = vocabulary.Vocabulary(FLAGS.vocab_file)
+
+  writer = result_writer.ResultWriter(_part_output(FLAGS.worker_index),
+                                      flush_every=FLAGS.output_flush_every,
+                                      resume=FLAGS.resume_output,
+                                      compact=False)
+
+  config = tf.ConfigProto(intra_op_parallelism_threads=intra_op_threads,
+                          inter_op_parallelism_threads=FLAGS.inter_op_threads)
+  with tf.Session(graph=g, config=config) as sess:
+    # Load the model from checkpoint.
+    restore_fn(sess)
+
+    generator = caption_generator.CaptionGenerator(model, vocab)
+    t_start = time.time()
+    # Images of other part files were done by a run with other shards.
+    done_ids = writer.done_ids
+    if FLAGS.resume_output:
+      done_ids = done_ids | set(result["image_id"]
+                                for result in _read_parts(FLAGS.output))
+    files = [f for f in files if _get_image_id(f) not in done_ids]
+    prefetcher = image_prefetcher.ImagePrefetcher(
+        files,
+        num_threads=FLAGS.num_read_threads,
+        queue_depth=FLAGS.prefetch_queue_depth)
+    for batch_files, images in prefetcher.batches(FLAGS.batch_size):
+      batch_captions = generator.beam_search_batch(sess, images)
+      sentences = vocab.decode_batch([captions[0] for captions in batch_captions])
+      for filename, sentence in zip(batch_files, sentences):
+        result = {}
+        result['image_id'] = _get_image_id(filename)
+        result['caption'] = sentence
+        writer.write(result)
+    prefetcher.close()
+    generator.log_decode_stats()
+  writer.close()
+  tf.logging.info("Worker %d captioned %d images in %f seconds.",
+                  FLAGS.worker_index, len(files), time.time() - t_start)
+
+
+def merge_parts(files, output):
+  """Writes the results of all part files to output, in the order of files.
+
+  Each image id is written once, even if part files of runs with different
+  numbers of workers both hold it.
+  """
+  order = dict((_get_image_id(f), i) for i, f in enumerate(files))
+  results = {}
+  for result in _read_parts(output):
+    results.setdefault(result["image_id"], result)
+  results = list(results.values())
+  results.sort(key=lambda result: order.get(result["image_id"], len(order)))
+  text = json.dumps(results, ensure_ascii=False, indent=4)
+  if isinstance(text, bytes):
+    text = text.decode("utf-8")
+  with io.open(output, "w", encoding="utf-8") as f:
+    f.write(text)
+  tf.logging.info("Wrote %d results to %s", len(results), output)
+
+
+def main(_):
+  assert FLAGS.checkpoint_path or FLAGS.frozen_graph, \
+      "--checkpoint_path or --frozen_graph is required"
+  assert FLAGS.vocab_file, "--vocab_file is required"
+  assert FLAGS.input_file_pattern , "--input_file_pattern is required"
+  assert FLAGS.output, "--output is required"
+
+  files = sorted(tf.gfile.Glob(FLAGS.input_file_pattern))
+  if FLAGS.worker_index >= 0:
+    run_worker(get_shard(files, FLAGS.worker_index, FLAGS.num_workers))
+    return
+
+  tf.logging.info("Captioning %d images with %d workers.", len(files),
+                  FLAGS.num_workers)
+  t_start = time.time()
+  if not FLAGS.resume_output:
+    for part in tf.gfile.Glob(FLAGS.output + ".part-*.jsonl"):
+      tf.gfile.Remove(part)
+  workers = [subprocess.Popen([sys.executable, os.path.abspath(__file__)] +
+                              sys.argv[1:] + ["--worker_index=%d" % i])
+             for i in range(FLAGS.num_workers)]
+  failed = [i for i, worker in enumerate(workers) if worker.wait() != 0]
+  if failed:
+    raise RuntimeError("Workers %s failed; run again to resume them." % failed)
+  merge_parts(files, FLAGS.output)
+  print("time: %f" % (time.time() - t_start))
+
+
+if __name__ == "__main__":
+  tf.app.run()
@@ -24,11 +24,16 @@ import tensorflow as tf
 from tensorflow import logging
 from tensorflow import flags
 from tensorflow import gfile
+from train_utils import inputs
 from train_utils.image_processing import simple_process_image
 
 FLAGS = flags.FLAGS
 tf.flags.DEFINE_integer("num_refs", 5,
                         "Number of caption lines for each of the images.")
+tf.flags.DEFINE_integer("num_test_readers", 1,
+                        "Number of test files read in parallel by the "
+                        "ImageCaptionTestReader. With more than one the "
+                        "order of the images is not deterministic.")
 
 
 class BaseReader(object):
@@ -52,7 +57,16 @@ class ImageCaptionReader(BaseReader):
   def prepare_reader(self, filename_queue, batch_size=16):
     reader = tf.TFRecordReader()
     _, serialized_examples = reader.read(filename_queue)
+    return self.parse_serialized_example(serialized_examples)
 
+  def parse_serialized_example(self, serialized_examples, thread_id=0):
+    """Parses a serialized Example into the columns of prepare_reader().
+
+    Args:
+      serialized_examples: A scalar string Tensor.
+      thread_id: Passed to simple_process_image(). A nonzero even id keeps
+        the color distortions of thread 0 without image summaries.
+    """
     num_words = self.num_refs * self.max_ref_length
     feature_map = {
         "image/id": tf.FixedLenFeature([], tf.int64),
@@ -74,22 +88,21 @@ class ImageCaptionReader(BaseReader):
 
     # [height, width, channels]
     encoded_image = features["image/data"]
-    image = simple_process_image(encoded_image,
-                                 flip=False,
-                                 is_training=self.is_training)
-    flipped_image = simple_process_image(encoded_image,
-                                 flip=True,
+    # The image is decoded once and only flipped if chosen.
+    flip = tf.less(tf.random_uniform([],0,1.0), 0.5)
+    maybe_flipped_image = simple_process_image(encoded_image,
+                                 thread_id=thread_id,
+                                 flip=flip,
                                  is_training=self.is_training)
     ref_words = features["image/ref_words"]
     ref_lengths = features["image/ref_lengths"]
     flipped_ref_words = features["image/flipped_ref_words"]
     flipped_ref_lengths = features["image/flipped_ref_lengths"]
 
-    maybe_flipped_image, maybe_flipped_captions, maybe_flipped_ref_lengths = tf.cond(
-                        tf.less(tf.random_uniform([],0,1.0), 0.5), 
-                        lambda: [flipped_image, flipped_ref_words, flipped_ref_lengths], 
-                        lambda: [image, ref_words, ref_lengths])
-    print(" image", image)
+    maybe_flipped_captions, maybe_flipped_ref_lengths = tf.cond(
+                        flip,
+                        lambda: [flipped_ref_words, flipped_ref_lengths],
+                        lambda: [ref_words, ref_lengths])
 
     image_id = tf.reshape(image_id,
                           shape=[1])
@@ -135,6 +148,60 @@ class ImageCaptionReader(BaseReader):
         return images, input_seqs, target_seqs, input_mask, target_lengths
 
 
+def get_input_dataset_tensors(reader,
+                              data_pattern=None,
+                              batch_size=16,
+                              num_epochs=None,
+                              is_training=True):
+  """tf.data version of get_input_data_tensors().
+
+  Files are read in parallel by an interleave over --num_parallel_reads files,
+  parsed and processed on --num_preprocess_threads threads, and the rows of
+  the examples are shuffled and batched like shuffle_batch_join. With
+  --caption_length_buckets, batches are taken from buckets of similar target
+  lengths; the captions stay padded to max_ref_length, but the decoder only
+  runs up to the longest target length of the batch.
+  """
+  with tf.name_scope("train_input"):
+    files = gfile.Glob(data_pattern)
+    if not files:
+      raise IOError("Unable to find training files. data_pattern='" +
+                    data_pattern + "'.")
+    logging.info("Number of training files: %s.", str(len(files)))
+    dataset = tf.data.Dataset.from_tensor_slices(files)
+    if is_training:
+      dataset = dataset.shuffle(len(files))
+    dataset = dataset.repeat(num_epochs)
+    dataset = dataset.apply(tf.contrib.data.parallel_interleave(
+        tf.data.TFRecordDataset,
+        cycle_length=FLAGS.num_parallel_reads,
+        sloppy=is_training))
+    dataset = dataset.map(
+        lambda x: tuple(reader.parse_serialized_example(x, thread_id=2)),
+        num_parallel_calls=FLAGS.num_preprocess_threads)
+    # Each example has 1 or num_refs rows, see prepare_reader().
+    dataset = dataset.flat_map(
+        lambda *cols: tf.data.Dataset.from_tensor_slices(cols))
+    if is_training:
+      dataset = dataset.shuffle(batch_size * 8)
+    if inputs.get_caption_length_boundaries():
+      # The target lengths are the fifth column, of shape [] or [num_refs].
+      dataset = inputs.bucket_by_caption_length(
+          dataset, lambda *cols: tf.reduce_max(cols[4]), batch_size)
+    else:
+      dataset = dataset.batch(batch_size)
+    dataset = dataset.prefetch(FLAGS.dataset_prefetch_batches)
+    cols = dataset.make_one_shot_iterator().get_next()
+    if inputs.get_caption_length_boundaries():
+      with tf.control_dependencies([inputs.add_bucket_summaries(
+          cols[4], padded_length=reader.max_ref_length)]):
+        cols = (tf.identity(cols[0]),) + tuple(cols[1:])
+
+  # The dataset repeats, so all batches are full.
+  for col in cols:
+    col.set_shape([batch_size] + col.get_shape().as_list()[1:])
+  return cols
+
 def get_input_data_tensors(reader,
                            data_pattern=None,
                            batch_size=16,
@@ -143,6 +210,12 @@ def get_input_data_tensors(reader,
                            num_readers=1):
   reader = ImageCaptionReader(num_refs=FLAGS.num_refs,
                               max_ref_length=FLAGS.max_ref_length)
+  if FLAGS.input_pipeline == "dataset":
+    return get_input_dataset_tensors(reader,
+                                     data_pattern=data_pattern,
+                                     batch_size=batch_size,
+                                     num_epochs=num_epochs,
+                                     is_training=is_training)
   logging.info("Using batch size of " + str(batch_size) + " for training.")
   with tf.name_scope("train_input"):
     files = gfile.Glob(data_pattern)
@@ -167,13 +240,16 @@ def get_input_data_tensors(reader,
         enqueue_many=True)
 
 class ImageCaptionTestReader(BaseReader):
+  """Reads batches of test records and decodes their images in parallel."""
 
-  def __init__(self):
+  def __init__(self, num_decode_threads=8):
     self.is_training = False
+    self.num_decode_threads = num_decode_threads
 
   def prepare_reader(self, filename_queue, batch_size=16):
     reader = tf.TFRecordReader()
-    _, serialized_examples = reader.read(filename_queue)
+    # Up to batch_size records, fewer at the end of a file.
+    _, serialized_examples = reader.read_up_to(filename_queue, batch_size)
 
     feature_map = {
         "image/id": tf.FixedLenFeature([], tf.int64),
@@ -183,60 +259,95 @@ class ImageCaptionTestReader(BaseReader):
     if FLAGS.localization_attention:
       feature_map["image/localization"] = tf.FixedLenFeature([4*36], tf.float32)
 
-    features = tf.parse_single_example(serialized_examples, features=feature_map)
-    print(" features", features)
-
-    # [1]
-    image_id = features["image/id"] 
-    print(" image_id", image_id)
-
-    filename = features["image/filename"] 
-    print(" filename", filename)
+    features = tf.parse_example(serialized_examples, features=feature_map)
 
-    # [height, width, channels]
-    encoded_image = features["image/data"]
-    image = simple_process_image(encoded_image,
-                                 flip=False,
-                                 is_training=self.is_training)
-    print(" image", image)
+    # [num_records]
+    filenames = features["image/filename"]
 
-    image_id = tf.reshape(image_id,
-                          shape=[1])
-    image = tf.reshape(image, 
-                       shape=[1, FLAGS.image_height, FLAGS.image_width, FLAGS.image_channel])
-    filename = tf.reshape(filename,
-                          shape=[1])
+    # Decode the images of the records in parallel. A nonzero even thread_id
+    # keeps the color ordering of thread 0 but does not create image
+    # summaries inside the loop.
+    images = tf.map_fn(lambda x: simple_process_image(x,
+                                                      thread_id=2,
+                                                      flip=False,
+                                                      is_training=self.is_training),
+                       features["image/data"],
+                       dtype=tf.float32,
+                       parallel_iterations=self.num_decode_threads,
+                       back_prop=False)
+    images.set_shape([None, FLAGS.image_height, FLAGS.image_width, FLAGS.image_channel])
 
     if FLAGS.localization_attention:
       localizations = features["image/localization"]
       localizations = tf.reshape(localizations,
-                               shape=[1, 36, 4])
-      return image, filename, localizations
+                               shape=[-1, 36, 4])
+      return images, filenames, localizations
     else:
-      return image, filename
+      return images, filenames
+
+def _pad_batch(tensors, batch_size):
+  """Pads the first dimension of tensors of a smaller final batch.
+
+  Args:
+    tensors: Tensors of a batch, all with the same first dimension of at most
+      batch_size.
+    batch_size: The static batch size.
+
+  Returns:
+    padded: The tensors padded with zeros (empty strings) to batch_size.
+    valid: A boolean tensor of shape [batch_size], False for the padding.
+  """
+  num_valid = tf.shape(tensors[0])[0]
+  num_padding = batch_size - num_valid
+  padded = []
+  for tensor in tensors:
+    padding = tf.zeros(tf.concat([[num_padding], tf.shape(tensor)[1:]], 0),
+                       dtype=tensor.dtype)
+    padded_tensor = tf.concat([tensor, padding], 0)
+    padded_tensor.set_shape([batch_size] + tensor.get_shape().as_list()[1:])
+    padded.append(padded_tensor)
+  valid = tf.range(batch_size) < num_valid
+  return padded, valid
 
 def get_test_input_data_tensors(reader,
                            data_pattern=None,
                            batch_size=16,
                            num_epochs=1,
                            num_readers=1):
-  reader = ImageCaptionTestReader()
-  logging.info("Using batch size of " + str(batch_size) + " for training.")
-  with tf.name_scope("train_input"):
-    files = gfile.Glob(data_pattern)
-    print("number of training files:", len(files))
+  """Reads every test image exactly once.
+
+  Each reader reads whole files of records in batches, parses them with
+  parse_example and decodes their images on reader.num_decode_threads
+  threads. With a single reader the images come in the order of the sorted
+  files; with more readers files are read in parallel and the order of the
+  images depends on the timing of the readers. The final batch is padded to
+  batch_size.
+
+  Returns:
+    cols: The batched columns of ImageCaptionTestReader.
+    valid: A boolean tensor of shape [batch_size], False for the padding of
+      the final batch.
+  """
+  logging.info("Using batch size of " + str(batch_size) + " for testing.")
+  with tf.name_scope("test_input"):
+    files = sorted(gfile.Glob(data_pattern))
+    logging.debug("Found %d test files matching %s", len(files), data_pattern)
     if not files:
-      raise IOError("Unable to find training files. data_pattern='" +
+      raise IOError("Unable to find test files. data_pattern='" +
                     data_pattern + "'.")
-    logging.info("Number of training files: %s.", str(len(files)))
+    logging.info("Number of test files: %s.", str(len(files)))
     filename_queue = tf.train.string_input_producer(
-        files, num_epochs=num_epochs, shuffle=True)
+        files, num_epochs=num_epochs, shuffle=False)
 
-    training_data = reader.prepare_reader(filename_queue)
+    test_data = [
+        reader.prepare_reader(filename_queue, batch_size=batch_size)
+        for _ in range(num_readers)
+    ]
 
-    return tf.train.batch(
-        training_data,
+    cols = tf.train.batch_join(
+        test_data,
         batch_size=batch_size,
         capacity=batch_size * 8,
-        allow_smaller_final_batch=False,
+        allow_smaller_final_batch=True,
         enqueue_many=True)
+    return _pad_batch(cols, batch_size)
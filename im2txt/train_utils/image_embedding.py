@@ -141,12 +141,12 @@ def inception_v3(images,
               original_net = net
               net = tf.reduce_mean(net, axis=1)
             else:
-              original_net = tf.reshape(net, [tf.cast(shape[0],tf.int32), tf.cast(shape[1]*shape[2],tf.int32), tf.cast(shape[3],tf.int32)])
+              original_net = tf.reshape(net, [-1, tf.cast(shape[1]*shape[2],tf.int32), tf.cast(shape[3],tf.int32)])
               net = slim.avg_pool2d(net, shape[1:3], padding="VALID", scope="pool")
           elif use_box:
             if FLAGS.localization_attention:
               net = localization_attentions(net, localizations)
-            net = tf.reshape(net, [tf.cast(shape[0],tf.int32), tf.cast(shape[1]*shape[2],tf.int32), tf.cast(shape[3],tf.int32)])
+            net = tf.reshape(net, [-1, tf.cast(shape[1]*shape[2],tf.int32), tf.cast(shape[3],tf.int32)])
           else:
             net = slim.avg_pool2d(net, shape[1:3], padding="VALID", scope="pool")
 
@@ -35,6 +35,8 @@ def simple_process_image(encoded_image, thread_id=0, flip=False, is_training=Tru
     encoded_image: A scalar string Tensor; the encoded image.
     thread_id: Preprocessing thread id used to select the ordering of color
       distortions.
+    flip: Whether to flip the image horizontally, see distort_image().
+    is_training: Whether to distort the image.
 
   Returns:
     A float32 Tensor of shape [height, width, 3]; the processed image.
@@ -45,6 +47,7 @@ def simple_process_image(encoded_image, thread_id=0, flip=False, is_training=Tru
                        width=FLAGS.image_width,
                        thread_id=thread_id,
                        image_format=FLAGS.image_format,
+                       raw_image_size=FLAGS.raw_image_size,
                        flip=flip)
 
 def distort_image(image, thread_id, flip=False):
@@ -54,13 +57,21 @@ def distort_image(image, thread_id, flip=False):
     image: A float32 Tensor of shape [height, width, 3] with values in [0, 1).
     thread_id: Preprocessing thread id used to select the ordering of color
       distortions. There should be a multiple of 2 preprocessing threads.
+    flip: Whether to flip the image horizontally. A python bool, or a scalar
+      bool Tensor for a flip decided at run time, in which case only the
+      chosen branch is computed.
 
   Returns:
     distorted_image: A float32 Tensor of shape [height, width, 3] with values in
       [0, 1].
   """
   # Randomly flip horizontally.
-  if flip:
+  if isinstance(flip, tf.Tensor):
+    with tf.name_scope("flip_horizontal", values=[image, flip]):
+      image = tf.cond(flip,
+                      lambda: tf.image.flip_left_right(image),
+                      lambda: image)
+  elif flip:
     with tf.name_scope("flip_horizontal", values=[image]):
       image = tf.image.flip_left_right(image)
 
@@ -92,6 +103,7 @@ def process_image(encoded_image,
                   resize_width=346,
                   thread_id=0,
                   image_format="jpeg",
+                  raw_image_size=346,
                   flip=False):
   """Decode an image, resize and apply random distortions.
 
@@ -106,7 +118,11 @@ def process_image(encoded_image,
     resize_width: If > 0, resize width before crop to final dimensions.
     thread_id: Preprocessing thread id used to select the ordering of color
       distortions. There should be a multiple of 2 preprocessing threads.
-    image_format: "jpeg" or "png".
+    image_format: "jpeg", "png" or "raw", the uint8 pixels of a
+      raw_image_size x raw_image_size x 3 image.
+    raw_image_size: Height and width of raw images.
+    flip: Whether to flip the image horizontally when distorting it, see
+      distort_image().
 
   Returns:
     A float32 Tensor of shape [height, width, 3] with values in [-1, 1].
@@ -126,6 +142,9 @@ def process_image(encoded_image,
       image = tf.image.decode_jpeg(encoded_image, channels=3)
     elif image_format == "png":
       image = tf.image.decode_png(encoded_image, channels=3)
+    elif image_format == "raw":
+      image = tf.reshape(tf.decode_raw(encoded_image, tf.uint8),
+                         [raw_image_size, raw_image_size, 3])
     else:
       raise ValueError("Invalid image format: %s" % image_format)
   image = tf.image.convert_image_dtype(image, dtype=tf.float32)
@@ -134,8 +153,10 @@ def process_image(encoded_image,
   # Resize image.
   assert (resize_height > 0) == (resize_width > 0)
 
+  # Images stored at the resize size by the TFRecord builders skip the resize.
+  stored_size = image.get_shape().as_list()[:2]
   if FLAGS.cropping_images:
-    if resize_height:
+    if resize_height and stored_size != [resize_height, resize_width]:
       image = tf.image.resize_images(image,
                                      size=[resize_height, resize_width],
                                      method=tf.image.ResizeMethod.BILINEAR)
@@ -146,7 +167,7 @@ def process_image(encoded_image,
     else:
       # Central crop, assuming resize_height > height, resize_width > width.
       image = tf.image.resize_image_with_crop_or_pad(image, height, width)
-  else:
+  elif stored_size != [height, width]:
     image = tf.image.resize_images(image,
                                    size=[height, width],
                                    method=tf.image.ResizeMethod.BILINEAR)
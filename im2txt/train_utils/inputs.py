@@ -70,6 +70,79 @@ def parse_sequence_example(serialized, image_feature, caption_feature, flip_capt
   return encoded_image, caption, flip_caption
 
 
+def parse_sequence_example_all_captions(serialized, image_feature,
+                                        caption_feature,
+                                        flip_caption_feature=None):
+  """Parses a SequenceExample holding an image with all its captions.
+
+  These records are written by build_tfrecords.py --image_once: the word ids
+  of the captions are concatenated in caption_feature and their lengths are
+  the context feature image/caption_lengths (image/flip_caption_lengths for
+  flip_caption_feature).
+
+  Args:
+    serialized: A scalar string Tensor; a single serialized SequenceExample.
+    image_feature: Name of SequenceExample context feature containing image
+      data.
+    caption_feature: Name of SequenceExample feature list containing the
+      concatenated integer captions.
+    flip_caption_feature: If not None, name of SequenceExample feature list
+      containing the concatenated flipped captions.
+
+  Returns:
+    encoded_image: A scalar string Tensor containing a JPEG encoded image.
+    captions: A pair of a 2-D int64 Tensor of shape [num_captions,
+      max_length] with the zero-padded captions, and a 1-D int32 Tensor with
+      their lengths.
+    flip_captions: The same pair for the flipped captions, or None.
+  """
+  context_features = {
+      image_feature: tf.FixedLenFeature([], dtype=tf.string),
+      "image/caption_lengths": tf.VarLenFeature(dtype=tf.int64),
+  }
+  sequence_features = {
+      caption_feature: tf.FixedLenSequenceFeature([], dtype=tf.int64),
+  }
+  if flip_caption_feature:
+    context_features["image/flip_caption_lengths"] = tf.VarLenFeature(
+        dtype=tf.int64)
+    sequence_features[flip_caption_feature] = tf.FixedLenSequenceFeature(
+        [], dtype=tf.int64)
+  context, sequence = tf.parse_single_sequence_example(
+      serialized,
+      context_features=context_features,
+      sequence_features=sequence_features)
+
+  def _split(caption_ids, caption_lengths):
+    # int32, like the indices the lengths are sliced with.
+    lengths = tf.to_int32(tf.sparse_tensor_to_dense(caption_lengths))
+    mask = tf.sequence_mask(lengths)
+    captions = tf.scatter_nd(tf.where(mask), caption_ids,
+                             tf.shape(mask, out_type=tf.int64))
+    return captions, lengths
+
+  captions = _split(sequence[caption_feature],
+                    context["image/caption_lengths"])
+  flip_captions = None
+  if flip_caption_feature:
+    flip_captions = _split(sequence[flip_caption_feature],
+                           context["image/flip_caption_lengths"])
+  return context[image_feature], captions, flip_captions
+
+
+def get_data_files(file_pattern):
+  """Returns the files of a comma-separated list of file patterns."""
+  data_files = []
+  for pattern in file_pattern.split(","):
+    data_files.extend(tf.gfile.Glob(pattern))
+  if not data_files:
+    tf.logging.fatal("Found no input files matching %s", file_pattern)
+  else:
+    tf.logging.info("Prefetching values from %d files matching %s",
+                    len(data_files), file_pattern)
+  return data_files
+
+
 def prefetch_input_data(reader,
                         file_pattern,
                         is_training,
@@ -103,14 +176,7 @@ def prefetch_input_data(reader,
   Returns:
     A Queue containing prefetched string values.
   """
-  data_files = []
-  for pattern in file_pattern.split(","):
-    data_files.extend(tf.gfile.Glob(pattern))
-  if not data_files:
-    tf.logging.fatal("Found no input files matching %s", file_pattern)
-  else:
-    tf.logging.info("Prefetching values from %d files matching %s",
-                    len(data_files), file_pattern)
+  data_files = get_data_files(file_pattern)
 
   if is_training:
     filename_queue = tf.train.string_input_producer(
@@ -199,12 +265,7 @@ def batch_with_dynamic_pad(images_and_captions,
   """
   enqueue_list = []
   for image, caption in images_and_captions:
-    caption_length = tf.shape(caption)[0]
-    input_length = tf.expand_dims(tf.subtract(caption_length, 1), 0)
-
-    input_seq = tf.slice(caption, [0], input_length)
-    target_seq = tf.slice(caption, [1], input_length)
-    indicator = tf.ones(input_length, dtype=tf.int32)
+    input_seq, target_seq, indicator = split_caption(caption)
     enqueue_list.append([image, input_seq, target_seq, indicator])
 
   images, input_seqs, target_seqs, mask = tf.train.batch_join(
@@ -215,13 +276,38 @@ def batch_with_dynamic_pad(images_and_captions,
       name="batch_and_pad")
 
   if add_summaries:
-    lengths = tf.add(tf.reduce_sum(mask, 1), 1)
-    tf.summary.scalar("caption_length/batch_min", tf.reduce_min(lengths))
-    tf.summary.scalar("caption_length/batch_max", tf.reduce_max(lengths))
-    tf.summary.scalar("caption_length/batch_mean", tf.reduce_mean(lengths))
+    add_caption_length_summaries(mask)
   
   return images, input_seqs, target_seqs, mask
 
+def split_caption(caption):
+  """Splits a caption into an input sequence, a target sequence and a mask.
+
+  See batch_with_dynamic_pad().
+
+  Args:
+    caption: A 1-D Tensor of word ids, starting with the start word.
+
+  Returns:
+    input_seq: The caption without its last word.
+    target_seq: The caption without its first word.
+    indicator: An int32 Tensor of ones of the same length.
+  """
+  caption_length = tf.shape(caption)[0]
+  input_length = tf.expand_dims(tf.subtract(caption_length, 1), 0)
+
+  input_seq = tf.slice(caption, [0], input_length)
+  target_seq = tf.slice(caption, [1], input_length)
+  indicator = tf.ones(input_length, dtype=tf.int32)
+  return input_seq, target_seq, indicator
+
+def add_caption_length_summaries(mask):
+  lengths = tf.add(tf.reduce_sum(mask, 1), 1)
+  tf.summary.scalar("caption_length/batch_min", tf.reduce_min(lengths))
+  tf.summary.scalar("caption_length/batch_max", tf.reduce_max(lengths))
+  tf.summary.scalar("caption_length/batch_mean", tf.reduce_mean(lengths))
+
+
 def caption_to_attributes_target(caption, mask):
   unique_ids, _ = tf.unique(caption)
   attributes_target = tf.reduce_sum(tf.one_hot(unique_ids, tf.shape(mask)[0]), axis=0) * mask
@@ -240,7 +326,259 @@ def caption_to_multi_labels(captions):
   print("labels", labels)
   return labels
 
+def get_caption_length_boundaries():
+  """Returns the bucket boundaries of --caption_length_buckets."""
+  return [int(x) for x in FLAGS.caption_length_buckets.split(",") if x]
+
+def bucket_by_caption_length(dataset, length_fn, batch_size,
+                             padded_shapes=None):
+  """Batches the elements of a dataset with similar caption lengths.
+
+  An element with length l goes to bucket i, the number of boundaries of
+  --caption_length_buckets less or equal to l, and each batch is taken from a
+  single bucket.
+
+  Args:
+    dataset: A tf.data.Dataset of unbatched elements.
+    length_fn: A function of the components of an element returning its
+      caption length as a scalar Tensor.
+    batch_size: Batch size.
+    padded_shapes: If not None, the batches are padded to these shapes as with
+      padded_batch(), otherwise the components must have static shapes.
+
+  Returns:
+    A dataset of batches.
+  """
+  boundaries = tf.constant(get_caption_length_boundaries(), dtype=tf.int64)
+
+  def _bucket(*cols):
+    length = tf.to_int64(length_fn(*cols))
+    return tf.reduce_sum(tf.to_int64(tf.greater_equal(length, boundaries)))
+
+  def _batch(unused_bucket, window):
+    if padded_shapes is None:
+      return window.batch(batch_size)
+    return window.padded_batch(batch_size, padded_shapes=padded_shapes)
+
+  return dataset.apply(tf.contrib.data.group_by_window(
+      _bucket, _batch, window_size=batch_size))
+
+def add_bucket_summaries(lengths, padded_length=None):
+  """Adds summaries of the caption length buckets of the training batches.
+
+  Summarizes the number of examples batched from each bucket so far, the
+  fraction of the decoder steps of the batch spent on padding, and the
+  fraction of steps saved compared to padding to padded_length.
+
+  Args:
+    lengths: An int Tensor of caption lengths, with the batch as first
+      dimension.
+    padded_length: The length all captions were padded to without buckets. If
+      None, the longest caption seen so far.
+
+  Returns:
+    An op updating the bucket counts, to be run with each batch.
+  """
+  boundaries = get_caption_length_boundaries()
+  lengths = tf.to_int64(lengths)
+  batch_length = tf.reduce_max(lengths)
+  bucket = tf.reduce_sum(tf.to_int32(tf.greater_equal(batch_length, boundaries)))
+  with tf.variable_scope("caption_length_buckets"):
+    counts = tf.get_variable("counts", shape=[len(boundaries) + 1],
+                             dtype=tf.int64,
+                             initializer=tf.zeros_initializer(),
+                             trainable=False,
+                             collections=[tf.GraphKeys.LOCAL_VARIABLES])
+    update_ops = [tf.scatter_add(counts, [bucket],
+                                 [tf.shape(lengths, out_type=tf.int64)[0]])]
+    if padded_length is None:
+      longest = tf.get_variable("longest", shape=[], dtype=tf.int64,
+                                initializer=tf.zeros_initializer(),
+                                trainable=False,
+                                collections=[tf.GraphKeys.LOCAL_VARIABLES])
+      padded_length = tf.assign(longest, tf.maximum(longest, batch_length))
+      update_ops.append(padded_length)
+
+  for i in range(len(boundaries) + 1):
+    tf.summary.scalar("caption_length/bucket_%d_examples" % i, counts[i])
+  batch_length = tf.to_float(batch_length)
+  tf.summary.scalar("caption_length/padding_fraction",
+                    1.0 - tf.to_float(tf.reduce_sum(lengths)) /
+                    (tf.to_float(tf.size(lengths)) * batch_length))
+  tf.summary.scalar("caption_length/padding_fraction_saved",
+                    1.0 - batch_length / tf.to_float(padded_length))
+  return tf.group(*update_ops)
+
+def parse_and_process_all_captions(serialized_sequence_example, thread_id,
+                                   is_training):
+  """Parses a SequenceExample with all captions of an image, see
+  parse_sequence_example_all_captions(), and processes its image once.
+
+  Returns:
+    image: A float32 Tensor of shape [height, width, 3].
+    captions: A 2-D int64 Tensor of shape [num_captions, max_length].
+    lengths: A 1-D int32 Tensor with the lengths of the captions.
+  """
+  flip_caption_feature = None
+  if FLAGS.support_flip:
+    flip_caption_feature = FLAGS.flip_caption_feature_name
+  encoded_image, captions, flip_captions = parse_sequence_example_all_captions(
+      serialized_sequence_example,
+      image_feature=FLAGS.image_feature_name,
+      caption_feature=FLAGS.caption_feature_name,
+      flip_caption_feature=flip_caption_feature)
+  if FLAGS.support_flip:
+    flip = tf.less(tf.random_uniform([],0,1.0), 0.5)
+    image = simple_process_image(encoded_image, thread_id=thread_id, flip=flip, is_training=is_training)
+    captions = tf.cond(flip,
+                       lambda: flip_captions,
+                       lambda: captions)
+  else:
+    image = simple_process_image(encoded_image, thread_id=thread_id, flip=False, is_training=is_training)
+  return image, captions[0], captions[1]
+
+def parse_and_process(serialized_sequence_example, thread_id, is_training):
+  """Parses a SequenceExample and processes its image.
+
+  With --support_flip, the image and the caption are flipped at random. The
+  flip is decided first, so the image is decoded once and only flipped if
+  chosen. With --caption_layout=sample, the caption is one of the captions of
+  the record, at random.
+
+  Returns:
+    image: A float32 Tensor of shape [height, width, 3].
+    caption: A 1-D int64 Tensor of word ids.
+  """
+  if FLAGS.caption_layout == "sample":
+    image, captions, lengths = parse_and_process_all_captions(
+        serialized_sequence_example, thread_id, is_training)
+    index = tf.random_uniform([], 0, tf.shape(lengths)[0], dtype=tf.int32)
+    return image, captions[index, :lengths[index]]
+  elif FLAGS.support_flip:
+    encoded_image, caption, flip_caption = parse_sequence_example(
+        serialized_sequence_example,
+        image_feature=FLAGS.image_feature_name,
+        caption_feature=FLAGS.caption_feature_name,
+        flip_caption_feature=FLAGS.flip_caption_feature_name)
+    # random decides flip or not
+    flip = tf.less(tf.random_uniform([],0,1.0), 0.5)
+    image = simple_process_image(encoded_image, thread_id=thread_id, flip=flip, is_training=is_training)
+    maybe_flip_caption = tf.cond(flip,
+                                 lambda: flip_caption,
+                                 lambda: caption)
+    return image, maybe_flip_caption
+  else:
+    encoded_image, caption, _ = parse_sequence_example(
+        serialized_sequence_example,
+        image_feature=FLAGS.image_feature_name,
+        caption_feature=FLAGS.caption_feature_name)
+    image = simple_process_image(encoded_image, thread_id=thread_id, flip=False, is_training=is_training)
+  return image, caption
+
+def get_images_and_captions_from_dataset(is_training):
+  """Reads batches of images and captions with a tf.data pipeline.
+
+  Equivalent to the queue runners of get_images_and_captions(): shards are
+  read in parallel by an interleave over --num_parallel_reads files, records
+  are shuffled in a buffer of values_per_input_shard *
+  input_queue_capacity_factor, parsed and processed on
+  --num_preprocess_threads threads, padded to the longest caption of the
+  batch and prefetched --dataset_prefetch_batches batches ahead. With
+  --caption_length_buckets, batches are taken from buckets of similar caption
+  lengths. With --caption_layout=all, each record yields an example for each
+  of its captions, which share the processed image.
+
+  Returns:
+    images, input_seqs, target_seqs, input_mask, as batch_with_dynamic_pad().
+  """
+  data_files = get_data_files(FLAGS.input_file_pattern)
+  with tf.name_scope("input_dataset"):
+    dataset = tf.data.Dataset.from_tensor_slices(data_files)
+    if is_training:
+      dataset = dataset.shuffle(len(data_files))
+    dataset = dataset.repeat()
+    dataset = dataset.apply(tf.contrib.data.parallel_interleave(
+        tf.data.TFRecordDataset,
+        cycle_length=FLAGS.num_parallel_reads,
+        sloppy=is_training))
+    if is_training:
+      dataset = dataset.shuffle(
+          FLAGS.values_per_input_shard * FLAGS.input_queue_capacity_factor)
+
+    def _process(serialized_sequence_example):
+      # The queue threads alternate the two orderings of color distortions,
+      # here one is picked at random. Nonzero thread ids do not create image
+      # summaries, which cannot be created in a dataset function.
+      image, caption = tf.cond(
+          tf.less(tf.random_uniform([],0,1.0), 0.5),
+          lambda: parse_and_process(serialized_sequence_example, 2, is_training),
+          lambda: parse_and_process(serialized_sequence_example, 3, is_training))
+      image.set_shape([FLAGS.image_height, FLAGS.image_width, 3])
+      input_seq, target_seq, indicator = split_caption(caption)
+      return image, input_seq, target_seq, indicator
+
+    def _process_all_captions(serialized_sequence_example):
+      image, captions, lengths = tf.cond(
+          tf.less(tf.random_uniform([],0,1.0), 0.5),
+          lambda: parse_and_process_all_captions(
+              serialized_sequence_example, 2, is_training),
+          lambda: parse_and_process_all_captions(
+              serialized_sequence_example, 3, is_training))
+      image.set_shape([FLAGS.image_height, FLAGS.image_width, 3])
+      images = tf.tile(tf.expand_dims(image, 0),
+                       tf.stack([tf.shape(lengths)[0], 1, 1, 1]))
+      return images, captions, lengths
+
+    def _split_caption(image, caption, length):
+      input_seq, target_seq, indicator = split_caption(caption[:length])
+      return image, input_seq, target_seq, indicator
+
+    if FLAGS.caption_layout == "all":
+      dataset = dataset.map(_process_all_captions,
+                            num_parallel_calls=FLAGS.num_preprocess_threads)
+      dataset = dataset.flat_map(
+          lambda *cols: tf.data.Dataset.from_tensor_slices(cols))
+      dataset = dataset.map(_split_caption)
+      if is_training:
+        # Spread the captions of an image over several batches.
+        dataset = dataset.shuffle(FLAGS.batch_size * 8)
+    else:
+      dataset = dataset.map(_process,
+                            num_parallel_calls=FLAGS.num_preprocess_threads)
+    padded_shapes = ([FLAGS.image_height, FLAGS.image_width, 3],
+                     [None], [None], [None])
+    if get_caption_length_boundaries():
+      dataset = bucket_by_caption_length(
+          dataset, lambda image, input_seq, *_: tf.shape(input_seq)[0],
+          FLAGS.batch_size, padded_shapes=padded_shapes)
+    else:
+      dataset = dataset.padded_batch(FLAGS.batch_size,
+                                     padded_shapes=padded_shapes)
+    dataset = dataset.prefetch(FLAGS.dataset_prefetch_batches)
+    images, input_seqs, target_seqs, input_mask = (
+        dataset.make_one_shot_iterator().get_next())
+    if get_caption_length_boundaries():
+      with tf.control_dependencies(
+          [add_bucket_summaries(tf.reduce_sum(input_mask, 1))]):
+        images = tf.identity(images)
+
+  # The dataset repeats, so all batches are full.
+  images.set_shape([FLAGS.batch_size, FLAGS.image_height, FLAGS.image_width, 3])
+  for seqs in [input_seqs, target_seqs, input_mask]:
+    seqs.set_shape([FLAGS.batch_size, None])
+  add_caption_length_summaries(input_mask)
+  return images, input_seqs, target_seqs, input_mask
+
 def get_images_and_captions(is_training):
+  if FLAGS.input_pipeline == "dataset":
+    return get_images_and_captions_from_dataset(is_training)
+
+  if get_caption_length_boundaries():
+    raise ValueError("--caption_length_buckets requires "
+                     "--input_pipeline=dataset")
+  if FLAGS.caption_layout == "all":
+    raise ValueError("--caption_layout=all requires --input_pipeline=dataset")
+
   # Prefetch serialized SequenceExample protos.
   input_queue = prefetch_input_data(
       tf.TFRecordReader(),
@@ -257,27 +595,8 @@ def get_images_and_captions(is_training):
   images_and_captions = []
   for thread_id in range(FLAGS.num_preprocess_threads):
     serialized_sequence_example = input_queue.dequeue()
-    if FLAGS.support_flip:
-      encoded_image, caption, flip_caption = parse_sequence_example(
-          serialized_sequence_example,
-          image_feature=FLAGS.image_feature_name,
-          caption_feature=FLAGS.caption_feature_name,
-          flip_caption_feature=FLAGS.flip_caption_feature_name)
-      # random decides flip or not
-      flip_image = simple_process_image(encoded_image, thread_id=thread_id, flip=True, is_training=is_training)
-      image = simple_process_image(encoded_image, thread_id=thread_id, flip=False, is_training=is_training)
-      maybe_flip_image, maybe_flip_caption = tf.cond(
-                          tf.less(tf.random_uniform([],0,1.0), 0.5), 
-                          lambda: [flip_image, flip_caption], 
-                          lambda: [image, caption])
-      images_and_captions.append([maybe_flip_image, maybe_flip_caption])
-    else:
-      encoded_image, caption, _ = parse_sequence_example(
-          serialized_sequence_example,
-          image_feature=FLAGS.image_feature_name,
-          caption_feature=FLAGS.caption_feature_name)
-      image = simple_process_image(encoded_image, thread_id=thread_id, flip=False, is_training=is_training)
-      images_and_captions.append([image, caption])
+    images_and_captions.append(
+        parse_and_process(serialized_sequence_example, thread_id, is_training))
 
   # Batch inputs.
   queue_capacity = (2 * FLAGS.num_preprocess_threads *
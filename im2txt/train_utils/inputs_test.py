@@ -0,0 +1,94 @@
+# Copyright 2016 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for the parsing of records with all captions of an image."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+
+import numpy as np
+import tensorflow as tf
+
+import im2txt_model  # Defines the flags of the input pipeline.
+from train_utils import inputs
+
+FLAGS = tf.flags.FLAGS
+
+_CAPTIONS = [[1, 7, 8, 2], [1, 9, 2], [1, 10, 11, 12, 13, 2]]
+
+
+def _int64_feature_list(values):
+  return tf.train.FeatureList(feature=[
+      tf.train.Feature(int64_list=tf.train.Int64List(value=[v]))
+      for v in values])
+
+
+class AllCaptionsTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(AllCaptionsTest, self).setUp()
+    self._saved_flags = (FLAGS.caption_layout, FLAGS.support_flip)
+    FLAGS.support_flip = False
+
+    # A record as written by build_tfrecords.py --image_once.
+    with tf.Graph().as_default(), self.test_session() as sess:
+      encoded_image = sess.run(tf.image.encode_jpeg(
+          tf.zeros([48, 64, 3], dtype=tf.uint8)))
+    context = tf.train.Features(feature={
+        "image/id": tf.train.Feature(
+            int64_list=tf.train.Int64List(value=[1])),
+        "image/data": tf.train.Feature(
+            bytes_list=tf.train.BytesList(value=[encoded_image])),
+        "image/caption_lengths": tf.train.Feature(
+            int64_list=tf.train.Int64List(
+                value=[len(caption) for caption in _CAPTIONS])),
+    })
+    feature_lists = tf.train.FeatureLists(feature_list={
+        "image/caption_ids": _int64_feature_list(sum(_CAPTIONS, [])),
+    })
+    self._record = tf.train.SequenceExample(
+        context=context, feature_lists=feature_lists).SerializeToString()
+
+  def tearDown(self):
+    FLAGS.caption_layout, FLAGS.support_flip = self._saved_flags
+    super(AllCaptionsTest, self).tearDown()
+
+  def testAllCaptions(self):
+    FLAGS.caption_layout = "all"
+    image, captions, lengths = inputs.parse_and_process_all_captions(
+        tf.constant(self._record), thread_id=2, is_training=False)
+    self.assertEqual(tf.int32, lengths.dtype)
+    with self.test_session() as sess:
+      image, captions, lengths = sess.run([image, captions, lengths])
+    self.assertEqual((FLAGS.image_height, FLAGS.image_width, 3), image.shape)
+    self.assertEqual([len(caption) for caption in _CAPTIONS], list(lengths))
+    for caption, padded, length in zip(_CAPTIONS, captions, lengths):
+      self.assertEqual(caption, list(padded[:length]))
+      self.assertFalse(np.any(padded[length:]))
+
+  def testSampleCaption(self):
+    FLAGS.caption_layout = "sample"
+    _, caption = inputs.parse_and_process(
+        tf.constant(self._record), thread_id=2, is_training=False)
+    with self.test_session() as sess:
+      sampled = [list(sess.run(caption)) for _ in range(20)]
+    for caption in sampled:
+      self.assertIn(caption, _CAPTIONS)
+
+
+if __name__ == "__main__":
+  tf.test.main()
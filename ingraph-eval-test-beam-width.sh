@@ -30,6 +30,7 @@ for beam_width in 20 15 10 7 5 3 2 1; do
         --vocab_file=${DIR}/data/word_counts.txt \
         --output=${OUTPUT_DIR}/part-${prefix}.json \
         --beam_width=$beam_width \
+        --beam_search_early_stopping=True \
         --model=${model} \
         --support_ingraph=True \
         --gpu_memory_fraction=$gpu_fraction"
@@ -0,0 +1,34 @@
+#!/bin/bash
+
+DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
+
+model_name="show_and_tell_in_graph_model_finetune"
+gpu_fraction=0.90
+device=1
+model=ShowAndTellInGraphModel
+
+MODEL_DIR="${DIR}/model/${model_name}"
+VALIDATE_IMAGE_DIR="${DIR}/data/ai_challenger_caption_validation_20170910/caption_validation_images_20170910"
+VALIDATE_REFERENCE_FILE="${DIR}/data/ai_challenger_caption_validation_20170910/reference.json"
+
+# decode every selected checkpoint in one process, writes model.ckpt-*.eval/out.json
+cd ${DIR}/im2txt
+CUDA_VISIBLE_DEVICES=$device python inference_sweep.py \
+  --input_file_pattern="${VALIDATE_IMAGE_DIR}/*.jpg" \
+  --checkpoint_dir=${MODEL_DIR} \
+  --checkpoint_every_n_steps=20000 \
+  --vocab_file=${DIR}/data/word_counts.txt \
+  --model=${model} \
+  --support_ingraph=True \
+  --batched_image_feed=True \
+  --batch_size=16 \
+  --gpu_memory_fraction=$gpu_fraction
+
+for ckpt in $(ls ${MODEL_DIR} | python ${DIR}/tools/every_n_step.py 20000); do 
+  OUTPUT_DIR="${MODEL_DIR}/model.ckpt-${ckpt}.eval"
+
+  if [ ! -f ${OUTPUT_DIR}/out.eval ]; then
+    python ${DIR}/tools/eval/run_evaluations.py --submit ${OUTPUT_DIR}/out.json --ref $VALIDATE_REFERENCE_FILE | tee ${OUTPUT_DIR}/out.eval | grep ^Eval
+    echo eval result saved to ${OUTPUT_DIR}/out.eval
+  fi
+done
@@ -0,0 +1,53 @@
+#!/bin/bash
+
+# Exports a model as float32 and int8 frozen graphs, captions the validation
+# images with both and reports the score deltas of int8, CIDEr included.
+
+DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
+
+model_name="show_and_tell_in_graph_model_fromscratch"
+model=ShowAndTellInGraphModel
+ckpt=420000
+num_workers=4
+num_calibration_images=200
+
+MODEL_DIR="${DIR}/model/${model_name}"
+VALIDATE_IMAGE_DIR="${DIR}/data/ai_challenger_caption_validation_20170910/caption_validation_images_20170910"
+VALIDATE_REFERENCE_FILE="${DIR}/data/ai_challenger_caption_validation_20170910/reference.json"
+
+CHECKPOINT_PATH="${MODEL_DIR}/model.ckpt-$ckpt"
+OUTPUT_DIR="${MODEL_DIR}/model.ckpt-${ckpt}.quantized"
+
+mkdir -p $OUTPUT_DIR
+
+cd ${DIR}/im2txt
+
+for precision in float32 int8; do
+  if [ ! -f ${OUTPUT_DIR}/${precision}.pb ]; then
+    python export_frozen_graph.py \
+      --checkpoint_path=${CHECKPOINT_PATH} \
+      --output_graph=${OUTPUT_DIR}/${precision}.pb \
+      --model=${model} \
+      --support_ingraph=True \
+      --quantize=$([ $precision = int8 ] && echo True || echo False) \
+      --calibration_file_pattern="${VALIDATE_IMAGE_DIR}/0*.jpg" \
+      --num_calibration_images=$num_calibration_images
+  fi
+
+  if [ ! -f ${OUTPUT_DIR}/${precision}.json ]; then
+    time python parallel_inference.py \
+      --input_file_pattern="${VALIDATE_IMAGE_DIR}/*.jpg" \
+      --frozen_graph=${OUTPUT_DIR}/${precision}.pb \
+      --vocab_file=${DIR}/data/word_counts.txt \
+      --output=${OUTPUT_DIR}/${precision}.json \
+      --num_workers=$num_workers
+  fi
+done
+
+cd ${DIR}/tools/eval
+
+python compare_evaluations.py \
+  --baseline ${OUTPUT_DIR}/float32.json \
+  --submit ${OUTPUT_DIR}/int8.json \
+  --ref $VALIDATE_REFERENCE_FILE | tee ${OUTPUT_DIR}/int8.eval | grep ^Delta
+echo eval result saved to ${OUTPUT_DIR}/int8.eval
@@ -68,6 +68,7 @@ def process_image(encoded_image,
                   resize_width=346,
                   thread_id=0,
                   image_format="jpeg",
+                  raw_image_size=346,
                   flip=False):
   """Decode an image, resize and apply random distortions.
 
@@ -82,7 +83,9 @@ def process_image(encoded_image,
     resize_width: If > 0, resize width before crop to final dimensions.
     thread_id: Preprocessing thread id used to select the ordering of color
       distortions. There should be a multiple of 2 preprocessing threads.
-    image_format: "jpeg" or "png".
+    image_format: "jpeg", "png" or "raw", the uint8 pixels of a
+      raw_image_size x raw_image_size x 3 image.
+    raw_image_size: Height and width of raw images.
 
   Returns:
     A float32 Tensor of shape [height, width, 3] with values in [-1, 1].
@@ -102,6 +105,9 @@ def process_image(encoded_image,
       image = tf.image.decode_jpeg(encoded_image, channels=3)
     elif image_format == "png":
       image = tf.image.decode_png(encoded_image, channels=3)
+    elif image_format == "raw":
+      image = tf.reshape(tf.decode_raw(encoded_image, tf.uint8),
+                         [raw_image_size, raw_image_size, 3])
     else:
       raise ValueError("Invalid image format: %s" % image_format)
   image = tf.image.convert_image_dtype(image, dtype=tf.float32)
@@ -109,7 +115,9 @@ def process_image(encoded_image,
 
   # Resize image.
   assert (resize_height > 0) == (resize_width > 0)
-  if resize_height:
+  # Images stored at the resize size by the TFRecord builder skip the resize.
+  stored_size = image.get_shape().as_list()[:2]
+  if resize_height and stored_size != [resize_height, resize_width]:
     image = tf.image.resize_images(image,
                                    size=[resize_height, resize_width],
                                    method=tf.image.ResizeMethod.BILINEAR)
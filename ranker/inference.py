@@ -95,13 +95,12 @@ def main(_):
         k += 1
 
         image_ids, captions, seqlens, scores = sess.run([model.image_ids, model.captions, model.seqlens, model.output_scores])
+        caption_strs = vocab.decode_batch(captions, lengths=seqlens)
 
         for i in xrange(len(image_ids)):
           image_id = image_ids[i]
-          caption = captions[i,:]
-          seqlen = seqlens[i]
           score = scores[i,0]
-          caption_str = "".join([vocab.id_to_word(w) for w in caption[:seqlen]])
+          caption_str = caption_strs[i]
           results.append("\t".join([image_id, caption_str, str(score)])+"\n")
     except Exception as e:
       print(e)
@@ -49,7 +49,11 @@ tf.flags.DEFINE_integer("embedding_size", 512,
                         "Word embedding dimension.")
 
 tf.flags.DEFINE_string("image_format", "jpeg",
-                        "Image format: jpeg or png.")
+                        "Image format: jpeg, png or raw. raw is for records built "
+                        "with --stored_image_format=raw.")
+tf.flags.DEFINE_integer("raw_image_size", 346,
+                        "Height and width of the uint8 pixels of raw images, the "
+                        "--stored_image_size of the TFRecord builder.")
 tf.flags.DEFINE_integer("num_readers", 4,
                         "Number of threads for reading data.")
 tf.flags.DEFINE_integer("image_height", 299,
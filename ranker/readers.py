@@ -63,7 +63,9 @@ class ImageCaptionReader(BaseReader):
     images = tf.stack([process_image(encoded_image, 
                           is_training=True, 
                           height=FLAGS.image_height, 
-                          width=FLAGS.image_width)
+                          width=FLAGS.image_width,
+                          image_format=FLAGS.image_format,
+                          raw_image_size=FLAGS.raw_image_size)
                       for i in range(self.lines_per_image)])
     print(" image", images)
 
@@ -115,7 +117,9 @@ class ImageCaptionTestReader(BaseReader):
     images = tf.stack([process_image(encoded_image, 
                           is_training=False, 
                           height=FLAGS.image_height, 
-                          width=FLAGS.image_width)
+                          width=FLAGS.image_width,
+                          image_format=FLAGS.image_format,
+                          raw_image_size=FLAGS.raw_image_size)
                       for i in range(self.lines_per_image)])
     print(" image", images)
 
@@ -19,8 +19,19 @@ from __future__ import division
 from __future__ import print_function
 
 
+import os
+import sys
+
+import numpy as np
 import tensorflow as tf
 
+# The binary vocabulary format is shared with im2txt; the ranker scripts run
+# from ranker/, so the repository root is added to the path to import it.
+_REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+if _REPO_ROOT not in sys.path:
+  sys.path.append(_REPO_ROOT)
+from im2txt.inference_utils import binary_vocab
+
 
 class Vocabulary(object):
   """Vocabulary class for an image-to-text model."""
@@ -35,7 +46,9 @@ class Vocabulary(object):
     Args:
       vocab_file: File containing the vocabulary, where the words are the first
         whitespace-separated token on each line (other tokens are ignored) and
-        the word ids are the corresponding line numbers.
+        the word ids are the corresponding line numbers, or the same
+        vocabulary in the binary format of
+        im2txt/inference_utils/binary_vocab.py.
       start_word: Special word denoting sentence start.
       end_word: Special word denoting sentence end.
       unk_word: Special word denoting unknown words.
@@ -44,27 +57,47 @@ class Vocabulary(object):
       tf.logging.fatal("Vocab file %s not found.", vocab_file)
     tf.logging.info("Initializing vocabulary from file: %s", vocab_file)
 
-    with tf.gfile.GFile(vocab_file, mode="r") as f:
-      reverse_vocab = list(f.readlines())
-    reverse_vocab = [line.split()[0] for line in reverse_vocab]
-    assert start_word in reverse_vocab
-    assert end_word in reverse_vocab
-    if unk_word not in reverse_vocab:
-      reverse_vocab.append(unk_word)
-    vocab = dict([(x, y) for (y, x) in enumerate(reverse_vocab)])
+    self._unk_word = unk_word
+    if binary_vocab.is_binary_vocab(vocab_file):
+      # Look the words up in the mapped file instead of loading them all.
+      self._binary_vocab = binary_vocab.BinaryVocab(vocab_file)
+      self.start_id = self._binary_vocab.word_to_id(start_word)
+      self.end_id = self._binary_vocab.word_to_id(end_word)
+      assert self.start_id is not None
+      assert self.end_id is not None
+      self._num_words = len(self._binary_vocab)
+      self.unk_id = self._binary_vocab.word_to_id(unk_word)
+      if self.unk_id is None:
+        self.unk_id = self._num_words
+        self._num_words += 1
+    else:
+      self._binary_vocab = None
+      reverse_vocab, _ = binary_vocab.load_words(vocab_file)
+      assert start_word in reverse_vocab
+      assert end_word in reverse_vocab
+      if unk_word not in reverse_vocab:
+        reverse_vocab.append(unk_word)
+      vocab = dict([(x, y) for (y, x) in enumerate(reverse_vocab)])
+
+      self.vocab = vocab  # vocab[word] = id
+      self.reverse_vocab = reverse_vocab  # reverse_vocab[id] = word
 
-    tf.logging.info("Created vocabulary with %d words" % len(vocab))
+      # Save special word ids.
+      self.start_id = vocab[start_word]
+      self.end_id = vocab[end_word]
+      self.unk_id = vocab[unk_word]
+      self._num_words = len(reverse_vocab)
 
-    self.vocab = vocab  # vocab[word] = id
-    self.reverse_vocab = reverse_vocab  # reverse_vocab[id] = word
+      # Words by id, followed by "" for the positions decode_batch() drops.
+      self._words = np.array(reverse_vocab + [""], dtype=object)
 
-    # Save special word ids.
-    self.start_id = vocab[start_word]
-    self.end_id = vocab[end_word]
-    self.unk_id = vocab[unk_word]
+    tf.logging.info("Created vocabulary with %d words" % self._num_words)
 
   def word_to_id(self, word):
     """Returns the integer word id of a word string."""
+    if self._binary_vocab is not None:
+      word_id = self._binary_vocab.word_to_id(word)
+      return self.unk_id if word_id is None else word_id
     if word in self.vocab:
       return self.vocab[word]
     else:
@@ -72,7 +105,69 @@ class Vocabulary(object):
 
   def id_to_word(self, word_id):
     """Returns the word string of an integer word id."""
-    if word_id >= len(self.reverse_vocab):
-      return self.reverse_vocab[self.unk_id]
-    else:
+    if word_id >= self._num_words:
+      word_id = self.unk_id
+    if self._binary_vocab is None:
       return self.reverse_vocab[word_id]
+    if word_id >= len(self._binary_vocab):
+      return self._unk_word
+    return self._binary_vocab.id_to_word(word_id)
+
+  def _lookup_words(self, word_ids):
+    """Returns an object array of the words of word_ids, "" for _num_words."""
+    if self._binary_vocab is None:
+      return self._words[word_ids]
+    # Look up each distinct id of the batch once.
+    unique_ids, inverse = np.unique(word_ids, return_inverse=True)
+    words = np.array([self.id_to_word(word_id) if word_id < self._num_words
+                      else "" for word_id in unique_ids.tolist()],
+                     dtype=object)
+    return words[inverse].reshape(word_ids.shape)
+
+  def decode_batch(self, word_ids, lengths=None, separator=""):
+    """Converts a batch of word id sequences to strings at once.
+
+    Each sequence is cut at its first end word, and the start word and
+    negative ids (padding) are dropped. Ids out of the vocabulary are decoded
+    as the unknown word.
+
+    Args:
+      word_ids: An integer array of shape [..., time], e.g. [batch, beam,
+        time], or a list of word id lists of different lengths.
+      lengths: Optional integer array of shape [...], the number of ids of
+        each sequence to decode.
+      separator: The string joining the words of a sequence.
+
+    Returns:
+      The strings as nested lists of shape [...].
+    """
+    if isinstance(word_ids, np.ndarray):
+      word_ids = word_ids.astype(np.int64)
+    elif not word_ids:
+      return []
+    else:
+      # Pad a list of sequences with -1.
+      sequences = [np.asarray(ids, dtype=np.int64).reshape(-1) for ids in word_ids]
+      padded = np.full([len(sequences), max(len(ids) for ids in sequences)],
+                       -1, dtype=np.int64)
+      for i, ids in enumerate(sequences):
+        padded[i, :len(ids)] = ids
+      word_ids = padded
+    batch_shape = word_ids.shape[:-1]
+    num_steps = word_ids.shape[-1]
+
+    keep = np.cumsum(word_ids == self.end_id, axis=-1) == 0
+    keep &= (word_ids >= 0) & (word_ids != self.start_id)
+    if lengths is not None:
+      keep &= np.arange(num_steps) < np.expand_dims(lengths, -1)
+    word_ids = np.where(word_ids < self._num_words, word_ids, self.unk_id)
+    words = self._lookup_words(np.where(keep, word_ids, self._num_words))
+
+    num_sequences = int(np.prod(batch_shape))
+    words = words.reshape(num_sequences, num_steps)
+    sentences = np.empty(num_sequences, dtype=object)
+    if separator:
+      sentences[:] = [separator.join([w for w in row if w]) for row in words]
+    else:
+      sentences[:] = ["".join(row) for row in words]
+    return sentences.reshape(batch_shape).tolist()
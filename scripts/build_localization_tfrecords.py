@@ -110,6 +110,19 @@ tf.flags.DEFINE_integer("num_refs", 5,
 tf.flags.DEFINE_string("task", "train",
                        "Options are train/validate/test1/test2.")
 
+tf.flags.DEFINE_integer("stored_image_size", 0,
+                        "If > 0, store the images resized to stored_image_size x "
+                        "stored_image_size, e.g. 346, the size process_image() "
+                        "resizes to before cropping, instead of the original "
+                        "JPEG files.")
+tf.flags.DEFINE_string("stored_image_format", "jpeg",
+                       "Format of the resized images: jpeg, re-encoded with "
+                       "--stored_image_jpeg_quality, or raw uint8 pixels. Train "
+                       "on raw images with --image_format=raw "
+                       "--raw_image_size=<stored_image_size>.")
+tf.flags.DEFINE_integer("stored_image_jpeg_quality", 95,
+                        "JPEG quality of the resized images, 0 to 100.")
+
 FLAGS = tf.flags.FLAGS
 
 
@@ -205,6 +218,19 @@ class ImageDecoder(object):
         self._encoded_jpeg = tf.placeholder(dtype=tf.string)
         self._decode_jpeg = tf.image.decode_jpeg(self._encoded_jpeg, channels=3)
 
+        # TensorFlow ops resizing images for --stored_image_size, like
+        # process_image() does before cropping.
+        self._stored_image = None
+        if FLAGS.stored_image_size > 0:
+            image = tf.image.convert_image_dtype(self._decode_jpeg, dtype=tf.float32)
+            image = tf.image.resize_images(image,
+                                           size=[FLAGS.stored_image_size, FLAGS.stored_image_size],
+                                           method=tf.image.ResizeMethod.BILINEAR)
+            image = tf.image.convert_image_dtype(image, dtype=tf.uint8)
+            if FLAGS.stored_image_format == "jpeg":
+                image = tf.image.encode_jpeg(image, quality=FLAGS.stored_image_jpeg_quality)
+            self._stored_image = image
+
     def decode_jpeg(self, encoded_jpeg):
         image = self._sess.run(self._decode_jpeg,
                                feed_dict={self._encoded_jpeg: encoded_jpeg})
@@ -212,6 +238,21 @@ class ImageDecoder(object):
         assert image.shape[2] == 3
         return image
 
+    def to_stored_image(self, encoded_jpeg):
+        """Returns the bytes to store for a JPEG image, checking that it decodes.
+
+        These are the original bytes, or with --stored_image_size the resized
+        image as JPEG or raw uint8 pixels.
+        """
+        if self._stored_image is None:
+            self.decode_jpeg(encoded_jpeg)
+            return encoded_jpeg
+        image = self._sess.run(self._stored_image,
+                               feed_dict={self._encoded_jpeg: encoded_jpeg})
+        if FLAGS.stored_image_format == "raw":
+            return image.tobytes()
+        return image
+
 
 def _int64_feature(value):
     """Wrapper for inserting an int64 Feature into a SequenceExample proto."""
@@ -270,7 +311,7 @@ def _to_sequence_example(image, decoder, vocab):
         encoded_image = f.read()
 
     try:
-        decoder.decode_jpeg(encoded_image)
+        encoded_image = decoder.to_stored_image(encoded_image)
     except (tf.errors.InvalidArgumentError, AssertionError):
         print("Skipping file with invalid JPEG data: %s" % image.filename)
         return
@@ -541,6 +582,8 @@ def main(unused_argv):
         "Please make the FLAGS.num_threads commensurate with FLAGS.train_shards")
     assert _is_valid_num_shards(FLAGS.validate_shards), (
         "Please make the FLAGS.num_threads commensurate with FLAGS.validate_shards")
+    assert FLAGS.stored_image_format in ("jpeg", "raw"), (
+        "--stored_image_format must be jpeg or raw")
     assert _is_valid_num_shards(FLAGS.test1_shards), (
         "Please make the FLAGS.num_threads commensurate with FLAGS.test1_shards")
     assert _is_valid_num_shards(FLAGS.test2_shards), (
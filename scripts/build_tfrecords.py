@@ -84,6 +84,25 @@ tf.flags.DEFINE_integer("test_shards", 8,
 tf.flags.DEFINE_boolean("build_flip_caption", False,
                         "Whether to generate flip caption. If True, only build train set,"
                         "If set False, build train and dev set")
+tf.flags.DEFINE_boolean("image_once", False,
+                        "Whether to store each image once with all its captions, "
+                        "instead of once per caption. The word ids of the captions "
+                        "are concatenated and their lengths stored in the context "
+                        "feature image/caption_lengths. Train on these records with "
+                        "--caption_layout=all or sample.")
+
+tf.flags.DEFINE_integer("stored_image_size", 0,
+                        "If > 0, store the images resized to stored_image_size x "
+                        "stored_image_size, e.g. 346, the size process_image() "
+                        "resizes to before cropping, instead of the original "
+                        "JPEG files.")
+tf.flags.DEFINE_string("stored_image_format", "jpeg",
+                       "Format of the resized images: jpeg, re-encoded with "
+                       "--stored_image_jpeg_quality, or raw uint8 pixels. Train "
+                       "on raw images with --image_format=raw "
+                       "--raw_image_size=<stored_image_size>.")
+tf.flags.DEFINE_integer("stored_image_jpeg_quality", 95,
+                        "JPEG quality of the resized images, 0 to 100.")
 
 FLAGS = tf.flags.FLAGS
 
@@ -185,6 +204,19 @@ class ImageDecoder(object):
         self._encoded_jpeg = tf.placeholder(dtype=tf.string)
         self._decode_jpeg = tf.image.decode_jpeg(self._encoded_jpeg, channels=3)
 
+        # TensorFlow ops resizing images for --stored_image_size, like
+        # process_image() does before cropping.
+        self._stored_image = None
+        if FLAGS.stored_image_size > 0:
+            image = tf.image.convert_image_dtype(self._decode_jpeg, dtype=tf.float32)
+            image = tf.image.resize_images(image,
+                                           size=[FLAGS.stored_image_size, FLAGS.stored_image_size],
+                                           method=tf.image.ResizeMethod.BILINEAR)
+            image = tf.image.convert_image_dtype(image, dtype=tf.uint8)
+            if FLAGS.stored_image_format == "jpeg":
+                image = tf.image.encode_jpeg(image, quality=FLAGS.stored_image_jpeg_quality)
+            self._stored_image = image
+
     def decode_jpeg(self, encoded_jpeg):
         image = self._sess.run(self._decode_jpeg,
                                feed_dict={self._encoded_jpeg: encoded_jpeg})
@@ -192,6 +224,21 @@ class ImageDecoder(object):
         assert image.shape[2] == 3
         return image
 
+    def to_stored_image(self, encoded_jpeg):
+        """Returns the bytes to store for a JPEG image, checking that it decodes.
+
+        These are the original bytes, or with --stored_image_size the resized
+        image as JPEG or raw uint8 pixels.
+        """
+        if self._stored_image is None:
+            self.decode_jpeg(encoded_jpeg)
+            return encoded_jpeg
+        image = self._sess.run(self._stored_image,
+                               feed_dict={self._encoded_jpeg: encoded_jpeg})
+        if FLAGS.stored_image_format == "raw":
+            return image.tobytes()
+        return image
+
 
 def _int64_feature(value):
     """Wrapper for inserting an int64 Feature into a SequenceExample proto."""
@@ -203,6 +250,11 @@ def _bytes_feature(value):
     return tf.train.Feature(bytes_list=tf.train.BytesList(value=[str(value)]))
 
 
+def _int64_list_feature(values):
+    """Wrapper for inserting an int64 list Feature into a SequenceExample proto."""
+    return tf.train.Feature(int64_list=tf.train.Int64List(value=values))
+
+
 def _int64_feature_list(values):
     """Wrapper for inserting an int64 FeatureList into a SequenceExample proto."""
     return tf.train.FeatureList(feature=[_int64_feature(v) for v in values])
@@ -226,17 +278,27 @@ def _to_sequence_example(image, decoder, vocab):
         encoded_image = f.read()
 
     try:
-        decoder.decode_jpeg(encoded_image)
+        encoded_image = decoder.to_stored_image(encoded_image)
     except (tf.errors.InvalidArgumentError, AssertionError):
         print("Skipping file with invalid JPEG data: %s" % image.filename)
         return
-    context = tf.train.Features(feature={
+    context_feature = {
         "image/id": _int64_feature(image.id),
         "image/data": _bytes_feature(encoded_image),
-    })
+    }
+
+    # With image_once, the captions are concatenated.
+    if FLAGS.image_once:
+        context_feature["image/caption_lengths"] = _int64_list_feature(
+            [len(c) for c in image.captions])
+        if FLAGS.build_flip_caption:
+            context_feature["image/flip_caption_lengths"] = _int64_list_feature(
+                [len(c) for c in image.flip_captions])
+    else:
+        assert len(image.captions) == 1
+    context = tf.train.Features(feature=context_feature)
 
-    assert len(image.captions) == 1
-    caption = image.captions[0]
+    caption = [word for c in image.captions for word in c]
     caption_ids = [vocab.word_to_id(word) for word in caption]
     if not FLAGS.build_flip_caption:
         feature_lists = tf.train.FeatureLists(feature_list={
@@ -244,7 +306,7 @@ def _to_sequence_example(image, decoder, vocab):
             "image/caption_ids": _int64_feature_list(caption_ids)
         })
     else:
-        flip_caption = image.flip_captions[0]
+        flip_caption = [word for c in image.flip_captions for word in c]
         flip_caption_ids = [vocab.word_to_id(word) for word in flip_caption]
         feature_lists = tf.train.FeatureLists(feature_list={
             "image/caption": _bytes_feature_list(caption),
@@ -325,8 +387,11 @@ def _process_dataset(name, images, vocab, num_shards):
       vocab: A Vocabulary object.
       num_shards: Integer number of shards for the output files.
     """
-    # Break up each image into a separate entity for each caption.
-    if FLAGS.build_flip_caption:
+    # Break up each image into a separate entity for each caption, unless
+    # each image is stored once with all its captions.
+    if FLAGS.image_once:
+        images = [image for image in images if image.captions]
+    elif FLAGS.build_flip_caption:
         images = [ImageMetadata(image.id, image.filename, [caption], [flip_caption])
                   for image in images for (caption,flip_caption) in zip(image.captions, image.flip_captions)]
     else:
@@ -472,6 +537,8 @@ def main(unused_argv):
         "Please make the FLAGS.num_threads commensurate with FLAGS.train_shards")
     assert _is_valid_num_shards(FLAGS.validate_shards), (
         "Please make the FLAGS.num_threads commensurate with FLAGS.validate_shards")
+    assert FLAGS.stored_image_format in ("jpeg", "raw"), (
+        "--stored_image_format must be jpeg or raw")
     assert _is_valid_num_shards(FLAGS.test_shards), (
         "Please make the FLAGS.num_threads commensurate with FLAGS.test_shards")
 
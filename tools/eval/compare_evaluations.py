@@ -0,0 +1,60 @@
+# encoding: utf-8
+# Copyright 2017 challenger.ai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Compares the scores of two prediction files, e.g. float32 and int8."""
+# python2.7
+# python compare_evaluations.py --baseline=float.json --submit=int8.json --ref=reference_json_file
+
+import sys
+import argparse
+
+reload(sys)
+sys.setdefaultencoding('utf8')
+from run_evaluations import compute_m1
+
+
+def compare_m1(baseline_file, json_predictions_file, reference_file):
+    """Returns the scores of both files and the deltas of the submission."""
+    baseline = compute_m1(baseline_file, reference_file)
+    submit = compute_m1(json_predictions_file, reference_file)
+    delta = {}
+    for metric, score in submit.items():
+        if metric != 'error' and metric in baseline:
+            delta[metric] = score - baseline[metric]
+    return baseline, submit, delta
+
+
+def main():
+    """The comparison."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-baseline", "--baseline", type=str, required=True,
+                        help=' JSON containing the baseline sentences.')
+    parser.add_argument("-submit", "--submit", type=str, required=True,
+                        help=' JSON containing submit sentences.')
+    parser.add_argument("-ref", "--ref", type=str,
+                        help=' JSON references.')
+    args = parser.parse_args()
+
+    baseline, submit, delta = compare_m1(args.baseline, args.submit, args.ref)
+    if baseline['error'] or submit['error']:
+        print 'Eval failed: baseline error %d, submit error %d' % (
+            baseline['error'], submit['error'])
+        sys.exit(1)
+    for metric in sorted(delta):
+        print 'Delta/%s: %.3f -> %.3f (%+.3f)' % (
+            metric, baseline[metric], submit[metric], delta[metric])
+
+
+if __name__ == "__main__":
+    main()